@@ -0,0 +1,43 @@
+"""added audit_log
+
+Revision ID: 0a9d4e7c3b12
+Revises: f2c8a5e1d374
+Create Date: 2026-10-19 15:40:52.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0a9d4e7c3b12'
+down_revision: Union[str, Sequence[str], None] = 'f2c8a5e1d374'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('audit_log',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('occurred_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('record_id', sa.String(), nullable=False),
+    sa.Column('patient_id', sa.UUID(), nullable=True),
+    sa.Column('visit_id', sa.Integer(), nullable=True),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('changes', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('actor', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_audit_log_patient_id'), 'audit_log', ['patient_id'], unique=False)
+    op.create_index(op.f('ix_audit_log_visit_id'), 'audit_log', ['visit_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_audit_log_visit_id'), table_name='audit_log')
+    op.drop_index(op.f('ix_audit_log_patient_id'), table_name='audit_log')
+    op.drop_table('audit_log')
@@ -0,0 +1,56 @@
+"""added jobs queue
+
+Revision ID: 1b7e3f9a5c20
+Revises: 0a9d4e7c3b12
+Create Date: 2026-10-19 16:25:09.533810
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '1b7e3f9a5c20'
+down_revision: Union[str, Sequence[str], None] = '0a9d4e7c3b12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('jobs',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('params', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+    sa.Column('status', sa.String(), server_default='queued', nullable=False),
+    sa.Column('priority', sa.Integer(), server_default='100', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('max_attempts', sa.Integer(), server_default='3', nullable=False),
+    sa.Column('run_after', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('progress', sa.Float(), server_default='0', nullable=False),
+    sa.Column('progress_message', sa.String(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('worker', sa.String(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('result_location', sa.String(), nullable=True),
+    sa.Column('result_filename', sa.String(), nullable=True),
+    sa.Column('result_media_type', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Only queued rows are ever scanned by the claim query, in claim order
+    op.create_index('ix_jobs_claim_order', 'jobs', ['priority', 'run_after', 'id'], unique=False,
+                    postgresql_where=sa.text("status = 'queued'"))
+    op.create_index('ix_jobs_running_heartbeat', 'jobs', ['heartbeat_at'], unique=False,
+                    postgresql_where=sa.text("status = 'running'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_running_heartbeat', table_name='jobs', postgresql_where=sa.text("status = 'running'"))
+    op.drop_index('ix_jobs_claim_order', table_name='jobs', postgresql_where=sa.text("status = 'queued'"))
+    op.drop_table('jobs')
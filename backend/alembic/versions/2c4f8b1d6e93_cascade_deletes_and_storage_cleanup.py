@@ -0,0 +1,75 @@
+"""ON DELETE CASCADE foreign keys and storage_cleanup queue
+
+Revision ID: 2c4f8b1d6e93
+Revises: 1b7e3f9a5c20
+Create Date: 2026-10-19 17:02:44.906127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c4f8b1d6e93'
+down_revision: Union[str, Sequence[str], None] = '1b7e3f9a5c20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (constraint, table, column, referenced table, referenced column). Names are
+# Postgres' defaults, since the initial schema didn't name them.
+FOREIGN_KEYS = [
+    ('patient_siblings_patient_id_fkey', 'patient_siblings', 'patient_id', 'patients', 'id'),
+    ('patient_siblings_sibling_id_fkey', 'patient_siblings', 'sibling_id', 'patients', 'id'),
+    ('visits_patient_id_fkey', 'visits', 'patient_id', 'patients', 'id'),
+    ('visit_attachments_visit_id_fkey', 'visit_attachments', 'visit_id', 'visits', 'visit_id'),
+    ('dispensation_items_visit_id_fkey', 'dispensation_items', 'visit_id', 'visits', 'visit_id'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, table, column, ref_table, ref_column in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, ref_table, [column], [ref_column], ondelete='CASCADE')
+
+    op.create_table('storage_cleanup',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('file_path', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_storage_cleanup_next_attempt_at'), 'storage_cleanup', ['next_attempt_at'], unique=False)
+
+    # Every deleted attachment row (directly, or cascaded from a visit or patient)
+    # queues its file, in the same transaction: one INSERT per statement, not per row
+    op.execute("""
+        CREATE OR REPLACE FUNCTION queue_attachment_cleanup() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO storage_cleanup (file_path) SELECT file_path FROM deleted_attachments;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER visit_attachments_cleanup
+        AFTER DELETE ON visit_attachments
+        REFERENCING OLD TABLE AS deleted_attachments
+        FOR EACH STATEMENT EXECUTE FUNCTION queue_attachment_cleanup()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS visit_attachments_cleanup ON visit_attachments")
+    op.execute("DROP FUNCTION IF EXISTS queue_attachment_cleanup()")
+    op.drop_index(op.f('ix_storage_cleanup_next_attempt_at'), table_name='storage_cleanup')
+    op.drop_table('storage_cleanup')
+
+    for name, table, column, ref_table, ref_column in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, ref_table, [column], [ref_column])
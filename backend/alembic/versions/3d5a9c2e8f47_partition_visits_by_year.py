@@ -0,0 +1,182 @@
+"""Partition visits and dispensation_items by year
+
+Revision ID: 3d5a9c2e8f47
+Revises: 2c4f8b1d6e93
+Create Date: 2026-10-19 18:11:27.340518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d5a9c2e8f47'
+down_revision: Union[str, Sequence[str], None] = '2c4f8b1d6e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VISIT_COLUMNS = (
+    'visit_id, patient_id, date, time, weight, age_at_visit, doctor_notes, follow_up, '
+    'total_charge, payment_method, receipt_number, mc_days, mc_start_date, mc_end_date'
+)
+DISPENSATION_COLUMNS = 'id, visit_id, medicine_name, instructions, quantity, notes, is_dispensed'
+
+# Old table -> (its indexes). Renamed out of the way while the partitioned tables are built.
+OLD_INDEXES = {
+    'visits': ('visits_pkey', 'ix_visits_date', 'ix_visits_patient_id'),
+    'dispensation_items': ('dispensation_items_pkey', 'ix_dispensation_items_visit_id'),
+}
+
+
+def _visit_columns():
+    return [
+        sa.Column('visit_id', sa.Integer(), server_default=sa.text("nextval('visits_visit_id_seq'::regclass)"), nullable=False),
+        sa.Column('patient_id', sa.UUID(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('time', sa.Time(), nullable=False),
+        sa.Column('weight', sa.Float(), nullable=False),
+        sa.Column('age_at_visit', sa.String(), nullable=True),
+        sa.Column('doctor_notes', sa.String(), nullable=True),
+        sa.Column('follow_up', sa.String(), nullable=True),
+        sa.Column('total_charge', sa.Float(), nullable=True),
+        sa.Column('payment_method', sa.String(), nullable=True),
+        sa.Column('receipt_number', sa.String(), nullable=True),
+        sa.Column('mc_days', sa.Integer(), nullable=True),
+        sa.Column('mc_start_date', sa.Date(), nullable=True),
+        sa.Column('mc_end_date', sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(['patient_id'], ['patients.id'], name='visits_patient_id_fkey', ondelete='CASCADE'),
+    ]
+
+
+def _dispensation_columns():
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('dispensation_items_id_seq'::regclass)"), nullable=False),
+        sa.Column('visit_id', sa.Integer(), nullable=False),
+        sa.Column('medicine_name', sa.String(), nullable=False),
+        sa.Column('instructions', sa.String(), nullable=True),
+        sa.Column('quantity', sa.String(), nullable=False),
+        sa.Column('notes', sa.String(), nullable=True),
+        sa.Column('is_dispensed', sa.Boolean(), nullable=True),
+    ]
+
+
+def _move_aside(suffix):
+    """Renames the current tables (and their indexes) to <name>_<suffix>."""
+    op.drop_constraint('dispensation_items_visit_id_fkey', 'dispensation_items', type_='foreignkey')
+    op.drop_constraint('visit_attachments_visit_id_fkey', 'visit_attachments', type_='foreignkey')
+    for table, indexes in OLD_INDEXES.items():
+        op.rename_table(table, f'{table}_{suffix}')
+        for index in indexes:
+            op.execute(f'ALTER INDEX {index} RENAME TO {index}_{suffix}')
+
+
+def _drop_aside(suffix):
+    # The sequences move to the new tables first, or they'd be dropped with the old ones
+    op.execute('ALTER SEQUENCE visits_visit_id_seq OWNED BY visits.visit_id')
+    op.execute('ALTER SEQUENCE dispensation_items_id_seq OWNED BY dispensation_items.id')
+    op.drop_table(f'dispensation_items_{suffix}')
+    op.drop_table(f'visits_{suffix}')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _move_aside('unpartitioned')
+
+    # Postgres requires the partition key in every unique constraint, so the keys
+    # widen to (visit_id, date) / (id, visit_date); the sequences keep the ids unique.
+    op.create_table('visits',
+    *_visit_columns(),
+    sa.PrimaryKeyConstraint('visit_id', 'date', name='visits_pkey'),
+    postgresql_partition_by='RANGE (date)'
+    )
+    op.create_index(op.f('ix_visits_date'), 'visits', ['date'], unique=False)
+    op.create_index(op.f('ix_visits_patient_id'), 'visits', ['patient_id'], unique=False)
+
+    # Dispensations are co-partitioned on a copy of the visit date, kept in step
+    # by ON UPDATE CASCADE when a visit is re-dated
+    op.create_table('dispensation_items',
+    *_dispensation_columns(),
+    sa.Column('visit_date', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['visit_id', 'visit_date'], ['visits.visit_id', 'visits.date'], name='dispensation_items_visit_id_fkey', ondelete='CASCADE', onupdate='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'visit_date', name='dispensation_items_pkey'),
+    postgresql_partition_by='RANGE (visit_date)'
+    )
+    op.create_index(op.f('ix_dispensation_items_visit_id'), 'dispensation_items', ['visit_id'], unique=False)
+
+    # One partition per calendar year for both tables. Called by the app for any
+    # year it's about to write (partitions.py) and ahead of time by the job worker;
+    # the advisory lock stops two callers racing to create the same year.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION create_visit_partitions(target_year integer) RETURNS void AS $$
+        DECLARE
+            range_start date := make_date(target_year, 1, 1);
+            range_end date := make_date(target_year + 1, 1, 1);
+        BEGIN
+            IF to_regclass('visits_' || target_year) IS NOT NULL
+                    AND to_regclass('dispensation_items_' || target_year) IS NOT NULL THEN
+                RETURN;
+            END IF;
+            PERFORM pg_advisory_xact_lock(hashtext('create_visit_partitions'));
+            EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF visits FOR VALUES FROM (%L) TO (%L)',
+                           'visits_' || target_year, range_start, range_end);
+            EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF dispensation_items FOR VALUES FROM (%L) TO (%L)',
+                           'dispensation_items_' || target_year, range_start, range_end);
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        SELECT create_visit_partitions(year)
+        FROM (
+            SELECT DISTINCT extract(year FROM date)::integer AS year FROM visits_unpartitioned
+            UNION
+            SELECT generate_series(extract(year FROM current_date)::integer, extract(year FROM current_date)::integer + 1)
+        ) years
+    """)
+
+    op.execute(f'INSERT INTO visits ({VISIT_COLUMNS}) SELECT {VISIT_COLUMNS} FROM visits_unpartitioned')
+    op.execute(f"""
+        INSERT INTO dispensation_items ({DISPENSATION_COLUMNS}, visit_date)
+        SELECT {', '.join('d.' + c for c in DISPENSATION_COLUMNS.split(', '))}, v.date
+        FROM dispensation_items_unpartitioned d
+        JOIN visits_unpartitioned v ON v.visit_id = d.visit_id
+    """)
+
+    # Attachments aren't partitioned (few rows) but need the date to reference a visit
+    op.add_column('visit_attachments', sa.Column('visit_date', sa.Date(), nullable=True))
+    op.execute("""
+        UPDATE visit_attachments a SET visit_date = v.date
+        FROM visits v WHERE v.visit_id = a.visit_id
+    """)
+    op.alter_column('visit_attachments', 'visit_date', nullable=False)
+    op.create_foreign_key('visit_attachments_visit_id_fkey', 'visit_attachments', 'visits', ['visit_id', 'visit_date'], ['visit_id', 'date'], ondelete='CASCADE', onupdate='CASCADE')
+
+    _drop_aside('unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _move_aside('partitioned')
+
+    op.create_table('visits',
+    *_visit_columns(),
+    sa.PrimaryKeyConstraint('visit_id', name='visits_pkey')
+    )
+    op.create_index(op.f('ix_visits_date'), 'visits', ['date'], unique=False)
+    op.create_index(op.f('ix_visits_patient_id'), 'visits', ['patient_id'], unique=False)
+    op.create_table('dispensation_items',
+    *_dispensation_columns(),
+    sa.ForeignKeyConstraint(['visit_id'], ['visits.visit_id'], name='dispensation_items_visit_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', name='dispensation_items_pkey')
+    )
+    op.create_index(op.f('ix_dispensation_items_visit_id'), 'dispensation_items', ['visit_id'], unique=False)
+
+    op.execute(f'INSERT INTO visits ({VISIT_COLUMNS}) SELECT {VISIT_COLUMNS} FROM visits_partitioned')
+    op.execute(f'INSERT INTO dispensation_items ({DISPENSATION_COLUMNS}) SELECT {DISPENSATION_COLUMNS} FROM dispensation_items_partitioned')
+
+    op.drop_column('visit_attachments', 'visit_date')
+    op.create_foreign_key('visit_attachments_visit_id_fkey', 'visit_attachments', 'visits', ['visit_id'], ['visit_id'], ondelete='CASCADE')
+
+    _drop_aside('partitioned')
+    op.execute('DROP FUNCTION IF EXISTS create_visit_partitions(integer)')
@@ -0,0 +1,30 @@
+"""added row version to Patient
+
+Revision ID: 3f1c9d2e7b4a
+Revises: a84ff7b0f1b5
+Create Date: 2026-10-19 09:12:44.218305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9d2e7b4a'
+down_revision: Union[str, Sequence[str], None] = 'a84ff7b0f1b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('patients', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('patients', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('patients', 'updated_at')
+    op.drop_column('patients', 'version')
@@ -0,0 +1,117 @@
+"""Added change event triggers for the live update stream
+
+Revision ID: 4e6b0d3f9a58
+Revises: 3d5a9c2e8f47
+Create Date: 2026-10-19 19:02:44.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e6b0d3f9a58'
+down_revision: Union[str, Sequence[str], None] = '3d5a9c2e8f47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Trigger name -> (table, entity reported). Triggers on the partitioned tables
+# are inherited by every year's partition, including ones created later.
+TRIGGERS = {
+    'visits_change_event': ('visits', 'visit'),
+    'visit_attachments_change_event': ('visit_attachments', 'attachment'),
+    'dispensation_items_change_event': ('dispensation_items', 'dispensation'),
+    # Links only bump version, which the patient update trigger ignores
+    'patient_siblings_change_event': ('patient_siblings', 'sibling'),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Small JSON payloads on one channel; clients refetch what they need.
+    # Identical payloads within a transaction are delivered once by Postgres,
+    # so replacing a visit's dispensations is a single "visit updated".
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_clinic_event() RETURNS trigger AS $$
+        DECLARE
+            rec record;
+            entity text := TG_ARGV[0];
+            visit_patient_id uuid;
+            payload json;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                rec := OLD;
+            ELSE
+                rec := NEW;
+            END IF;
+
+            IF entity = 'patient' THEN
+                payload := json_build_object('entity', 'patient', 'action', lower(TG_OP), 'patient_id', rec.id);
+            ELSIF entity = 'sibling' THEN
+                -- Links are stored both ways, so each end gets its own "patient updated".
+                -- Patient already gone (cascading delete): its own event covers it
+                IF NOT EXISTS (SELECT 1 FROM patients WHERE id = rec.patient_id) THEN
+                    RETURN NULL;
+                END IF;
+                payload := json_build_object('entity', 'patient', 'action', 'update', 'patient_id', rec.patient_id);
+            ELSIF entity = 'visit' THEN
+                payload := json_build_object(
+                    'entity', 'visit', 'action', lower(TG_OP),
+                    'patient_id', rec.patient_id, 'visit_id', rec.visit_id
+                );
+            ELSE
+                SELECT patient_id INTO visit_patient_id FROM visits WHERE visit_id = rec.visit_id AND date = rec.visit_date;
+                -- Visit already gone (cascading delete): its own event covers it
+                IF visit_patient_id IS NULL THEN
+                    RETURN NULL;
+                END IF;
+                IF entity = 'attachment' THEN
+                    payload := json_build_object(
+                        'entity', 'attachment', 'action', lower(TG_OP),
+                        'patient_id', visit_patient_id, 'visit_id', rec.visit_id, 'attachment_id', rec.id
+                    );
+                ELSE
+                    -- Dispensations are part of their visit
+                    payload := json_build_object(
+                        'entity', 'visit', 'action', 'update', 'patient_id', visit_patient_id, 'visit_id', rec.visit_id
+                    );
+                END IF;
+            END IF;
+
+            PERFORM pg_notify('clinic_events', payload::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER patients_change_event_insert_delete
+        AFTER INSERT OR DELETE ON patients
+        FOR EACH ROW EXECUTE FUNCTION notify_clinic_event('patient');
+    """)
+    # Version bumps from visit writes are already reported as visit events (a bump
+    # sets version, updated_at and change_xid, so all three are left out)
+    op.execute("""
+        CREATE TRIGGER patients_change_event_update
+        AFTER UPDATE ON patients
+        FOR EACH ROW
+        WHEN ((to_jsonb(OLD) - 'version' - 'updated_at' - 'change_xid')
+              IS DISTINCT FROM (to_jsonb(NEW) - 'version' - 'updated_at' - 'change_xid'))
+        EXECUTE FUNCTION notify_clinic_event('patient');
+    """)
+    for name, (table, entity) in TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER {name}
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_clinic_event('{entity}');
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, (table, _) in TRIGGERS.items():
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+    op.execute("DROP TRIGGER IF EXISTS patients_change_event_update ON patients")
+    op.execute("DROP TRIGGER IF EXISTS patients_change_event_insert_delete ON patients")
+    op.execute("DROP FUNCTION IF EXISTS notify_clinic_event()")
@@ -0,0 +1,73 @@
+"""added vaccination schedule and records
+
+Revision ID: 5f7c1e4a2b69
+Revises: 4e6b0d3f9a58
+Create Date: 2026-10-19 19:47:31.602958
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '5f7c1e4a2b69'
+down_revision: Union[str, Sequence[str], None] = '4e6b0d3f9a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Starting point based on the Malaysian National Immunisation Programme; the
+# clinic keeps it current through PUT /api/vaccinations/schedule.
+# (vaccine, dose, due_age_days, overdue_after_days, max_age_days)
+DEFAULT_SCHEDULE = [
+    ('BCG', 1, 0, 30, 1826),
+    ('Hepatitis B', 1, 0, 7, 1826),
+    ('DTaP-IPV-Hib-HepB', 1, 61, 30, 2557),
+    ('DTaP-IPV-Hib-HepB', 2, 91, 30, 2557),
+    ('DTaP-IPV-Hib-HepB', 3, 152, 30, 2557),
+    ('DTaP-IPV-Hib-HepB', 4, 548, 60, 2557),
+    ('Pneumococcal (PCV)', 1, 122, 30, 1826),
+    ('Pneumococcal (PCV)', 2, 183, 30, 1826),
+    ('Pneumococcal (PCV)', 3, 457, 60, 1826),
+    ('MMR', 1, 274, 30, 4383),
+    ('MMR', 2, 365, 60, 4383),
+    ('DT', 1, 2557, 365, 4383),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    schedule = op.create_table('vaccination_schedule',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('vaccine', sa.String(), nullable=False),
+    sa.Column('dose', sa.Integer(), nullable=False),
+    sa.Column('due_age_days', sa.Integer(), nullable=False),
+    sa.Column('overdue_after_days', sa.Integer(), server_default='30', nullable=False),
+    sa.Column('max_age_days', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('vaccine', 'dose', name='uq_vaccination_schedule_dose')
+    )
+    op.create_table('vaccination_records',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('patient_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('vaccine', sa.String(), nullable=False),
+    sa.Column('dose', sa.Integer(), nullable=False),
+    sa.Column('date_given', sa.Date(), nullable=False),
+    sa.Column('batch_number', sa.String(), nullable=True),
+    sa.Column('notes', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['patient_id'], ['patients.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('patient_id', 'vaccine', 'dose', name='uq_vaccination_records_patient_dose')
+    )
+    op.bulk_insert(schedule, [
+        {'vaccine': v, 'dose': d, 'due_age_days': due, 'overdue_after_days': grace, 'max_age_days': cap}
+        for v, d, due, grace, cap in DEFAULT_SCHEDULE
+    ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('vaccination_records')
+    op.drop_table('vaccination_schedule')
@@ -0,0 +1,30 @@
+"""Added (name, id) index on patients for search pagination
+
+Revision ID: 6a8d2f5b3c71
+Revises: 5f7c1e4a2b69
+Create Date: 2026-10-19 21:47:15.604127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a8d2f5b3c71'
+down_revision: Union[str, Sequence[str], None] = '5f7c1e4a2b69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Replaces the name index: anything it served, the wider one serves too
+    op.create_index('ix_patients_name_id', 'patients', ['name', 'id'], unique=False)
+    op.drop_index(op.f('ix_patients_name'), table_name='patients')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_patients_name'), 'patients', ['name'], unique=False)
+    op.drop_index('ix_patients_name_id', table_name='patients')
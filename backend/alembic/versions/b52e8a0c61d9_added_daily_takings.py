@@ -0,0 +1,42 @@
+"""added daily_takings aggregate table
+
+Revision ID: b52e8a0c61d9
+Revises: 3f1c9d2e7b4a
+Create Date: 2026-10-19 10:03:27.640112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b52e8a0c61d9'
+down_revision: Union[str, Sequence[str], None] = '3f1c9d2e7b4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('daily_takings',
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('payment_method', sa.String(), nullable=False),
+    sa.Column('visit_count', sa.Integer(), nullable=False),
+    sa.Column('total_charge', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('date', 'payment_method')
+    )
+
+    # Backfill from existing visits; the app keeps it current from here on
+    op.execute("""
+        INSERT INTO daily_takings (date, payment_method, visit_count, total_charge)
+        SELECT date, COALESCE(payment_method, ''), COUNT(*), COALESCE(SUM(total_charge), 0)
+        FROM visits
+        GROUP BY date, COALESCE(payment_method, '')
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('daily_takings')
@@ -0,0 +1,40 @@
+"""added patient change feed (change_xid + tombstones)
+
+Revision ID: d1a6f3b8e905
+Revises: c7d04e9f2a18
+Create Date: 2026-10-19 13:02:48.115530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1a6f3b8e905'
+down_revision: Union[str, Sequence[str], None] = 'c7d04e9f2a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows get this migration's transaction id, i.e. they all appear in a first sync
+    op.add_column('patients', sa.Column('change_xid', sa.BigInteger(), server_default=sa.text('(pg_current_xact_id()::text::bigint)'), nullable=False))
+    op.create_index(op.f('ix_patients_change_xid'), 'patients', ['change_xid'], unique=False)
+    op.create_table('patient_tombstones',
+    sa.Column('patient_id', sa.UUID(), nullable=False),
+    sa.Column('change_xid', sa.BigInteger(), server_default=sa.text('(pg_current_xact_id()::text::bigint)'), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('patient_id')
+    )
+    op.create_index(op.f('ix_patient_tombstones_change_xid'), 'patient_tombstones', ['change_xid'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_patient_tombstones_change_xid'), table_name='patient_tombstones')
+    op.drop_table('patient_tombstones')
+    op.drop_index(op.f('ix_patients_change_xid'), table_name='patients')
+    op.drop_column('patients', 'change_xid')
@@ -0,0 +1,60 @@
+"""added NOTIFY trigger on patients for the typeahead index
+
+Revision ID: e4b7c2d9a611
+Revises: d1a6f3b8e905
+Create Date: 2026-10-19 14:11:36.702958
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7c2d9a611'
+down_revision: Union[str, Sequence[str], None] = 'd1a6f3b8e905'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Payload is the patient id; listeners re-read the row (or drop it if gone)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_patient_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('patient_changes', OLD.id::text);
+            ELSE
+                PERFORM pg_notify('patient_changes', NEW.id::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER patients_notify_insert_delete
+        AFTER INSERT OR DELETE ON patients
+        FOR EACH ROW EXECUTE FUNCTION notify_patient_change();
+    """)
+    # Version bumps from visit writes don't touch searchable fields: stay quiet
+    op.execute("""
+        CREATE TRIGGER patients_notify_update
+        AFTER UPDATE ON patients
+        FOR EACH ROW
+        WHEN (
+            OLD.name IS DISTINCT FROM NEW.name
+            OR OLD.display_id IS DISTINCT FROM NEW.display_id
+            OR OLD.date_of_birth IS DISTINCT FROM NEW.date_of_birth
+            OR OLD.phone_number_primary IS DISTINCT FROM NEW.phone_number_primary
+            OR OLD.phone_number_secondary IS DISTINCT FROM NEW.phone_number_secondary
+        )
+        EXECUTE FUNCTION notify_patient_change();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS patients_notify_update ON patients")
+    op.execute("DROP TRIGGER IF EXISTS patients_notify_insert_delete ON patients")
+    op.execute("DROP FUNCTION IF EXISTS notify_patient_change()")
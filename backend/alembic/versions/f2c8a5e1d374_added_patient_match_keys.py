@@ -0,0 +1,37 @@
+"""added patient_match_keys for duplicate detection
+
+Revision ID: f2c8a5e1d374
+Revises: e4b7c2d9a611
+Create Date: 2026-10-19 15:02:18.415306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8a5e1d374'
+down_revision: Union[str, Sequence[str], None] = 'e4b7c2d9a611'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filled lazily by duplicates.ensure_keys() on first use
+    op.create_table('patient_match_keys',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('patient_id', sa.UUID(), nullable=False),
+    sa.ForeignKeyConstraint(['patient_id'], ['patients.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('key', 'patient_id')
+    )
+    op.create_index(op.f('ix_patient_match_keys_patient_id'), 'patient_match_keys', ['patient_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_patient_match_keys_patient_id'), table_name='patient_match_keys')
+    op.drop_table('patient_match_keys')
+    op.execute("DELETE FROM system_configs WHERE key = 'match_keys_version'")
@@ -0,0 +1,245 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from datetime import date, datetime, time as time_type, timezone
+from decimal import Decimal
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import event, inspect, insert
+from sqlalchemy.exc import SQLAlchemyError
+
+import models, database
+
+# Who made the change: set per request by the audit middleware in main.py
+current_actor: ContextVar[Optional[str]] = ContextVar("audit_actor", default=None)
+ACTOR_HEADER = "X-Clinic-User"
+
+AUDITED_MODELS = (models.Patient, models.Visit, models.DispensationItem, models.VaccinationRecord)
+
+# Bookkeeping columns that change on every write and would only add noise
+IGNORED_FIELDS = {"version", "updated_at", "change_xid"}
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL_SECONDS = 1.0
+QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+
+PENDING_KEY = "audit_pending"
+
+#####################################################
+# --- Capturing Diffs (session events) ---
+#####################################################
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date, time_type)):
+        return value.isoformat()
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+def _owner_ids(session, values: dict, obj):
+    """(patient_id, visit_id) the entry is filed under, for the history endpoints."""
+    if isinstance(obj, models.Patient):
+        return values.get("id"), None
+    if isinstance(obj, models.Visit):
+        return values.get("patient_id"), values.get("visit_id")
+    if isinstance(obj, models.VaccinationRecord):
+        return values.get("patient_id"), None
+    # Dispensation: take the patient from the parent visit only if it's already loaded
+    visit_key = inspect(models.Visit).identity_key_from_primary_key((values.get("visit_id"),))
+    visit = session.identity_map.get(visit_key)
+    return (visit.patient_id if visit is not None else None), values.get("visit_id")
+
+def _diff(state, action: str) -> dict:
+    # Reads only what's already in memory: an event handler must not trigger lazy loads
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        name = attr.key
+        if name in IGNORED_FIELDS:
+            continue
+        if action == "insert":
+            value = state.dict.get(name)
+            if value is not None:
+                changes[name] = [None, _jsonable(value)]
+        elif action == "delete":
+            value = state.dict.get(name)
+            if value is not None:
+                changes[name] = [_jsonable(value), None]
+        else:
+            history = state.attrs[name].history
+            if not history.has_changes():
+                continue
+            before = history.deleted[0] if history.deleted else None
+            after = history.added[0] if history.added else None
+            if before != after:
+                changes[name] = [_jsonable(before), _jsonable(after)]
+    return changes
+
+def _entry(session, obj, action: str, changes: dict) -> dict:
+    state = inspect(obj)
+    # New rows have no identity key until the flush is finalized, so read the PK directly
+    record_id = state.dict.get(state.mapper.primary_key[0].key)
+    patient_id, visit_id = _owner_ids(session, state.dict, obj)
+    return {
+        "table_name": obj.__tablename__,
+        "record_id": str(record_id),
+        "patient_id": patient_id,
+        "visit_id": visit_id,
+        "action": action,
+        "changes": changes,
+        "actor": current_actor.get(),
+    }
+
+def _after_flush(session, flush_context):
+    # Runs after the SQL is sent (so new rows have IDs) but before history is reset
+    pending = session.info.setdefault(PENDING_KEY, [])
+    for action, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if not isinstance(obj, AUDITED_MODELS):
+                continue
+            if action == "update" and not session.is_modified(obj, include_collections=False):
+                continue
+            changes = _diff(inspect(obj), action)
+            if changes or action != "update":
+                pending.append(_entry(session, obj, action, changes))
+
+def _after_commit(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        occurred_at = datetime.now(timezone.utc)
+        for row in pending:
+            row["occurred_at"] = occurred_at
+        writer.enqueue(pending)
+
+def _after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+def record(session, table_name: str, record_id, action: str, changes: dict, patient_id=None, visit_id=None):
+    """Manual entry for writes made with bulk statements, which session events don't see."""
+    session.info.setdefault(PENDING_KEY, []).append({
+        "table_name": table_name,
+        "record_id": str(record_id),
+        "patient_id": patient_id,
+        "visit_id": visit_id,
+        "action": action,
+        "changes": {k: [_jsonable(v[0]), _jsonable(v[1])] for k, v in changes.items()},
+        "actor": current_actor.get(),
+    })
+
+def snapshot(obj) -> dict:
+    """{field: [value, None]} for a row about to be deleted with a bulk statement."""
+    return _diff(inspect(obj), "delete")
+
+def record_cascade(session, table, rows, patient_id):
+    """
+    Manual delete entries for rows an ON DELETE CASCADE is about to remove,
+    read beforehand as Core rows of `table` (link tables key on both columns).
+    """
+    for row in rows:
+        values = row._mapping
+        record(
+            session, table.name, ":".join(str(values[c.name]) for c in table.primary_key.columns), "delete",
+            {k: [v, None] for k, v in values.items() if v is not None and k not in IGNORED_FIELDS},
+            patient_id=patient_id, visit_id=values.get("visit_id"),
+        )
+
+def install(session_factory=database.SessionLocal):
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
+
+#####################################################
+# --- Batched Background Writer ---
+#####################################################
+
+class AuditWriter:
+    """
+    Per-worker queue drained by one daemon thread that inserts entries in
+    batches, so the request only pays for a queue put. Started on first use
+    (after gunicorn forks) and drained at exit. If the queue is full the
+    caller writes its own entries inline rather than dropping them.
+    """
+
+    def __init__(self):
+        self.queue: "queue.Queue[List[dict]]" = queue.Queue(maxsize=QUEUE_MAX)
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.pid: Optional[int] = None
+        self.written = 0
+        self.failed = 0
+        self.inline_writes = 0
+
+    def enqueue(self, rows: List[dict]):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            self.inline_writes += 1
+            self._write(rows)
+
+    def _ensure_started(self):
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive() or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            deadline = time.monotonic() + FLUSH_INTERVAL_SECONDS
+            # Collect more entries for up to FLUSH_INTERVAL, or until the batch is full
+            while len(batch) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.extend(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, rows: List[dict], attempts: int = 3):
+        for attempt in range(attempts):
+            try:
+                with database.engine.begin() as conn:
+                    conn.execute(insert(models.AuditLog), rows)
+                self.written += len(rows)
+                return
+            except SQLAlchemyError as e:
+                if attempt == attempts - 1:
+                    self.failed += len(rows)
+                    print(f"Error: dropped {len(rows)} audit entries: {e}")
+                else:
+                    time.sleep(0.5 * (attempt + 1))
+
+    def drain(self):
+        """Writes whatever is still queued (at exit)."""
+        rows = []
+        while True:
+            try:
+                rows.extend(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            self._write(rows)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "inline_writes": self.inline_writes,
+        }
+
+
+writer = AuditWriter()
+atexit.register(writer.drain)
+install()
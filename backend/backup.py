@@ -0,0 +1,31 @@
+import os
+import subprocess
+from sqlalchemy.engine import URL
+
+
+class BackupError(Exception):
+    pass
+
+
+def dump_database(url: URL, filepath: str):
+    """pg_dump of the database at `url` into filepath (plain SQL)."""
+    env = os.environ.copy()
+    if url.password:
+        env["PGPASSWORD"] = url.password
+
+    command = [
+        "pg_dump",
+        "-h", url.host,
+        "-p", str(url.port) if url.port else "5432",
+        "-U", url.username,
+        "-d", url.database,
+        "-f", filepath
+    ]
+    try:
+        subprocess.run(command, env=env, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Backup Error: {e}")
+        raise BackupError("Failed to generate backup. Check server logs.")
+    except FileNotFoundError:
+        # This is the specific error for "pg_dump not installed"
+        raise BackupError("pg_dump tool not found on server.")
@@ -0,0 +1,116 @@
+"""
+Micro-benchmark: per-endpoint CPU time of response serialization.
+
+Compares what FastAPI itself does for a route declared with `response_model`
+(fastapi.routing.serialize_response on the route's own response field, then the
+response class renders the result) with serialization.model_response
+(validate -> dump_json in pydantic-core). The FastAPI path is timed with both
+Starlette's JSONResponse and the app's default FastJSONResponse. No database is
+needed: patients are built as transient ORM objects.
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py
+"""
+import os, sys, json, time, uuid
+from datetime import date, time as time_type, timedelta
+from functools import lru_cache
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models, schemas, serialization
+
+VISIT_COUNTS = [10, 100, 500]
+SEARCH_SIZE = 25
+ROUNDS = 50
+
+
+def make_patient(n_visits: int) -> models.Patient:
+    patient = models.Patient(
+        id=uuid.uuid4(), display_id=f"B{n_visits}", date_registered=date(2020, 1, 1),
+        name="Tan Ah Kow", date_of_birth=date(2019, 5, 17), address="12 Jalan Bunga, Ipoh",
+        phone_number_primary="012-3456789", languages_parents=["English", "Malay"],
+        languages_children=["English"], allergies="Penicillin", version=1,
+    )
+    for i in range(n_visits):
+        visit = models.Visit(
+            visit_id=i, patient_id=patient.id, date=date(2020, 1, 1) + timedelta(days=i),
+            time=time_type(9, 30), weight=10.0 + i * 0.01, age_at_visit="1Y 2M",
+            doctor_notes="URTI. Lungs clear. " * 5, total_charge=45.0,
+            payment_method="Cash", receipt_number=f"R{i:06d}",
+        )
+        visit.dispensations = [
+            models.DispensationItem(
+                id=i * 3 + j, visit_id=i, medicine_name=f"Paracetamol {j}", instructions="tds PRN",
+                quantity="60ml", notes=None, is_dispensed=True,
+            )
+            for j in range(3)
+        ]
+        visit.attachments = []
+        patient.visits.append(visit)
+    patient.siblings = []
+    return patient
+
+
+@lru_cache(maxsize=None)
+def response_field(schema):
+    # Built by FastAPI exactly as for `@router.get(..., response_model=schema)`
+    return APIRoute("/bench", lambda: None, response_model=schema).secure_cloned_response_field
+
+
+def run_inline(coroutine):
+    # serialize_response(is_coroutine=True) validates inline and never suspends.
+    # A sync route would also hop to the threadpool for validation, which this
+    # leaves out, so the FastAPI figures are if anything slightly flattering.
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("serialize_response suspended")
+
+
+def fastapi_path(response_class):
+    def render(schema, obj) -> bytes:
+        content = run_inline(serialize_response(field=response_field(schema), response_content=obj, is_coroutine=True))
+        return response_class(content).body
+    return render
+
+
+default_path = fastapi_path(JSONResponse)
+app_default_path = fastapi_path(serialization.FastJSONResponse)
+
+
+def fast_path(schema, obj) -> bytes:
+    return serialization.model_response(schema, obj).body
+
+
+def cpu_ms(fn, schema, obj) -> float:
+    fn(schema, obj)  # warm-up (builds cached adapters)
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        fn(schema, obj)
+    return (time.process_time() - start) / ROUNDS * 1000
+
+
+def main():
+    cases = []
+    for n in VISIT_COUNTS:
+        cases.append((f"GET /api/patients/{{id}} ({n} visits)", schemas.Patient, make_patient(n)))
+    search_results = [make_patient(20) for _ in range(SEARCH_SIZE)]
+    cases.append((f"GET /api/patients/search/ ({SEARCH_SIZE} x 20 visits)", List[schemas.Patient], search_results))
+
+    print(f"{'endpoint':<48}{'JSONResponse ms':>17}{'FastJSON ms':>13}{'fast ms':>10}{'speedup':>9}")
+    for label, schema, obj in cases:
+        expected = json.loads(fast_path(schema, obj))
+        assert json.loads(default_path(schema, obj)) == expected
+        assert json.loads(app_default_path(schema, obj)) == expected
+        old = cpu_ms(default_path, schema, obj)
+        app_old = cpu_ms(app_default_path, schema, obj)
+        new = cpu_ms(fast_path, schema, obj)
+        print(f"{label:<48}{old:>17.2f}{app_old:>13.2f}{new:>10.2f}{min(old, app_old) / new:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Import/startup-time budget for the API.
+
+Each run happens in a fresh interpreter (like a new gunicorn worker), timing:
+  - import of main (framework + our modules, builds the app via create_app)
+  - a second create_app() call (the app factory on its own)
+and checks that heavy optional modules stay unloaded until they're used.
+Exits non-zero when a budget is exceeded, so it can gate CI.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py
+"""
+import os, sys, json, statistics, subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNS = 7
+IMPORT_BUDGET_MS = 1500       # dominated by fastapi/sqlalchemy/pydantic themselves
+CREATE_APP_BUDGET_MS = 25
+LAZY_MODULES = ["reportlab", "numpy", "google.cloud.storage", "pdf_reports", "growth"]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def run_once() -> dict:
+    env = dict(os.environ, FRONTEND_DIST_PATH=os.environ.get("FRONTEND_DIST_PATH", "../frontend/dist"))
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    results = [run_once() for _ in range(RUNS)]
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    create_ms = statistics.median(r["create_app_ms"] for r in results)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+
+    print(f"import main (median of {RUNS}): {import_ms:8.1f} ms  (budget {IMPORT_BUDGET_MS} ms)")
+    print(f"create_app()  (median of {RUNS}): {create_ms:8.1f} ms  (budget {CREATE_APP_BUDGET_MS} ms)")
+    print(f"heavy modules loaded at startup: {', '.join(loaded) or 'none'}")
+
+    failed = import_ms > IMPORT_BUDGET_MS or create_ms > CREATE_APP_BUDGET_MS or loaded
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
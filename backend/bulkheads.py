@@ -0,0 +1,184 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from starlette.responses import JSONResponse
+
+# Which traffic class a request belongs to: first matching (method, path prefix) wins.
+# None means "not limited" (static files, the metrics endpoint itself, which
+# must answer even while the admin class is saturated, and the live update
+# stream, which stays open for minutes without using a thread or connection).
+ROUTES = (
+    ("GET", "/api/system/bulkheads", None),
+    ("GET", "/api/sync/events", None),
+    # A dump streams for minutes: kept apart so it never holds the admin slot
+    ("GET", "/api/system/backup", "backup"),
+    (None, "/api/system/", "admin"),
+    (None, "/api/admin/", "admin"),
+    (None, "/api/reports/", "reporting"),
+    ("GET", "/api/patients/duplicates", "reporting"),
+    (None, "/api/", "interactive"),
+)
+
+# Recent waits kept per class for the percentiles in stats()
+WAIT_SAMPLES = 1000
+MAX_RETRY_AFTER_SECONDS = 60
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    for route_method, prefix, traffic_class in ROUTES:
+        if (route_method is None or route_method == method) and path.startswith(prefix):
+            return traffic_class
+    return None
+
+
+class Bulkhead:
+    """
+    Admission control for one traffic class: at most `limit` requests run at
+    once, at most `queue` more wait, and none waits longer than `max_wait`.
+    Over capacity is answered straight away (429 when the queue is full, 503
+    when the wait runs out) instead of piling up behind slow work.
+    """
+
+    def __init__(self, name: str, limit: int, queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.served = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.waits_ms = deque(maxlen=WAIT_SAMPLES)
+        self.avg_service_seconds = 1.0 # moving average, for Retry-After
+
+    def retry_after(self) -> int:
+        """Rough time until a slot frees up for a new arrival."""
+        estimate = self.avg_service_seconds * (self.waiting + 1) / self.limit
+        return min(MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(estimate)))
+
+    async def acquire(self) -> Optional[int]:
+        """None once admitted, else the HTTP status to reject with."""
+        if not self.semaphore.locked():
+            # Free slot: taken synchronously, no wait
+            await self.semaphore.acquire()
+            self.waits_ms.append(0.0)
+        elif self.waiting >= self.queue:
+            self.rejected_full += 1
+            return 429
+        else:
+            self.waiting += 1
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                return 503
+            finally:
+                self.waiting -= 1
+                self.waits_ms.append((time.monotonic() - started) * 1000)
+
+        self.active += 1
+        return None
+
+    def release(self, service_seconds: float):
+        self.active -= 1
+        self.served += 1
+        self.avg_service_seconds = 0.9 * self.avg_service_seconds + 0.1 * service_seconds
+        self.semaphore.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits_ms)
+
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 1) if waits else 0.0
+
+        return {
+            "limit": self.limit,
+            "queue_limit": self.queue,
+            "max_wait_seconds": self.max_wait,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "served": self.served,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_ms_p50": percentile(0.50),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+            "avg_service_ms": round(self.avg_service_seconds * 1000, 1),
+        }
+
+
+def _limit(name: str, default: int) -> int:
+    return int(os.getenv(f"BULKHEAD_{name.upper()}_LIMIT", str(default)))
+
+# Reporting (PDF/CSV exports, finance, duplicate scan), admin (PIN, config, stats)
+# and backup get a few slots each; the front desk keeps the rest of the threadpool.
+# A second backup while one is streaming is turned away rather than queued.
+BULKHEADS = {
+    "interactive": Bulkhead("interactive", _limit("interactive", 32), queue=64, max_wait=10),
+    "reporting": Bulkhead("reporting", _limit("reporting", 2), queue=4, max_wait=30),
+    "admin": Bulkhead("admin", _limit("admin", 1), queue=1, max_wait=5),
+    "backup": Bulkhead("backup", _limit("backup", 1), queue=0, max_wait=0),
+}
+
+# Worker threads left over for anything unclassified
+THREADPOOL_HEADROOM = 8
+
+
+def size_threadpool():
+    """
+    Startup hook. Sync routes all run on AnyIO's shared worker threads; each
+    class can only occupy as many as its limit, and the pool is sized to the
+    sum, so a class never runs short because another one is busy.
+    """
+    import anyio.to_thread
+    total = sum(b.limit for b in BULKHEADS.values()) + THREADPOOL_HEADROOM
+    anyio.to_thread.current_default_thread_limiter().total_tokens = total
+
+
+class BulkheadMiddleware:
+    """
+    Plain ASGI middleware (not call_next-style) so the slot is held until a
+    streamed export has finished sending, not just until the route returns.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        traffic_class = classify(scope["method"], scope["path"])
+        if traffic_class is None:
+            return await self.app(scope, receive, send)
+
+        # get_db / get_read_db read this to pick the class's connection pool
+        scope.setdefault("state", {})["traffic_class"] = traffic_class
+        bulkhead = BULKHEADS[traffic_class]
+
+        status = await bulkhead.acquire()
+        if status is not None:
+            detail = "Too many requests" if status == 429 else "Server busy"
+            response = JSONResponse(
+                {"detail": f"{detail} ({traffic_class}), please retry shortly"},
+                status_code=status,
+                headers={"Retry-After": str(bulkhead.retry_after())},
+            )
+            return await response(scope, receive, send)
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release(time.monotonic() - started)
+
+
+def stats() -> dict:
+    return {name: b.stats() for name, b in BULKHEADS.items()}
@@ -0,0 +1,3 @@
+#!/bin/sh
+# Used by docker-compose.replica.yaml: lets the local replica stream from the primary.
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
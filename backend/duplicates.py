@@ -0,0 +1,312 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from itertools import combinations
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import models
+
+# Bump when keys_for() changes: stored keys are rebuilt on next use
+KEYS_VERSION = "1"
+KEYS_VERSION_CONFIG = "match_keys_version"
+
+# Scores (0..1) at or above these are reported
+POSSIBLE_MATCH = 0.6
+LIKELY_MATCH = 0.8
+
+# A key shared by more patients than this carries no signal (e.g. a clinic phone)
+MAX_BLOCK_SIZE = 50
+
+# Name particles that shouldn't count as tokens ("Ahmad bin Ali" ~ "Ahmad Ali")
+NAME_PARTICLES = {"bin", "binti", "bte", "bt", "b", "al", "ap", "a", "l", "p", "s", "d", "anak", "ak"}
+
+PHONE_SUFFIX_DIGITS = 8
+
+#####################################################
+# --- Normalisation ---
+#####################################################
+
+def normalize_name(name: Optional[str]) -> List[str]:
+    """Lowercase ASCII tokens without punctuation or particles."""
+    if not name:
+        return []
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().lower()
+    return [t for t in re.split(r"[^a-z0-9]+", ascii_name) if t and t not in NAME_PARTICLES]
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Last 8 digits, so "+60 12-345 6789" and "012-3456789" agree."""
+    digits = re.sub(r"\D", "", phone or "")
+    return digits[-PHONE_SUFFIX_DIGITS:] if len(digits) >= 7 else None
+
+def soundex(token: str) -> str:
+    codes = {
+        **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"),
+        **dict.fromkeys("dt", "3"), "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+    }
+    if not token:
+        return ""
+    result, previous = token[0].upper(), codes.get(token[0], "")
+    for char in token[1:]:
+        code = codes.get(char, "")
+        if code and code != previous:
+            result += code
+        if char not in "hw":
+            previous = code
+    return (result + "000")[:4]
+
+#####################################################
+# --- Blocking Keys ---
+#####################################################
+
+def keys_for(patient) -> Set[str]:
+    """
+    Blocking keys: two records are only compared if they share one.
+    Cheap and generous; the scoring step decides what's really a match.
+    """
+    tokens = normalize_name(patient.name)
+    codes = sorted({soundex(t) for t in tokens if not t.isdigit()})
+    keys = set()
+
+    # Same birthday + one sounds-alike name token (catches spelling variants)
+    if patient.date_of_birth:
+        keys.update(f"dob:{patient.date_of_birth}:{code}" for code in codes)
+    # Whole name sounds alike regardless of token order (catches DOB typos)
+    if codes:
+        keys.add("name:" + "".join(codes))
+    # Shared phone number
+    for phone in (patient.phone_number_primary, patient.phone_number_secondary):
+        normalized = normalize_phone(phone)
+        if normalized:
+            keys.add(f"phone:{normalized}")
+    return keys
+
+def store_keys(db: Session, patient):
+    """Replaces one patient's keys. Call on create/update, in the same transaction."""
+    db.execute(delete(models.PatientMatchKey).where(models.PatientMatchKey.patient_id == patient.id))
+    keys = keys_for(patient)
+    if keys:
+        db.execute(insert(models.PatientMatchKey), [{"patient_id": patient.id, "key": k} for k in keys])
+
+def keys_current(db: Session) -> bool:
+    value = db.execute(
+        select(models.SystemConfig.value).where(models.SystemConfig.key == KEYS_VERSION_CONFIG)
+    ).scalar()
+    return value == KEYS_VERSION
+
+def ensure_keys(db: Session) -> bool:
+    """
+    (Re)builds all keys once after deploy or when KEYS_VERSION changes, in the
+    caller's transaction (the caller commits). True if it rebuilt them.
+    """
+    config = db.query(models.SystemConfig).filter(models.SystemConfig.key == KEYS_VERSION_CONFIG).first()
+    if config and config.value == KEYS_VERSION:
+        return False
+
+    patients = db.execute(select(*MATCH_COLUMNS)).all()
+    db.execute(delete(models.PatientMatchKey))
+    rows = [{"patient_id": p.id, "key": k} for p in patients for k in keys_for(p)]
+    if rows:
+        db.execute(insert(models.PatientMatchKey), rows)
+
+    if config:
+        config.value = KEYS_VERSION
+    else:
+        db.add(models.SystemConfig(key=KEYS_VERSION_CONFIG, value=KEYS_VERSION))
+    db.flush()
+    return True
+
+#####################################################
+# --- Scoring ---
+#####################################################
+
+MATCH_COLUMNS = (
+    models.Patient.id, models.Patient.display_id, models.Patient.name, models.Patient.date_of_birth,
+    models.Patient.phone_number_primary, models.Patient.phone_number_secondary,
+    models.Patient.father_name, models.Patient.mother_name,
+)
+
+def _name_similarity(a: Optional[str], b: Optional[str]) -> float:
+    ta, tb = normalize_name(a), normalize_name(b)
+    if not ta or not tb:
+        return 0.0
+    # Token order varies ("Tan Ah Kow" / "Ah Kow Tan"): compare sorted tokens too
+    return max(
+        SequenceMatcher(None, " ".join(ta), " ".join(tb)).ratio(),
+        SequenceMatcher(None, " ".join(sorted(ta)), " ".join(sorted(tb))).ratio(),
+    )
+
+def _dob_similarity(a, b) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    # Day/month swapped, or one field mistyped
+    if (a.year == b.year and a.month == b.day and a.day == b.month) or \
+            sum((a.year == b.year, a.month == b.month, a.day == b.day)) == 2:
+        return 0.5
+    return 0.0
+
+def score(a, b) -> dict:
+    """Weighted similarity of two patient records (rows with MATCH_COLUMNS)."""
+    name = _name_similarity(a.name, b.name)
+    dob = _dob_similarity(a.date_of_birth, b.date_of_birth)
+    phones_a = {normalize_phone(p) for p in (a.phone_number_primary, a.phone_number_secondary)} - {None}
+    phones_b = {normalize_phone(p) for p in (b.phone_number_primary, b.phone_number_secondary)} - {None}
+    phone = 1.0 if phones_a & phones_b else 0.0
+    parents = [
+        _name_similarity(x, y)
+        for x, y in ((a.mother_name, b.mother_name), (a.father_name, b.father_name))
+        if x and y
+    ]
+    parent = max(parents) if parents else 0.0
+
+    total = 0.45 * name + 0.25 * dob + 0.15 * phone + 0.15 * parent
+    reasons = [label for label, value in (
+        ("similar name", name >= 0.85), ("same date of birth", dob == 1.0),
+        ("near date of birth", dob == 0.5), ("shared phone", phone == 1.0),
+        ("similar parent name", parent >= 0.85),
+    ) if value]
+    return {"score": round(total, 3), "reasons": reasons}
+
+def _candidate_summary(row, result: dict) -> dict:
+    return {
+        "id": row.id,
+        "display_id": row.display_id,
+        "name": row.name,
+        "date_of_birth": row.date_of_birth,
+        "score": result["score"],
+        "likely": result["score"] >= LIKELY_MATCH,
+        "reasons": result["reasons"],
+    }
+
+#####################################################
+# --- Registration Check & Batch Scan ---
+#####################################################
+
+def find_candidates(db: Session, patient, exclude_ids: Iterable = (), min_score: float = POSSIBLE_MATCH) -> List[dict]:
+    """
+    Existing patients that look like `patient` (any object with MATCH_COLUMNS
+    attributes). Pass known siblings in exclude_ids: twins score high otherwise.
+    Their whole sibling network is excluded too.
+    """
+    keys = keys_for(patient)
+    if not keys:
+        return []
+
+    candidate_ids = select(models.PatientMatchKey.patient_id).where(models.PatientMatchKey.key.in_(keys))
+    query = select(*MATCH_COLUMNS).where(models.Patient.id.in_(candidate_ids))
+    exclude_ids = [pid for pid in exclude_ids if pid is not None]
+    if exclude_ids:
+        network_ids = select(models.patient_siblings.c.sibling_id).where(
+            models.patient_siblings.c.patient_id.in_(exclude_ids)
+        )
+        query = query.where(models.Patient.id.not_in(exclude_ids), models.Patient.id.not_in(network_ids))
+
+    matches = []
+    for row in db.execute(query).all():
+        result = score(patient, row)
+        if result["score"] >= min_score:
+            matches.append(_candidate_summary(row, result))
+    return sorted(matches, key=lambda m: -m["score"])
+
+def _key_rows(db: Session):
+    """(key, patient_id) for the whole registry, without writing anything."""
+    if keys_current(db):
+        return db.execute(select(models.PatientMatchKey.key, models.PatientMatchKey.patient_id)).all()
+    # Stored keys predate KEYS_VERSION (first scan after a deploy): block on keys
+    # computed here; the next registration or batch run rebuilds the stored ones
+    return [(key, p.id) for p in db.execute(select(*MATCH_COLUMNS)).all() for key in keys_for(p)]
+
+def scan_registry(db: Session, min_score: float = POSSIBLE_MATCH) -> List[dict]:
+    """
+    All likely duplicate pairs: compare only within each key block. Read-only;
+    pairs already linked as siblings are left out (twins score high otherwise).
+    """
+    blocks = {}
+    for key, patient_id in _key_rows(db):
+        blocks.setdefault(key, []).append(patient_id)
+
+    pairs: Set[tuple] = set()
+    for members in blocks.values():
+        if 1 < len(members) <= MAX_BLOCK_SIZE:
+            pairs.update(tuple(sorted(pair, key=str)) for pair in combinations(members, 2))
+    if not pairs:
+        return []
+
+    involved = {pid for pair in pairs for pid in pair}
+    # Links are stored both ways, so one side's rows cover every linked pair
+    siblings = set(db.execute(
+        select(models.patient_siblings.c.patient_id, models.patient_siblings.c.sibling_id)
+        .where(models.patient_siblings.c.patient_id.in_(involved))
+    ).tuples())
+    pairs = {pair for pair in pairs if pair not in siblings}
+    if not pairs:
+        return []
+
+    involved = {pid for pair in pairs for pid in pair}
+    patients = {
+        row.id: row
+        for row in db.execute(select(*MATCH_COLUMNS).where(models.Patient.id.in_(involved))).all()
+    }
+
+    results = []
+    for a_id, b_id in pairs:
+        a, b = patients.get(a_id), patients.get(b_id)
+        if a is None or b is None:
+            continue
+        result = score(a, b)
+        if result["score"] >= min_score:
+            results.append({
+                "patient": _candidate_summary(a, result),
+                "duplicate": _candidate_summary(b, result),
+                "score": result["score"],
+                "reasons": result["reasons"],
+            })
+    return sorted(results, key=lambda r: -r["score"])
+
+#####################################################
+# --- Merge ---
+#####################################################
+
+# Filled from the duplicate only where the kept record has nothing
+MERGEABLE_FIELDS = (
+    "phone_number_secondary", "father_name", "father_occupation", "mother_name", "mother_occupation",
+    "para", "hospital", "delivery", "birth_weight_kg", "birth_length_cm", "birth_ofc_cm", "g6pd",
+    "tsh_mlul", "feeding", "allergies", "vaccination_summary", "other_notes", "sex",
+)
+
+def merge_fields(keep, duplicate) -> List[str]:
+    filled = []
+    for field in MERGEABLE_FIELDS:
+        if getattr(keep, field) in (None, "") and getattr(duplicate, field) not in (None, ""):
+            setattr(keep, field, getattr(duplicate, field))
+            filled.append(field)
+    return filled
+
+def sibling_ids_of(db: Session, patient_ids: Iterable) -> Set:
+    rows = db.execute(
+        select(models.patient_siblings.c.sibling_id)
+        .where(models.patient_siblings.c.patient_id.in_(list(patient_ids)))
+    ).scalars()
+    return set(rows)
+
+
+if __name__ == "__main__":
+    # Batch job: python duplicates.py [min_score]
+    import sys
+    import database
+
+    db = database.SessionLocal()
+    try:
+        ensure_keys(db)
+        db.commit()
+        threshold = float(sys.argv[1]) if len(sys.argv) > 1 else POSSIBLE_MATCH
+        for pair in scan_registry(db, threshold):
+            a, b = pair["patient"], pair["duplicate"]
+            print(f"{pair['score']:.2f}  {a['display_id']} {a['name']}  <->  {b['display_id']} {b['name']}  "
+                  f"({', '.join(pair['reasons'])})")
+    finally:
+        db.close()
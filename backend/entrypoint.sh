@@ -3,9 +3,11 @@
 # Stop on error
 set -e
 
-# Run migrations
-echo "Applying database migrations..."
-alembic upgrade head
+# Run migrations (skipped by the job worker container; the app container owns them)
+if [ "${RUN_MIGRATIONS:-1}" = "1" ]; then
+    echo "Applying database migrations..."
+    alembic upgrade head
+fi
 
 # Start the application (exec passes control to Gunicorn so it handles signals correctly)
 exec "$@"
\ No newline at end of file
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import time
+from typing import Optional, Set
+
+import database
+
+# Postgres channel fed by the change event triggers on patients, visits,
+# attachments and dispensations (see the change event migration)
+NOTIFY_CHANNEL = "clinic_events"
+
+# Open streams per worker; past this new ones get a 503 and the browser retries
+MAX_CLIENTS = int(os.getenv("EVENTS_MAX_CLIENTS", "500"))
+# Events buffered per client. A client that falls this far behind is sent
+# "resync" instead (refetch what's on screen) and its backlog is dropped.
+QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+
+# Streams are closed after this long and the browser reconnects (within
+# RETRY_MS), so a restarting worker isn't held up by open streams forever
+MAX_STREAM_SECONDS = int(os.getenv("EVENTS_MAX_STREAM_SECONDS", "600"))
+
+# Patients one stream may filter on (?patient_id=...&patient_id=...)
+MAX_PATIENT_FILTER = 50
+
+HEARTBEAT_SECONDS = 15
+RECONNECT_DELAY_SECONDS = 5
+RETRY_MS = 3000
+
+# Pre-encoded frames, shared by every client
+RETRY_FRAME = f"retry: {RETRY_MS}\n\n".encode()
+KEEPALIVE_FRAME = b": keepalive\n\n"
+RESYNC_FRAME = b"event: resync\ndata: {}\n\n"
+CLOSE = None  # queue sentinel: the worker is shutting down
+
+
+class TooManyClients(Exception):
+    pass
+
+
+class Subscriber:
+    __slots__ = ("queue", "patient_ids", "overflowed", "expires_at")
+
+    def __init__(self, patient_ids: Optional[Set[str]]):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.patient_ids = patient_ids  # None: every patient
+        self.overflowed = False
+        self.expires_at = time.monotonic() + MAX_STREAM_SECONDS
+
+    def offer(self, frame: bytes) -> bool:
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return False
+
+    def close(self):
+        # Must get through even to a client that has fallen behind
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(CLOSE)
+
+
+class EventHub:
+    """
+    Per-worker fan-out for the live update stream. One LISTEN connection per
+    worker, watched by the event loop (no thread, no polling); each NOTIFY is
+    encoded once and put on the queue of every open stream that wants it.
+    Streams are plain coroutines, so a worker holds many without a thread each.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.conn = None
+        self.connect_task: Optional[asyncio.Task] = None
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.was_connected = False
+        self.counters = {"received": 0, "delivered": 0, "resyncs": 0, "reconnects": 0, "rejected": 0}
+
+    # --- Clients ---
+
+    def subscribe(self, patient_ids: Optional[Set[str]] = None) -> Subscriber:
+        if len(self.subscribers) >= MAX_CLIENTS:
+            self.counters["rejected"] += 1
+            raise TooManyClients()
+        self.loop = asyncio.get_running_loop()
+        subscriber = Subscriber(patient_ids)
+        self.subscribers.add(subscriber)
+        # The LISTEN connection is only opened once somebody is listening
+        self._ensure_connected()
+        if self.heartbeat_task is None or self.heartbeat_task.done():
+            self.heartbeat_task = self.loop.create_task(self._heartbeat())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def stream(self, subscriber: Subscriber):
+        """Body of one text/event-stream response."""
+        try:
+            yield RETRY_FRAME
+            while True:
+                frame = await subscriber.queue.get()
+                if frame is CLOSE:
+                    return
+                if subscriber.overflowed:
+                    # Everything queued is stale next to a full refetch
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.overflowed = False
+                    self.counters["resyncs"] += 1
+                    frame = RESYNC_FRAME
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _broadcast(self, frame: bytes):
+        for subscriber in self.subscribers:
+            subscriber.offer(frame)
+
+    async def _heartbeat(self):
+        # One timer for all clients: keeps proxies from closing idle streams,
+        # and ends streams that have reached MAX_STREAM_SECONDS
+        while self.subscribers:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            now = time.monotonic()
+            for subscriber in list(self.subscribers):
+                if subscriber.expires_at <= now:
+                    subscriber.close()
+                else:
+                    subscriber.offer(KEEPALIVE_FRAME)
+
+    def close(self):
+        """Shutdown hook: ends every open stream so the server can stop."""
+        for subscriber in self.subscribers:
+            subscriber.close()
+        self._disconnect()
+
+    # --- LISTEN connection ---
+
+    def _ensure_connected(self):
+        if self.conn is None and (self.connect_task is None or self.connect_task.done()):
+            self.connect_task = self.loop.create_task(self._connect())
+
+    @staticmethod
+    def _open():
+        conn = database.listen_connection()
+        conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return conn
+
+    async def _connect(self):
+        while self.subscribers:
+            try:
+                conn = await asyncio.to_thread(self._open)
+            except Exception as e:
+                print(f"Warning: event stream listener could not connect, retrying in {RECONNECT_DELAY_SECONDS}s: {e}")
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+                continue
+
+            self.conn = conn
+            self.loop.add_reader(conn.fileno(), self._on_readable)
+            if self.was_connected:
+                # Anything sent while disconnected is lost: clients refetch
+                self.counters["reconnects"] += 1
+                self.counters["resyncs"] += len(self.subscribers)
+                self._broadcast(RESYNC_FRAME)
+            self.was_connected = True
+            return
+
+    def _disconnect(self):
+        if self.conn is None:
+            return
+        try:
+            self.loop.remove_reader(self.conn.fileno())
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.conn = None
+
+    def _on_readable(self):
+        try:
+            self.conn.poll()
+        except Exception as e:
+            print(f"Warning: event stream listener lost its connection: {e}")
+            self._disconnect()
+            self._ensure_connected()
+            return
+
+        while self.conn.notifies:
+            self._dispatch(self.conn.notifies.pop(0).payload)
+
+    def _dispatch(self, payload: str):
+        self.counters["received"] += 1
+        try:
+            patient_id = json.loads(payload).get("patient_id")
+        except ValueError:
+            return
+        # The trigger's JSON is sent as is (single line, so a single data: field)
+        frame = f"data: {payload}\n\n".encode()
+        for subscriber in self.subscribers:
+            if (subscriber.patient_ids is None or patient_id in subscriber.patient_ids) and subscriber.offer(frame):
+                self.counters["delivered"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "listening": self.conn is not None,
+            "clients": len(self.subscribers),
+            "max_clients": MAX_CLIENTS,
+            "queue_size": QUEUE_SIZE,
+            "max_backlog": max((s.queue.qsize() for s in self.subscribers), default=0),
+            **self.counters,
+        }
+
+
+hub = EventHub()
@@ -0,0 +1,139 @@
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple, Optional, Tuple, Union
+from uuid import UUID
+
+from fastapi import HTTPException, Query
+from pydantic import ConfigDict, create_model
+from sqlalchemy.orm import load_only, selectinload
+
+import models, schemas
+
+# Sparse fieldsets for the patient endpoints:
+#   ?fields=name,display_id,date_of_birth   patient columns to return (id is always included)
+#   ?expand=visits,siblings                 related records to include
+# Without either parameter the endpoints return the full schemas.Patient tree as before.
+
+PATIENT_FIELDS = tuple(schemas.PatientBase.model_fields)
+EXPANSIONS = ("visits", "attachments", "dispensations", "siblings")
+# A visit's children can only be shown inside their visit
+IMPLIES = {"attachments": "visits", "dispensations": "visits"}
+
+# Distinct shapes whose response models are kept compiled
+SCHEMA_CACHE_SIZE = 128
+
+
+class Fieldset(NamedTuple):
+    fields: Tuple[str, ...]  # patient columns, in schema order
+    expand: FrozenSet[str]
+
+    def key(self) -> str:
+        """Stable text form, for ETags."""
+        return f"{'.'.join(self.fields)}~{'.'.join(sorted(self.expand))}"
+
+
+def _split(value: str) -> List[str]:
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+def parse(fields: Optional[str], expand: Optional[str]) -> Optional[Fieldset]:
+    """None means "no shaping requested" (full tree)."""
+    if fields is None and expand is None:
+        return None
+
+    requested_fields = set(_split(fields)) if fields is not None else set(PATIENT_FIELDS)
+    requested_expand = set(_split(expand)) if expand is not None else set()
+
+    unknown = sorted(requested_fields - set(PATIENT_FIELDS) - {"id"}) + sorted(requested_expand - set(EXPANSIONS))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field or expansion: {', '.join(unknown)}. "
+                   f"Fields: {', '.join(PATIENT_FIELDS)}. Expansions: {', '.join(EXPANSIONS)}"
+        )
+
+    requested_expand.update(IMPLIES[e] for e in list(requested_expand) if e in IMPLIES)
+    return Fieldset(
+        fields=tuple(f for f in PATIENT_FIELDS if f in requested_fields),
+        expand=frozenset(requested_expand),
+    )
+
+def fieldset_params(
+    fields: Optional[str] = Query(None, description="Comma-separated patient fields (id is always returned)"),
+    expand: Optional[str] = Query(None, description="Comma-separated: visits, attachments, dispensations, siblings"),
+) -> Optional[Fieldset]:
+    """Route dependency."""
+    return parse(fields, expand)
+
+#####################################################
+# --- Shaping the SQL ---
+#####################################################
+
+def query_options(fieldset: Fieldset) -> list:
+    """Loader options: only the requested columns, and one SELECT ... IN per expansion."""
+    columns = [getattr(models.Patient, f) for f in fieldset.fields]
+    # version is needed for the ETag even when not returned
+    options = [load_only(models.Patient.id, models.Patient.version, *columns)]
+
+    if "visits" in fieldset.expand:
+        children = [
+            selectinload(relationship)
+            for name, relationship in (("attachments", models.Visit.attachments), ("dispensations", models.Visit.dispensations))
+            if name in fieldset.expand
+        ]
+        options.append(selectinload(models.Patient.visits).options(*children))
+
+    if "siblings" in fieldset.expand:
+        options.append(
+            selectinload(models.Patient.siblings).load_only(
+                models.Patient.id, models.Patient.name, models.Patient.display_id, models.Patient.date_of_birth
+            )
+        )
+    return options
+
+# The default response (schemas.Patient), loaded the same way: a fixed number
+# of queries however many visits the patient has
+FULL_TREE = Fieldset(fields=PATIENT_FIELDS, expand=frozenset(EXPANSIONS))
+
+#####################################################
+# --- Shaping the Response ---
+#####################################################
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def response_schema(fieldset: Fieldset):
+    """Pydantic model with just the requested fields (built once per shape)."""
+    visit_fields = {"visit_id": (int, ...)}
+    if "attachments" in fieldset.expand:
+        visit_fields["attachments"] = (List[schemas.VisitAttachmentBase], [])
+    if "dispensations" in fieldset.expand:
+        visit_fields["dispensations"] = (List[schemas.DispensationItem], [])
+    visit_model = create_model(
+        "VisitFields", __base__=schemas.VisitBase, __module__=__name__, **visit_fields
+    )
+
+    patient_fields = {"id": (UUID, ...)}
+    for name in fieldset.fields:
+        field = schemas.PatientBase.model_fields[name]
+        patient_fields[name] = (field.annotation, field)
+    if "visits" in fieldset.expand:
+        patient_fields["visits"] = (List[visit_model], [])
+    if "siblings" in fieldset.expand:
+        patient_fields["siblings"] = (List[schemas.PatientSummary], [])
+
+    return create_model(
+        "PatientFields", __config__=ConfigDict(from_attributes=True), __module__=__name__, **patient_fields
+    )
+
+# What the routes declare (OpenAPI only: responses are built with the per-shape
+# models above). With ?fields/?expand a patient has its id plus whichever fields
+# and expansions were asked for; none of the others is present.
+SparsePatient = create_model(
+    "SparsePatient",
+    __module__=__name__,
+    __doc__="A patient shaped by ?fields= and ?expand=: id always, any other field only if requested.",
+    id=(UUID, ...),
+    **{name: (field.annotation, None) for name, field in schemas.PatientBase.model_fields.items()},
+    visits=(List[schemas.Visit], None),
+    siblings=(List[schemas.PatientSummary], None),
+)
+
+# The full tree without shaping parameters, SparsePatient with them
+PatientResponse = Union[schemas.Patient, SparsePatient]
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select, update
+
+import models, database, storage
+
+BATCH_SIZE = 100
+# Failing files are retried with backoff (1 min, 2, 4, ... capped at a day), then left for a person to look at
+MAX_ATTEMPTS = 12
+MAX_BACKOFF = timedelta(days=1)
+
+
+def _backoff(attempts: int) -> timedelta:
+    return min(timedelta(minutes=2 ** attempts), MAX_BACKOFF)
+
+
+def reap(batch_size: int = BATCH_SIZE) -> int:
+    """
+    Deletes one batch of queued files. Rows are locked with SKIP LOCKED, so
+    several workers can reap at once without touching the same file.
+    Returns how many rows were handled (0 when nothing is due).
+    """
+    with database.engine.begin() as conn:
+        rows = conn.execute(
+            select(models.StorageCleanup.id, models.StorageCleanup.file_path, models.StorageCleanup.attempts)
+            .where(
+                models.StorageCleanup.next_attempt_at <= func.now(),
+                models.StorageCleanup.attempts < MAX_ATTEMPTS,
+            )
+            .order_by(models.StorageCleanup.next_attempt_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+        done = []
+        for row in rows:
+            try:
+                storage.delete_file(row.file_path)
+                done.append(row.id)
+            except Exception as e:
+                print(f"Warning: could not delete {row.file_path} (attempt {row.attempts + 1}): {e}")
+                conn.execute(
+                    update(models.StorageCleanup)
+                    .where(models.StorageCleanup.id == row.id)
+                    .values(
+                        attempts=row.attempts + 1,
+                        next_attempt_at=func.now() + _backoff(row.attempts),
+                        last_error=str(e)[:500],
+                    )
+                )
+        if done:
+            conn.execute(delete(models.StorageCleanup).where(models.StorageCleanup.id.in_(done)))
+    return len(rows)
+
+
+def reap_all() -> int:
+    """Reaps until nothing is due."""
+    total = 0
+    while (handled := reap()) > 0:
+        total += handled
+        if handled < BATCH_SIZE:
+            break
+    return total
+
+
+def stats(db) -> dict:
+    pending, failing, gave_up = db.execute(
+        select(
+            func.count().filter(models.StorageCleanup.attempts == 0),
+            func.count().filter(models.StorageCleanup.attempts.between(1, MAX_ATTEMPTS - 1)),
+            func.count().filter(models.StorageCleanup.attempts >= MAX_ATTEMPTS),
+        )
+    ).one()
+    return {"pending": pending, "retrying": failing, "gave_up": gave_up}
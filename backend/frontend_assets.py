@@ -0,0 +1,182 @@
+import os
+import sys
+import gzip
+import hashlib
+import mimetypes
+from typing import Dict, Optional
+
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip alone is still a big win
+    brotli = None
+
+# Vite puts content-hashed bundles here, so they can be cached forever
+HASHED_PREFIX = "assets/"
+
+# Only text-like files shrink; images/fonts are already compressed
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json",
+    "application/xml", "image/svg+xml", "application/manifest+json",
+)
+MIN_COMPRESS_SIZE = 512
+
+# Sidecar files written at image build time (see __main__ below); served as-is
+SIDECARS = {"br": ".br", "gzip": ".gz"}
+
+# Brotli level when compressing on first request; the build step uses 11
+LAZY_BROTLI_QUALITY = 5
+
+
+class StaticFile:
+    __slots__ = ("media_type", "etag", "variants")
+
+    def __init__(self, content: bytes, media_type: str, precompressed: Optional[Dict[str, bytes]] = None):
+        self.media_type = media_type
+        self.etag = hashlib.sha1(content).hexdigest()[:16]
+        # encoding -> body ("identity" is always present)
+        self.variants: Dict[str, bytes] = {"identity": content}
+        self.variants.update(precompressed or {})
+
+        if len(content) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+            if "gzip" not in self.variants:
+                gz = gzip.compress(content, compresslevel=9, mtime=0)
+                if len(gz) < len(content):
+                    self.variants["gzip"] = gz
+            if "br" not in self.variants and brotli is not None:
+                br = brotli.compress(content, quality=LAZY_BROTLI_QUALITY)
+                if len(br) < len(content):
+                    self.variants["br"] = br
+
+
+def parse_accept_encoding(header: Optional[str]) -> set:
+    """Returns the encodings the client accepts (ignores q=0 entries)."""
+    accepted = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token)
+    return accepted
+
+
+def list_dist(dist_path: str) -> Dict[str, str]:
+    """Relative URL path -> file on disk, skipping .gz/.br sidecars of other files."""
+    found = {}
+    for root, _, filenames in os.walk(dist_path):
+        for filename in filenames:
+            full_path = os.path.join(root, filename)
+            found[os.path.relpath(full_path, dist_path).replace(os.sep, "/")] = full_path
+    return {
+        rel: path for rel, path in found.items()
+        if not any(rel.endswith(ext) and rel[:-len(ext)] in found for ext in SIDECARS.values())
+    }
+
+
+class FrontendIndex:
+    """
+    In-memory index of the built React app (frontend/dist).
+    Startup only lists the directory; each file is read (and compressed, unless
+    build-time sidecars exist) on its first request and then served from memory.
+    """
+
+    def __init__(self, dist_path: str):
+        self.dist_path = dist_path
+        self.paths = list_dist(dist_path)
+        self.files: Dict[str, StaticFile] = {}
+
+    def get(self, rel_path: str) -> Optional[StaticFile]:
+        static_file = self.files.get(rel_path)
+        if static_file is None and rel_path in self.paths:
+            full_path = self.paths[rel_path]
+            with open(full_path, "rb") as f:
+                content = f.read()
+            precompressed = {}
+            for encoding, ext in SIDECARS.items():
+                if os.path.exists(full_path + ext):
+                    with open(full_path + ext, "rb") as f:
+                        precompressed[encoding] = f.read()
+            media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+            static_file = self.files[rel_path] = StaticFile(content, media_type, precompressed)
+        return static_file
+
+    def response(self, full_path: str, accept_encoding: Optional[str], if_none_match: Optional[str]) -> Response:
+        static_file = self.get(full_path) if full_path else None
+
+        if static_file is None:
+            # A missing hashed bundle is a real 404, not an SPA route
+            if full_path.startswith(HASHED_PREFIX):
+                return Response(status_code=404)
+            # Otherwise serve index.html so React can handle the routing
+            full_path = "index.html"
+            static_file = self.get(full_path)
+            if static_file is None:
+                return Response(status_code=404)
+
+        accepted = parse_accept_encoding(accept_encoding)
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in static_file.variants and candidate in accepted:
+                encoding = candidate
+                break
+
+        # Strong ETag per representation (compressed bytes differ from identity)
+        etag = f'"{static_file.etag}-{encoding}"'
+        headers = {
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": (
+                "public, max-age=31536000, immutable"
+                if full_path.startswith(HASHED_PREFIX)
+                else "no-cache"
+            ),
+        }
+        if if_none_match and etag in [c.strip() for c in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        return Response(
+            content=static_file.variants[encoding],
+            media_type=static_file.media_type,
+            headers=headers,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.paths),
+            "loaded": len(self.files),
+            "bytes": {
+                enc: sum(len(f.variants[enc]) for f in self.files.values() if enc in f.variants)
+                for enc in ("identity", "gzip", "br")
+            },
+        }
+
+
+def precompress(dist_path: str):
+    """Writes max-level .gz/.br sidecars next to compressible dist files (run at image build)."""
+    for rel_path, full_path in list_dist(dist_path).items():
+        media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        with open(full_path, "rb") as f:
+            content = f.read()
+        if len(content) < MIN_COMPRESS_SIZE or not media_type.startswith(COMPRESSIBLE_TYPES):
+            continue
+
+        variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(content, quality=11)
+        for encoding, body in variants.items():
+            if len(body) < len(content):
+                with open(full_path + SIDECARS[encoding], "wb") as f:
+                    f.write(body)
+        print(f"{rel_path}: {len(content)} -> " + ", ".join(f"{k} {len(v)}" for k, v in variants.items()))
+
+
+if __name__ == "__main__":
+    # Usage: python frontend_assets.py /app/frontend/dist
+    precompress(sys.argv[1] if len(sys.argv) > 1 else "../frontend/dist")
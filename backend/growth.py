@@ -0,0 +1,228 @@
+import os
+import csv
+from functools import lru_cache
+from typing import Dict, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import models
+
+LMS_TABLE_PATH = os.getenv(
+    "WHO_WFA_TABLE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "who_weight_for_age_lms.csv"),
+)
+
+DAYS_PER_MONTH = 30.4375
+
+# Centile lines printed on the WHO/UK charts (0.4th ... 99.6th), as z-scores
+CENTILE_LINES_Z = np.array([-2.67, -2.0, -1.33, -0.67, 0.0, 0.67, 1.33, 2.0, 2.67])
+
+
+#####################################################
+# --- Reference Tables ---
+#####################################################
+
+@lru_cache(maxsize=None)
+def load_lms_table() -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """sex -> (months, L, M, S) arrays, sorted by month. Loaded once per worker."""
+    rows = {"M": [], "F": []}
+    with open(LMS_TABLE_PATH, newline="") as f:
+        reader = csv.DictReader(line for line in f if not line.startswith("#"))
+        for row in reader:
+            rows[row["sex"]].append((float(row["month"]), float(row["L"]), float(row["M"]), float(row["S"])))
+
+    table = {}
+    for sex, values in rows.items():
+        arr = np.array(sorted(values), dtype=float).reshape(-1, 4)
+        table[sex] = (arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3])
+    return table
+
+
+#####################################################
+# --- Vectorised Z-Scores ---
+#####################################################
+
+def _lms_value(L, M, S, z):
+    """Measurement at a given z for the LMS curve (used by the WHO tail adjustment)."""
+    return M * np.power(1 + L * S * z, 1 / L)
+
+
+def _normal_cdf(z: np.ndarray) -> np.ndarray:
+    # Abramowitz & Stegun 7.1.26 erf approximation (|error| < 1.5e-7), vectorised
+    x = np.abs(z) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - poly * np.exp(-x * x)
+    return 0.5 * (1 + np.sign(z) * erf)
+
+
+def weight_for_age_z(sex: np.ndarray, age_months: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """
+    WHO weight-for-age z-scores for whole arrays at once.
+    NaN where sex is unknown, the weight is missing, or the age is outside the table.
+    """
+    sex = np.asarray(sex, dtype=object)
+    age_months = np.asarray(age_months, dtype=float)
+    weight = np.asarray(weight, dtype=float)
+
+    L = np.full(age_months.shape, np.nan)
+    M = np.full(age_months.shape, np.nan)
+    S = np.full(age_months.shape, np.nan)
+
+    for code, (months, l_col, m_col, s_col) in load_lms_table().items():
+        mask = (sex == code) & (age_months >= months[0]) & (age_months <= months[-1])
+        if mask.any():
+            L[mask] = np.interp(age_months[mask], months, l_col)
+            M[mask] = np.interp(age_months[mask], months, m_col)
+            S[mask] = np.interp(age_months[mask], months, s_col)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(
+            np.abs(L) < 1e-9,
+            np.log(weight / M) / S,
+            (np.power(weight / M, L) - 1) / (L * S),
+        )
+
+        # WHO restricted application of the LMS method beyond +/-3 SD
+        sd3_pos, sd2_pos = _lms_value(L, M, S, 3), _lms_value(L, M, S, 2)
+        sd3_neg, sd2_neg = _lms_value(L, M, S, -3), _lms_value(L, M, S, -2)
+        z = np.where(z > 3, 3 + (weight - sd3_pos) / (sd3_pos - sd2_pos), z)
+        z = np.where(z < -3, -3 + (weight - sd3_neg) / (sd2_neg - sd3_neg), z)
+
+    return z
+
+
+def z_to_percentile(z: np.ndarray) -> np.ndarray:
+    return _normal_cdf(np.asarray(z, dtype=float)) * 100
+
+
+def age_in_months(dob: np.ndarray, on: np.ndarray) -> np.ndarray:
+    days = (np.asarray(on, dtype="datetime64[D]") - np.asarray(dob, dtype="datetime64[D]")).astype(float)
+    return days / DAYS_PER_MONTH
+
+
+def _clean(value):
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+#####################################################
+# --- Per-Patient Series ---
+#####################################################
+
+def weight_series(db: Session, patient: models.Patient) -> dict:
+    """Weight-for-age points (birth + every visit) with z-scores and percentiles."""
+    visits = db.execute(
+        select(models.Visit.visit_id, models.Visit.date, models.Visit.weight)
+        .where(models.Visit.patient_id == patient.id)
+        .order_by(models.Visit.date, models.Visit.time)
+    ).all()
+
+    points = []
+    if patient.birth_weight_kg:
+        points.append((None, patient.date_of_birth, patient.birth_weight_kg))
+    points.extend(visits)
+
+    if points:
+        dates = np.array([p[1] for p in points], dtype="datetime64[D]")
+        weights = np.array([p[2] if p[2] else np.nan for p in points], dtype=float)
+        ages = age_in_months(np.datetime64(patient.date_of_birth, "D"), dates)
+        z = weight_for_age_z(np.full(len(points), patient.sex, dtype=object), ages, weights)
+        pct = z_to_percentile(z)
+    else:
+        ages = z = pct = []
+
+    return {
+        "patient_id": patient.id,
+        "sex": patient.sex,
+        "date_of_birth": patient.date_of_birth,
+        "points": [
+            {
+                "visit_id": visit_id,
+                "date": visit_date,
+                "age_months": _clean(ages[i]),
+                "weight": weight,
+                "z_score": _clean(z[i]),
+                "percentile": _clean(pct[i]),
+            }
+            for i, (visit_id, visit_date, weight) in enumerate(points)
+        ],
+    }
+
+
+#####################################################
+# --- Registry-Wide Batch ---
+#####################################################
+
+def centile_crossing_alerts(db: Session, min_lines: int = 2) -> list:
+    """
+    Flags patients whose latest weight crossed at least `min_lines` centile lines
+    since their previous visit. One query + one vectorised pass for the whole registry.
+    """
+    ranked = (
+        select(
+            models.Visit.patient_id,
+            models.Visit.date,
+            models.Visit.weight,
+            func.row_number().over(
+                partition_by=models.Visit.patient_id,
+                order_by=(models.Visit.date.desc(), models.Visit.time.desc()),
+            ).label("rank"),
+        )
+        .subquery()
+    )
+    rows = db.execute(
+        select(
+            ranked.c.patient_id, ranked.c.rank, ranked.c.date, ranked.c.weight,
+            models.Patient.display_id, models.Patient.name, models.Patient.sex, models.Patient.date_of_birth,
+        )
+        .join(models.Patient, models.Patient.id == ranked.c.patient_id)
+        .where(ranked.c.rank <= 2)
+        .where(models.Patient.sex.isnot(None))
+        .order_by(ranked.c.patient_id, ranked.c.rank)
+    ).all()
+
+    if not rows:
+        return []
+
+    patient_ids = np.array([r.patient_id for r in rows], dtype=object)
+    ranks = np.array([r.rank for r in rows])
+    sex = np.array([r.sex for r in rows], dtype=object)
+    ages = age_in_months(
+        np.array([r.date_of_birth for r in rows], dtype="datetime64[D]"),
+        np.array([r.date for r in rows], dtype="datetime64[D]"),
+    )
+    weights = np.array([r.weight for r in rows], dtype=float)
+
+    z = weight_for_age_z(sex, ages, weights)
+    bands = np.searchsorted(CENTILE_LINES_Z, z)
+
+    # Rows are ordered (patient, rank): a latest row followed by its previous row
+    latest = np.flatnonzero(ranks == 1)
+    has_prev = latest + 1 < len(rows)
+    latest = latest[has_prev]
+    prev = latest + 1
+    same_patient = patient_ids[latest] == patient_ids[prev]
+    latest, prev = latest[same_patient], prev[same_patient]
+
+    valid = ~np.isnan(z[latest]) & ~np.isnan(z[prev])
+    crossed = np.abs(bands[latest] - bands[prev])
+    flagged = valid & (crossed >= min_lines)
+
+    alerts = []
+    for i, j, n in zip(latest[flagged], prev[flagged], crossed[flagged]):
+        row = rows[i]
+        alerts.append({
+            "patient_id": row.patient_id,
+            "display_id": row.display_id,
+            "name": row.name,
+            "latest_date": row.date,
+            "latest_weight": row.weight,
+            "latest_z_score": _clean(z[i]),
+            "previous_date": rows[j].date,
+            "previous_z_score": _clean(z[j]),
+            "lines_crossed": int(n),
+            "direction": "up" if z[i] > z[j] else "down",
+        })
+    return alerts
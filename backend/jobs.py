@@ -0,0 +1,400 @@
+import inspect
+import os
+import select as select_module
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import traceback
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+import models, database, storage, reports, file_cleanup, partitions
+
+# pg_notify channel: enqueue() wakes idle workers instead of waiting for the next poll
+NOTIFY_CHANNEL = "jobs"
+
+DEFAULT_PRIORITY = 100 # lower runs first
+POLL_SECONDS = 5
+HEARTBEAT_SECONDS = 30
+# A running job whose worker hasn't sent a heartbeat for this long is taken back
+STALE_AFTER_SECONDS = 300
+RETRY_BASE_SECONDS = 30
+RESULT_TTL_HOURS = int(os.getenv("JOB_RESULT_TTL_HOURS", "24"))
+MAINTENANCE_INTERVAL_SECONDS = 600
+# How often the worker deletes files queued in storage_cleanup
+REAP_INTERVAL_SECONDS = 30
+
+#####################################################
+# --- Task Registry ---
+#####################################################
+
+class TaskSpec:
+    def __init__(self, fn: Callable, max_attempts: int, admin: bool, check: Optional[Callable]):
+        self.fn = fn
+        self.max_attempts = max_attempts
+        self.admin = admin # needs the admin PIN to enqueue
+        self.check = check # check(**params) raises ValueError for values fn would reject
+
+TASKS: Dict[str, TaskSpec] = {}
+
+def task(kind: str, max_attempts: int = 3, admin: bool = False, check: Optional[Callable] = None):
+    """Registers fn(ctx, **params) as the handler for jobs of this kind."""
+    def register(fn):
+        TASKS[kind] = TaskSpec(fn, max_attempts, admin, check)
+        return fn
+    return register
+
+
+class BadParams(ValueError):
+    """The job's params don't fit its task: retrying won't help."""
+
+
+def check_params(kind: str, params: dict):
+    """Raises BadParams unless `params` match the task's arguments, their types and its check."""
+    spec = TASKS[kind]
+    try:
+        bound = inspect.signature(spec.fn).bind(None, **params)
+    except TypeError as e:
+        raise BadParams(f"Invalid params for {kind}: {e}") from None
+    for name, value in list(bound.arguments.items())[1:]:
+        expected = spec.fn.__annotations__.get(name)
+        if expected in (str, bool) and not isinstance(value, expected):
+            raise BadParams(f"Invalid params for {kind}: {name} must be a {'string' if expected is str else 'boolean'}")
+    if spec.check:
+        try:
+            spec.check(**params)
+        except ValueError as e:
+            raise BadParams(f"Invalid params for {kind}: {e}") from None
+
+
+class JobContext:
+    """Handed to each task: a scratch directory, plus progress and result reporting."""
+
+    def __init__(self, job_id: int, work_dir: str):
+        self.job_id = job_id
+        self.work_dir = work_dir
+        self.result: Optional[tuple] = None
+
+    def progress(self, fraction: float, message: Optional[str] = None):
+        with database.engine.begin() as conn:
+            conn.execute(
+                update(models.Job)
+                .where(models.Job.id == self.job_id)
+                .values(progress=max(0.0, min(fraction, 1.0)), progress_message=message, heartbeat_at=func.now())
+            )
+
+    def set_result(self, path: str, filename: str, media_type: str):
+        self.result = (path, filename, media_type)
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.work_dir, filename)
+
+
+def _reporting_session() -> Session:
+    # Tasks run outside any request: use the reporting pool (replica if it's caught up)
+    use_replica = database.has_read_replica() and database.replica_status.is_usable(None)
+    return database.SessionLocal(bind=database.engine_for("reporting", replica=use_replica))
+
+def _date_range(start_date: str, end_date: str):
+    return date.fromisoformat(start_date), date.fromisoformat(end_date)
+
+def _check_report_params(start_date: str, end_date: str, group_by: str = "day", **_):
+    start, end = _date_range(start_date, end_date)
+    if start > end:
+        raise ValueError("start_date must not be after end_date")
+    if group_by not in ("day", "month"):
+        raise ValueError("group_by must be day or month")
+
+def _check_snapshot_params(format: str = "parquet", **_):
+    # snapshots.FORMATS, without importing pyarrow into the API
+    if format not in ("parquet", "arrow"):
+        raise ValueError("format must be parquet or arrow")
+
+#####################################################
+# --- Tasks ---
+#####################################################
+
+@task("dispensation_csv", check=_check_report_params)
+def dispensation_csv(ctx: JobContext, start_date: str, end_date: str):
+    start, end = _date_range(start_date, end_date)
+    with _reporting_session() as db:
+        visits = reports.dispensation_log(db, start, end)
+        ctx.progress(0.5, f"{len(visits)} visits")
+        filename = f"medication_log_{start}_to_{end}.csv"
+        with open(ctx.path(filename), "w", newline="") as f:
+            reports.write_dispensation_csv(visits, f)
+    ctx.set_result(ctx.path(filename), filename, "text/csv")
+
+@task("dispensation_pdf", check=_check_report_params)
+def dispensation_pdf(ctx: JobContext, start_date: str, end_date: str):
+    import pdf_reports
+    start, end = _date_range(start_date, end_date)
+    with _reporting_session() as db:
+        visits = reports.dispensation_log(db, start, end)
+        ctx.progress(0.3, f"Rendering {len(visits)} visits")
+        output = pdf_reports.dispensation_log_pdf(visits, start, end)
+    filename = f"medication_log_{start}_to_{end}.pdf"
+    with open(ctx.path(filename), "wb") as f:
+        shutil.copyfileobj(output, f)
+    ctx.set_result(ctx.path(filename), filename, "application/pdf")
+
+@task("finance_csv", check=_check_report_params)
+def finance_csv(ctx: JobContext, start_date: str, end_date: str, group_by: str = "day", receipts: bool = False):
+    start, end = _date_range(start_date, end_date)
+    with _reporting_session() as db:
+        report = reports.finance_report(db, start, end, group_by, receipts)
+    filename = f"takings_{start}_to_{end}.csv"
+    with open(ctx.path(filename), "w", newline="") as f:
+        reports.write_finance_csv(report, f)
+    ctx.set_result(ctx.path(filename), filename, "text/csv")
+
+@task("finance_pdf", check=_check_report_params)
+def finance_pdf(ctx: JobContext, start_date: str, end_date: str, group_by: str = "day", receipts: bool = False):
+    import pdf_reports
+    start, end = _date_range(start_date, end_date)
+    with _reporting_session() as db:
+        report = reports.finance_report(db, start, end, group_by, receipts)
+    output = pdf_reports.finance_report_pdf(report, start, end)
+    filename = f"takings_{start}_to_{end}.pdf"
+    with open(ctx.path(filename), "wb") as f:
+        shutil.copyfileobj(output, f)
+    ctx.set_result(ctx.path(filename), filename, "application/pdf")
+
+@task("backup", max_attempts=2, admin=True)
+def database_backup(ctx: JobContext):
+    import backup
+    filename = f"clinic_backup_{datetime.now().strftime('%Y%m%d_%H%M')}.sql"
+    ctx.progress(0.1, "Running pg_dump")
+    backup.dump_database(database.engine.url, ctx.path(filename))
+    ctx.set_result(ctx.path(filename), filename, "application/octet-stream")
+
+@task("snapshot", max_attempts=2, admin=True, check=_check_snapshot_params)
+def analysis_snapshot(ctx: JobContext, format: str = "parquet", deidentify: bool = False):
+    """patients, visits and dispensation_items as Parquet (or Arrow IPC) files in a zip."""
+    import snapshots
+    filename = f"clinic_snapshot_{datetime.now().strftime('%Y%m%d_%H%M')}{'_deidentified' if deidentify else ''}.zip"
+    with _reporting_session() as db:
+        # One consistent view across the three tables
+        conn = db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        paths = snapshots.write_snapshot(conn, ctx.work_dir, format, deidentify, ctx.progress)
+    snapshots.bundle(paths, ctx.path(filename))
+    ctx.set_result(ctx.path(filename), filename, "application/zip")
+
+@task("storage_cleanup", max_attempts=5)
+def storage_cleanup(ctx: JobContext):
+    """Deletes queued files now instead of waiting for the worker's next reaper pass."""
+    ctx.progress(0.0, "Deleting files")
+    handled = file_cleanup.reap_all()
+    ctx.progress(1.0, f"{handled} file(s) processed")
+
+#####################################################
+# --- Enqueue ---
+#####################################################
+
+def enqueue(db: Session, kind: str, params: Optional[dict] = None, priority: int = DEFAULT_PRIORITY) -> models.Job:
+    """Adds a job in the caller's transaction; workers are notified when it commits."""
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = models.Job(kind=kind, params=params or {}, priority=priority, max_attempts=TASKS[kind].max_attempts)
+    db.add(job)
+    db.flush()
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": str(job.id)})
+    return job
+
+def cancel(db: Session, job_id: int) -> bool:
+    """Cancels a job that hasn't started. Running jobs are left to finish."""
+    result = db.execute(
+        update(models.Job)
+        .where(models.Job.id == job_id, models.Job.status == "queued")
+        .values(status="cancelled", finished_at=func.now())
+    )
+    return result.rowcount > 0
+
+#####################################################
+# --- Worker ---
+#####################################################
+
+def claim(worker: str) -> Optional[Row]:
+    """Takes the next due job (id, kind, params, attempts, max_attempts), or None. Concurrent workers skip rows another has locked."""
+    next_job = (
+        select(models.Job.id)
+        .where(models.Job.status == "queued", models.Job.run_after <= func.now())
+        .order_by(models.Job.priority, models.Job.run_after, models.Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    with database.engine.begin() as conn:
+        row = conn.execute(
+            update(models.Job)
+            .where(models.Job.id == next_job)
+            .values(
+                status="running",
+                attempts=models.Job.attempts + 1,
+                worker=worker,
+                started_at=func.now(),
+                heartbeat_at=func.now(),
+                error=None,
+            )
+            .returning(models.Job.id, models.Job.kind, models.Job.params, models.Job.attempts, models.Job.max_attempts)
+        ).first()
+    return row
+
+def _heartbeat(job_id: int, done: threading.Event):
+    while not done.wait(HEARTBEAT_SECONDS):
+        try:
+            with database.engine.begin() as conn:
+                conn.execute(update(models.Job).where(models.Job.id == job_id).values(heartbeat_at=func.now()))
+        except Exception as e:
+            print(f"Warning: job {job_id} heartbeat failed: {e}")
+
+def run_job(job):
+    spec = TASKS.get(job.kind)
+    work_dir = tempfile.mkdtemp(prefix=f"job_{job.id}_")
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job.id, done), daemon=True).start()
+
+    try:
+        if spec is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        check_params(job.kind, job.params)
+        ctx = JobContext(job.id, work_dir)
+        spec.fn(ctx, **job.params)
+
+        values = {"status": "succeeded", "progress": 1.0, "finished_at": func.now()}
+        if ctx.result:
+            path, filename, media_type = ctx.result
+            values.update(
+                result_location=storage.save_job_result(job.id, filename, path),
+                result_filename=filename,
+                result_media_type=media_type,
+            )
+        with database.engine.begin() as conn:
+            conn.execute(update(models.Job).where(models.Job.id == job.id).values(**values))
+        print(f"Job {job.id} ({job.kind}) succeeded")
+
+    except Exception as e:
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        retry = spec is not None and not isinstance(e, BadParams) and job.attempts < job.max_attempts
+        if retry:
+            # Exponential backoff: 30s, 60s, 120s, ...
+            delay = RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+            values = {"status": "queued", "run_after": func.now() + timedelta(seconds=delay)}
+        else:
+            values = {"status": "failed", "finished_at": func.now()}
+        with database.engine.begin() as conn:
+            conn.execute(update(models.Job).where(models.Job.id == job.id).values(error=error, **values))
+        print(f"Job {job.id} ({job.kind}) failed (attempt {job.attempts}/{job.max_attempts}): {error}")
+        traceback.print_exc()
+
+    finally:
+        done.set()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def requeue_stale():
+    """Jobs whose worker died mid-run: retry them, or fail them if out of attempts."""
+    stale = models.Job.heartbeat_at < func.now() - timedelta(seconds=STALE_AFTER_SECONDS)
+    with database.engine.begin() as conn:
+        conn.execute(
+            update(models.Job)
+            .where(models.Job.status == "running", stale, models.Job.attempts < models.Job.max_attempts)
+            .values(status="queued", run_after=func.now(), error="Worker stopped responding")
+        )
+        conn.execute(
+            update(models.Job)
+            .where(models.Job.status == "running", stale)
+            .values(status="failed", finished_at=func.now(), error="Worker stopped responding")
+        )
+
+def expire_results():
+    """Deletes results (downloaded or not) of jobs finished more than RESULT_TTL_HOURS ago."""
+    expired = models.Job.finished_at < func.now() - timedelta(hours=RESULT_TTL_HOURS)
+    with database.engine.begin() as conn:
+        rows = conn.execute(
+            select(models.Job.id, models.Job.result_location)
+            .where(models.Job.result_location.isnot(None), expired)
+        ).all()
+        for job_id, location in rows:
+            storage.delete_job_result(location)
+            conn.execute(update(models.Job).where(models.Job.id == job_id).values(result_location=None))
+
+def _work_loop(worker: str, wake: threading.Event, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            job = claim(worker)
+        except Exception as e:
+            print(f"Warning: could not claim a job: {e}")
+            job = None
+            stop.wait(POLL_SECONDS)
+        if job is not None:
+            run_job(job)
+            continue
+        wake.wait(POLL_SECONDS)
+        wake.clear()
+
+def run_worker(concurrency: int = 1):
+    """
+    Worker process: `concurrency` threads claiming jobs, plus this thread
+    listening for enqueue notifications, reaping deleted files and doing
+    periodic maintenance.
+    SIGTERM/SIGINT let running jobs finish before exiting.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    wake, stop = threading.Event(), threading.Event()
+
+    def shutdown(signum, frame):
+        print("Job worker stopping after current jobs...")
+        stop.set()
+        wake.set()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    threads = [
+        threading.Thread(target=_work_loop, args=(f"{worker_id}/{i}", wake, stop), name=f"job-worker-{i}")
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Job worker {worker_id} started with {concurrency} thread(s): {', '.join(sorted(TASKS))}")
+
+    last_maintenance = last_reap = 0.0
+    conn = None
+    while not stop.is_set():
+        try:
+            if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL_SECONDS:
+                requeue_stale()
+                expire_results()
+                partitions.ensure_upcoming()
+                last_maintenance = time.monotonic()
+            if time.monotonic() - last_reap > REAP_INTERVAL_SECONDS:
+                file_cleanup.reap_all()
+                last_reap = time.monotonic()
+
+            if conn is None:
+                conn = database.listen_connection()
+                conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+            if select_module.select([conn], [], [], POLL_SECONDS) != ([], [], []):
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    wake.set()
+        except Exception as e:
+            # Workers keep polling meanwhile; just reconnect
+            print(f"Warning: job listener error: {e}")
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            conn = None
+            stop.wait(POLL_SECONDS)
+
+    for thread in threads:
+        thread.join()
@@ -1,36 +1,26 @@
-import os, csv, io, hashlib, subprocess
-from fastapi import FastAPI, Depends, HTTPException, Query, File, UploadFile, BackgroundTasks
-from fastapi.staticfiles import StaticFiles
+import os, io, hashlib
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, File, UploadFile, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import or_, func, cast, Integer
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import date, datetime
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.background import BackgroundTask
+from sqlalchemy import or_, func, cast, delete, select, update, tuple_, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, load_only
+from typing import List, Literal, Optional
+from datetime import date, datetime, timedelta
 from uuid import UUID
 
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
+import models, schemas, database, storage, frontend_assets, serialization, reports, sync, typeahead, duplicates, audit, bulkheads, jobs, backup, file_cleanup, partitions, fieldsets, slow_queries, events, medication_checks, pagination
 
-import models, schemas, database, storage
-
-# Create tables
-models.Base.metadata.create_all(bind=database.engine)
-
-app = FastAPI()
-
-# --- CORS (For Dev Mode) ---
-# Allows Vite dev server (port 5173) to talk to Python (port 8000)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], 
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Startup must stay cheap: it repeats in every gunicorn worker.
+# - No schema DDL here; entrypoint.sh runs `alembic upgrade head` once.
+# - ReportLab (pdf_reports), NumPy (growth) and google-cloud-storage (storage)
+#   are imported on first use, not at import time.
+# - No DB access until the first request (the admin PIN is seeded on demand).
+router = APIRouter()
 
 #####################################################
 # --- Helper Functions ---
@@ -56,41 +46,137 @@ def verify_password(plain_password: str, stored_value: str) -> bool:
         # Handles cases where stored_value format is wrong
         return False
     
+def get_admin_pin_config(db: Session) -> models.SystemConfig:
+    """Returns the admin PIN row, seeding the default on first use (instead of at startup)."""
+    pin_config = db.query(models.SystemConfig).filter(models.SystemConfig.key == "admin_pin").first()
+
+    if not pin_config:
+        # Get default from Docker Env or use "000000"
+        default_pin = os.getenv("INITIAL_ADMIN_PIN", "000000")
+        pin_config = models.SystemConfig(key="admin_pin", value=get_password_hash(default_pin))
+        db.add(pin_config)
+        db.commit()
+        db.refresh(pin_config)
+        print(f"--- SYSTEM: Admin PIN initialized to default ({default_pin}) ---")
+
+    return pin_config
+
+def require_admin_pin(db: Session, pin: Optional[str]):
+    """401 unless `pin` matches the stored admin PIN (for PIN-protected GET routes)."""
+    if not pin:
+        raise HTTPException(status_code=401, detail="Admin PIN is required.")
+
+    stored_config = db.query(models.SystemConfig).filter(models.SystemConfig.key == "admin_pin").first()
+    if not stored_config:
+        # Fresh database: seed the default PIN as verify-pin does. On the primary,
+        # since `db` may be a (read-only) replica session.
+        with database.SessionLocal() as primary:
+            stored_config = get_admin_pin_config(primary)
+    if not verify_password(pin, stored_config.value):
+        raise HTTPException(status_code=401, detail="Incorrect Admin PIN.")
+
 # --- Enforce symmetry for sibling connections ---
+def create_sibling_links(db: Session, pairs):
+    """Links each (A, B) as A -> B and B -> A, in one INSERT (Idempotent)"""
+    rows = {(a, b) for a, b in pairs if a != b}
+    rows |= {(b, a) for a, b in rows}
+    if not rows:
+        return
+    db.execute(
+        pg_insert(models.patient_siblings)
+        .values([{"patient_id": a, "sibling_id": b} for a, b in rows])
+        .on_conflict_do_nothing()
+    )
+
 def create_sibling_link(db: Session, patient_a_id, patient_b_id):
     """Ensures A is linked to B, and B is linked to A (Idempotent)"""
-    # Check A -> B
-    exists_a = db.query(models.patient_siblings).filter_by(
-        patient_id=patient_a_id, sibling_id=patient_b_id
-    ).first()
-    if not exists_a:
-        stmt = models.patient_siblings.insert().values(patient_id=patient_a_id, sibling_id=patient_b_id)
-        db.execute(stmt)
-
-    # Check B -> A
-    exists_b = db.query(models.patient_siblings).filter_by(
-        patient_id=patient_b_id, sibling_id=patient_a_id
-    ).first()
-    if not exists_b:
-        stmt = models.patient_siblings.insert().values(patient_id=patient_b_id, sibling_id=patient_a_id)
-        db.execute(stmt)
+    create_sibling_links(db, [(patient_a_id, patient_b_id)])
+
+# --- Row versioning for conditional GETs (and the sync change feed) ---
+def patient_change_values() -> dict:
+    return {
+        "version": models.Patient.version + 1,
+        "updated_at": func.now(),
+        "change_xid": models.current_xact_id,
+    }
+
+def bump_patient_version(db: Session, patient_ids):
+    """Marks the patients' trees as changed so cached ETags stop matching."""
+    ids = {pid for pid in patient_ids if pid is not None}
+    if not ids:
+        return
+    db.execute(
+        update(models.Patient)
+        .where(models.Patient.id.in_(ids))
+        .values(**patient_change_values())
+        .execution_options(synchronize_session=False)
+    )
+
+def bump_patient_version_for_visit(db: Session, visit_id: int):
+    """Same as bump_patient_version, for the patient who owns visit_id."""
+    owner = db.query(models.Visit.patient_id).filter(models.Visit.visit_id == visit_id).scalar_subquery()
+    db.execute(
+        update(models.Patient)
+        .where(models.Patient.id == owner)
+        .values(**patient_change_values())
+        .execution_options(synchronize_session=False)
+    )
+
+def load_patient_tree(db: Session, patient_id):
+    """Patient with visits, attachments, dispensations and siblings, in one query per level."""
+    return (
+        db.query(models.Patient)
+        .options(*fieldsets.query_options(fieldsets.FULL_TREE))
+        .filter(models.Patient.id == patient_id)
+        .first()
+    )
+
+def make_etag(*parts) -> str:
+    # Strong validator: the version changes whenever the serialized tree does
+    return '"' + "-".join(str(p) for p in parts) + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 #####################################################
 # --- API ROUTES ---
 #####################################################
 
-@app.post("/api/patients/", response_model=schemas.Patient)
-def create_patient(patient: schemas.PatientCreate, db: Session = Depends(database.get_db)):
+@router.post("/api/patients/", response_model=schemas.Patient)
+def create_patient(
+    patient: schemas.PatientCreate,
+    allow_duplicate: bool = False, # set after the user has reviewed the 409 candidates
+    db: Session = Depends(database.get_db)
+):
     # Check if ID exists
     existing = db.query(models.Patient).filter(models.Patient.display_id == patient.display_id).first()
     if existing:
         raise HTTPException(status_code=400, detail="Patient ID already exists")
+
+    # Same child registered before under another ID / spelling?
+    if duplicates.ensure_keys(db):
+        db.commit()  # keep the rebuild even if this registration stops at the 409
+    if not allow_duplicate:
+        candidates = duplicates.find_candidates(db, patient, exclude_ids=patient.sibling_ids)
+        if candidates:
+            raise HTTPException(status_code=409, detail=jsonable_encoder({
+                "message": "Possible duplicate patient",
+                "candidates": candidates,
+            }))
     
     patient_data = patient.dict()
     sibling_ids = patient_data.pop("sibling_ids", []) # Remove from dict
     
     db_patient = models.Patient(**patient_data)
     db.add(db_patient)
+    db.flush()
+    duplicates.store_keys(db, db_patient)
     db.commit()
     db.refresh(db_patient)
 
@@ -106,16 +192,14 @@ def create_patient(patient: schemas.PatientCreate, db: Session = Depends(databas
             network_ids.add(row.sibling_id)
             
         # Create links to everyone found
-        for target_id in network_ids:
-            if target_id == db_patient.id: continue
-            create_sibling_link(db, db_patient.id, target_id)
-            
+        create_sibling_links(db, [(db_patient.id, target_id) for target_id in network_ids])
+
+        bump_patient_version(db, network_ids)
         db.commit()
-        db.refresh(db_patient)
 
-    return db_patient
+    return serialization.model_response(schemas.Patient, load_patient_tree(db, db_patient.id))
 
-@app.get("/api/patients/search/", response_model=List[schemas.Patient])
+@router.get("/api/patients/search/", response_model=List[fieldsets.PatientResponse])
 def search_patients(
     # Basic seach param
     query: Optional[str] = None,
@@ -131,66 +215,204 @@ def search_patients(
     dob_start: Optional[date] = None,
     dob_end: Optional[date] = None,
 
-    limit: int = 25,
+    # Paging: pass back X-Next-Cursor for the next page (sizes above the maximum are cut down)
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None,
+    # Total in X-Total-Count: "estimate" (planner, instant) or "exact" (capped at SEARCH_COUNT_CAP)
+    count: Literal["none", "estimate", "exact"] = "none",
 
-    db: Session = Depends(database.get_db)
+    fieldset: Optional[fieldsets.Fieldset] = Depends(fieldsets.fieldset_params),
+    db: Session = Depends(database.get_read_db)
 ):
-    sql_query = db.query(models.Patient)
+    filters = []
 
-    # 1. Join Visits only if filtering by visit dates
-    if visit_start or visit_end:
-        sql_query = sql_query.join(models.Visit)
-
-    # 2. BASIC SEARCH (Name OR ID)
+    # 1. BASIC SEARCH (Name OR ID)
     if query and not name:
-        sql_query = sql_query.filter(
+        filters.append(
             or_(
                 models.Patient.name.ilike(f"%{query}%"),
                 models.Patient.display_id.ilike(f"%{query}%")
             )
         )
 
-    # 3. ADVANCED SEARCH (Specific fields)
+    # 2. ADVANCED SEARCH (Specific fields)
     if not query and not (name or display_id or address or date_registered_start or date_registered_end or visit_start or visit_end or dob_start or dob_end):
         return []
 
     if name:
-        sql_query = sql_query.filter(models.Patient.name.ilike(f"%{name}%"))
+        filters.append(models.Patient.name.ilike(f"%{name}%"))
 
     if display_id:
-        sql_query = sql_query.filter(models.Patient.display_id.ilike(f"%{display_id}%"))
+        filters.append(models.Patient.display_id.ilike(f"%{display_id}%"))
 
     if address:
-        sql_query = sql_query.filter(models.Patient.address.ilike(f"%{address}%"))
+        filters.append(models.Patient.address.ilike(f"%{address}%"))
 
     if date_registered_start:
-        sql_query = sql_query.filter(models.Patient.date_registered >= date_registered_start)
+        filters.append(models.Patient.date_registered >= date_registered_start)
 
     if date_registered_end:
-        sql_query = sql_query.filter(models.Patient.date_registered <= date_registered_end)
-
-    if visit_start:
-        sql_query = sql_query.filter(models.Visit.date >= visit_start)
+        filters.append(models.Patient.date_registered <= date_registered_end)
 
-    if visit_end:
-        sql_query = sql_query.filter(models.Visit.date <= visit_end)
+    # 3. Visit dates: EXISTS rather than a join, so no DISTINCT is needed and
+    # pages can be read straight off the (name, id) index
+    if visit_start or visit_end:
+        visit_filters = [models.Visit.patient_id == models.Patient.id]
+        if visit_start:
+            visit_filters.append(models.Visit.date >= visit_start)
+        if visit_end:
+            visit_filters.append(models.Visit.date <= visit_end)
+        filters.append(select(models.Visit.visit_id).where(*visit_filters).exists())
 
     if dob_start:
-        sql_query = sql_query.filter(models.Patient.date_of_birth >= dob_start)
+        filters.append(models.Patient.date_of_birth >= dob_start)
 
     if dob_end:
-        sql_query = sql_query.filter(models.Patient.date_of_birth <= dob_end)
+        filters.append(models.Patient.date_of_birth <= dob_end)
+
+    headers = {}
+    if count == "exact":
+        total, capped = pagination.capped_count(db, select(models.Patient.id).where(*filters))
+        headers[pagination.TOTAL_COUNT_HEADER] = str(total)
+        headers[pagination.TOTAL_KIND_HEADER] = "capped" if capped else "exact"
+    elif count == "estimate":
+        total = pagination.estimated_count(db, select(models.Patient.id).where(*filters))
+        headers[pagination.TOTAL_COUNT_HEADER] = str(total)
+        headers[pagination.TOTAL_KIND_HEADER] = "estimate"
+
+    try:
+        after = pagination.after_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid search cursor")
+    if after is not None:
+        filters.append(after)
+
+    # One row past the page tells whether there is a next one
+    page_size = min(limit, pagination.MAX_PAGE_SIZE)
+    results = (
+        db.query(models.Patient)
+        .options(*fieldsets.query_options(fieldset or fieldsets.FULL_TREE))
+        .filter(*filters)
+        .order_by(*pagination.PAGE_ORDER)
+        .limit(page_size + 1)
+        .all()
+    )
+    if len(results) > page_size:
+        results = results[:page_size]
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(results[-1].name, results[-1].id)
+
+    schema = fieldsets.response_schema(fieldset) if fieldset else schemas.Patient
+    return serialization.model_response(List[schema], results, headers=headers)
+
+@router.post("/api/patients/duplicates/check", response_model=List[schemas.DuplicateCandidate])
+def check_duplicate_patient(patient: schemas.PatientCreate, db: Session = Depends(database.get_db)):
+    """Registration-time check without saving (e.g. as the form is filled in)."""
+    if duplicates.ensure_keys(db):
+        db.commit()
+    return duplicates.find_candidates(db, patient, exclude_ids=patient.sibling_ids)
+
+# Declared before /api/patients/{patient_id} so "duplicates" isn't taken as an ID
+@router.get("/api/patients/duplicates", response_model=List[schemas.DuplicatePair])
+def find_duplicate_patients(
+    min_score: float = Query(duplicates.POSSIBLE_MATCH, ge=0, le=1),
+    db: Session = Depends(database.get_db)
+):
+    """Registry-wide scan for patients registered more than once (read-only)."""
+    return duplicates.scan_registry(db, min_score)
+
+# Declared before /api/patients/{patient_id} so "typeahead" isn't taken as an ID
+@router.get("/api/patients/typeahead", response_model=List[schemas.PatientSummary])
+def patient_typeahead(
+    q: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(database.get_read_db)
+):
+    """Prefix/token matches on name, display ID and phone, served from the in-memory index."""
+    results = typeahead.index.search(q, limit)
+
+    if results is None:
+        # Index still building (or over its size cap): plain SQL prefix search
+        results = (
+            db.query(models.Patient.id, models.Patient.name, models.Patient.display_id, models.Patient.date_of_birth)
+            .filter(or_(
+                models.Patient.name.ilike(f"{q}%"),
+                models.Patient.display_id.ilike(f"{q}%")
+            ))
+            .order_by(models.Patient.name)
+            .limit(limit)
+            .all()
+        )
 
-    return sql_query.distinct().order_by(models.Patient.name).limit(limit).all()
+    return serialization.model_response(List[schemas.PatientSummary], results)
 
-@app.get("/api/patients/{patient_id}", response_model=schemas.Patient)
-def get_patient(patient_id: str, db: Session = Depends(database.get_db)):
+# Declared before /api/patients/{patient_id}
+@router.post("/api/patients/batch", response_model=List[fieldsets.SparsePatient])
+def get_patients_batch(
+    batch: schemas.PatientBatchRequest,
+    fieldset: Optional[fieldsets.Fieldset] = Depends(fieldsets.fieldset_params),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Many patients in one round trip, in the order asked for (unknown IDs are
+    left out). Takes the same fields/expand parameters as GET /api/patients/{id};
+    without them only the patient records are returned, not their trees, so
+    every item is a SparsePatient.
+    """
+    fieldset = fieldset or fieldsets.parse(None, "")
+    patients = (
+        db.query(models.Patient)
+        .options(*fieldsets.query_options(fieldset))
+        .filter(models.Patient.id.in_(batch.ids))
+        .all()
+    )
+    by_id = {p.id: p for p in patients}
+    ordered = [by_id[i] for i in dict.fromkeys(batch.ids) if i in by_id]
+    return serialization.model_response(List[fieldsets.response_schema(fieldset)], ordered)
+
+@router.get("/api/patients/{patient_id}", response_model=fieldsets.PatientResponse)
+def get_patient(
+    patient_id: str,
+    if_none_match: Optional[str] = Header(None),
+    fieldset: Optional[fieldsets.Fieldset] = Depends(fieldsets.fieldset_params),
+    db: Session = Depends(database.get_read_db)
+):
+    # 1. Cheap check: read only the version column before touching the tree
+    version = db.query(models.Patient.version).filter(models.Patient.id == patient_id).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    # Each shape of the response gets its own validator
+    shape = (fieldset.key(),) if fieldset else ()
+    etag = make_etag(patient_id, version, *shape)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    # 2. Changed (or first fetch): load and serialize the tree (or the requested part of it)
+    patient = (
+        db.query(models.Patient)
+        .options(*fieldsets.query_options(fieldset or fieldsets.FULL_TREE))
+        .filter(models.Patient.id == patient_id)
+        .first()
+    )
+    if patient is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    # "no-cache" makes the browser revalidate every time, sending If-None-Match for us
+    headers = {"ETag": make_etag(patient_id, patient.version, *shape), "Cache-Control": "no-cache"}
+    schema = fieldsets.response_schema(fieldset) if fieldset else schemas.Patient
+    return serialization.model_response(schema, patient, headers=headers)
+
+@router.get("/api/patients/{patient_id}/growth")
+def get_patient_growth(patient_id: str, db: Session = Depends(database.get_read_db)):
+    """Weight-for-age series with WHO z-scores and percentiles (needs the patient's sex)."""
     patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
     if patient is None:
         raise HTTPException(status_code=404, detail="Patient not found")
-    return patient
 
-@app.put("/api/patients/{patient_id}", response_model=schemas.Patient)
+    import growth  # NumPy is loaded on first use
+    return growth.weight_series(db, patient)
+
+@router.put("/api/patients/{patient_id}", response_model=schemas.Patient)
 def update_patient(patient_id: str, patient_update: schemas.PatientCreate, db: Session = Depends(database.get_db)):
     db_patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
     if not db_patient:
@@ -198,108 +420,300 @@ def update_patient(patient_id: str, patient_update: schemas.PatientCreate, db: S
     
     for key, value in patient_update.dict().items():
         setattr(db_patient, key, value)
-    
+
+    # Siblings' trees embed this patient's name, display ID and date of birth
+    bump_patient_version(db, {db_patient.id} | duplicates.sibling_ids_of(db, [db_patient.id]))
+    duplicates.store_keys(db, db_patient)
     db.commit()
-    db.refresh(db_patient)
-    return db_patient
+    return serialization.model_response(schemas.Patient, load_patient_tree(db, db_patient.id))
 
-@app.delete("/api/patients/{patient_id}")
-async def delete_patient(patient_id: str, db: Session = Depends(database.get_db)):
+@router.delete("/api/patients/{patient_id}")
+def delete_patient(patient_id: str, db: Session = Depends(database.get_db)):
     # 1. Find the patient
     patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
     
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
+    patient_name = patient.name
+
+    # 2. Read what the cascade removes, for the audit trail, and what it affects
+    # elsewhere: siblings' trees and takings days
+    visits = models.Visit.__table__
+    visit_rows = db.execute(select(visits).where(visits.c.patient_id == patient.id)).all()
+    visit_ids = [row.visit_id for row in visit_rows]
+    visit_dates = sorted({row.date for row in visit_rows})
+    sibling_links = models.patient_siblings
+    link_rows = db.execute(
+        select(sibling_links).where(or_(sibling_links.c.patient_id == patient.id, sibling_links.c.sibling_id == patient.id))
+    ).all()
+    cascaded = [(visits, visit_rows), (sibling_links, link_rows)]
+    for model in (models.DispensationItem, models.VisitAttachment):
+        table = model.__table__
+        # visit_date in the filter keeps dispensation_items to the partitions of these visits
+        cascaded.append((table, db.execute(
+            select(table).where(table.c.visit_id.in_(visit_ids), table.c.visit_date.in_(visit_dates))
+        ).all() if visit_ids else []))
+    records = models.VaccinationRecord.__table__
+    cascaded.append((records, db.execute(select(records).where(records.c.patient_id == patient.id)).all()))
+
+    sibling_ids = {row.sibling_id for row in link_rows if row.patient_id == patient.id}
+    bump_patient_version(db, sibling_ids)
+
+    # 3. Delete with one statement: visits, dispensations, attachments and sibling
+    # links go with it (ON DELETE CASCADE). Attachment files are queued in
+    # storage_cleanup by a trigger and deleted by the job worker's reaper.
+    audit.record(db, "patients", patient.id, "delete", audit.snapshot(patient), patient_id=patient.id)
+    for table, rows in cascaded:
+        audit.record_cascade(db, table, rows, patient.id)
+    db.add(models.PatientTombstone(patient_id=patient.id)) # for synced terminals
+    db.flush()
+    db.execute(delete(models.Patient).where(models.Patient.id == patient.id))
+    reports.refresh_daily_takings(db, visit_dates)
+    db.commit()
 
-    # 2. CLEANUP: Delete physical files associated with this patient
-    try:
-        for visit in patient.visits:
-            for attachment in visit.attachments:
-                # Use the storage helper we created earlier to delete from Disk or GCP
-                await storage.delete_file(attachment.file_path)
-    except Exception as e:
-        print(f"Warning: Error cleaning up files for patient {patient_id}: {e}")
-        # Continue execution - still delete the DB record even if file deletion fails.
-
-    # 3. CLEANUP: Remove sibling links manually
+    return {"status": "success", "message": f"Patient {patient_name} and all associated records deleted."}
+
+@router.post("/api/patients/{patient_id}/merge/{duplicate_id}", response_model=schemas.MergeResult)
+def merge_patients(patient_id: UUID, duplicate_id: UUID, db: Session = Depends(database.get_db)):
+    """
+    Folds a duplicate registration into patient_id, in one transaction:
+    visits and vaccination records move over, sibling networks are joined,
+    empty fields are filled from the duplicate, and the duplicate is deleted.
+    """
+    if patient_id == duplicate_id:
+        raise HTTPException(status_code=400, detail="Cannot merge a patient into itself")
+
+    # Lock both rows so a concurrent edit or merge can't interleave
+    records = {
+        p.id: p for p in db.query(models.Patient)
+        .filter(models.Patient.id.in_([patient_id, duplicate_id]))
+        .with_for_update()
+        .all()
+    }
+    keep, duplicate = records.get(patient_id), records.get(duplicate_id)
+    if not keep or not duplicate:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    # 1. Fill gaps in the kept record
+    fields_filled = duplicates.merge_fields(keep, duplicate)
+
+    # 2. Re-parent visits (attachments and dispensations hang off the visit)
+    moved_visit_ids = db.execute(
+        update(models.Visit)
+        .where(models.Visit.patient_id == duplicate_id)
+        .values(patient_id=patient_id)
+        .returning(models.Visit.visit_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    visits_moved = len(moved_visit_ids)
+    for moved_visit_id in moved_visit_ids:
+        audit.record(db, "visits", moved_visit_id, "update", {"patient_id": [duplicate_id, patient_id]},
+                     patient_id=patient_id, visit_id=moved_visit_id)
+
+    # 3. Re-parent vaccination records; where both have the same dose, the kept patient's stands
+    kept_doses = (
+        db.query(models.VaccinationRecord.vaccine, models.VaccinationRecord.dose)
+        .filter(models.VaccinationRecord.patient_id == patient_id)
+    )
+    db.execute(
+        delete(models.VaccinationRecord)
+        .where(models.VaccinationRecord.patient_id == duplicate_id)
+        .where(tuple_(models.VaccinationRecord.vaccine, models.VaccinationRecord.dose).in_(kept_doses))
+        .execution_options(synchronize_session=False)
+    )
+    moved_record_ids = db.execute(
+        update(models.VaccinationRecord)
+        .where(models.VaccinationRecord.patient_id == duplicate_id)
+        .values(patient_id=patient_id)
+        .returning(models.VaccinationRecord.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    for record_id in moved_record_ids:
+        audit.record(db, "vaccination_records", record_id, "update", {"patient_id": [duplicate_id, patient_id]},
+                     patient_id=patient_id)
+
+    # 4. Join both sibling networks, then drop the duplicate's links
+    family_ids = duplicates.sibling_ids_of(db, [patient_id, duplicate_id]) - {patient_id, duplicate_id}
     db.execute(models.patient_siblings.delete().where(
         or_(
-            models.patient_siblings.c.patient_id == patient_id,
-            models.patient_siblings.c.sibling_id == patient_id
+            models.patient_siblings.c.patient_id == duplicate_id,
+            models.patient_siblings.c.sibling_id == duplicate_id
         )
     ))
+    network_ids = [patient_id, *family_ids]
+    create_sibling_links(db, [
+        (member_a, member_b)
+        for i, member_a in enumerate(network_ids)
+        for member_b in network_ids[i + 1:]
+    ])
+
+    # 5. Remove the duplicate (leaving a tombstone for synced terminals)
+    bump_patient_version(db, network_ids)
+    db.flush()
+    duplicates.store_keys(db, keep)
+    db.add(models.PatientTombstone(patient_id=duplicate_id))
+    db.delete(duplicate)
+    db.commit()
+
+    return {
+        "patient_id": patient_id,
+        "merged_patient_id": duplicate_id,
+        "visits_moved": visits_moved,
+        "siblings_linked": len(family_ids),
+        "fields_filled": fields_filled,
+        "vaccinations_moved": len(moved_record_ids),
+    }
+
+@router.get("/api/patients/{patient_id}/history", response_model=List[schemas.AuditEntry])
+def get_patient_history(
+    patient_id: UUID,
+    limit: int = Query(100, ge=1, le=500),
+    before_id: Optional[int] = None, # page backwards: pass the last entry's id
+    db: Session = Depends(database.get_read_db)
+):
+    """Audit entries for the patient, their visits and their dispensations, newest first."""
+    # Visits filed under the patient at any point, including deleted or merged-in ones
+    visit_ids = (
+        db.query(models.AuditLog.visit_id)
+        .filter(models.AuditLog.patient_id == patient_id, models.AuditLog.visit_id.isnot(None))
+        .union(db.query(models.Visit.visit_id).filter(models.Visit.patient_id == patient_id))
+    )
+    query = db.query(models.AuditLog).filter(or_(
+        models.AuditLog.patient_id == patient_id,
+        models.AuditLog.visit_id.in_(visit_ids)
+    ))
+    if before_id is not None:
+        query = query.filter(models.AuditLog.id < before_id)
+    return query.order_by(models.AuditLog.id.desc()).limit(limit).all()
+
+# --- VACCINATIONS ---
+
+@router.get("/api/patients/{patient_id}/vaccinations", response_model=schemas.VaccinationCard)
+def get_patient_vaccinations(
+    patient_id: UUID,
+    as_of: Optional[date] = None,
+    db: Session = Depends(database.get_read_db)
+):
+    """Recorded doses, and each scheduled dose with its status (given / upcoming / due / overdue / missed)."""
+    patient = (
+        db.query(models.Patient)
+        .options(load_only(models.Patient.id, models.Patient.date_of_birth))
+        .filter(models.Patient.id == patient_id)
+        .first()
+    )
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    import vaccinations  # NumPy is loaded on first use
+    return vaccinations.patient_card(db, patient, as_of or date.today())
+
+@router.post("/api/patients/{patient_id}/vaccinations", response_model=schemas.VaccinationRecord)
+def record_vaccination(
+    patient_id: UUID,
+    record: schemas.VaccinationRecordCreate,
+    db: Session = Depends(database.get_db)
+):
+    if db.query(models.Patient.id).filter(models.Patient.id == patient_id).scalar() is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
 
-    # 4. Delete the Patient Record
-    db.delete(patient)
+    existing = db.query(models.VaccinationRecord.id).filter(
+        models.VaccinationRecord.patient_id == patient_id,
+        models.VaccinationRecord.vaccine == record.vaccine,
+        models.VaccinationRecord.dose == record.dose
+    ).scalar()
+    if existing is not None:
+        raise HTTPException(
+            status_code=409, detail=f"{record.vaccine} dose {record.dose} is already recorded for this patient"
+        )
+
+    db_record = models.VaccinationRecord(patient_id=patient_id, **record.dict())
+    db.add(db_record)
+    db.commit()
+    db.refresh(db_record)
+    return db_record
+
+@router.delete("/api/vaccinations/{record_id}")
+def delete_vaccination(record_id: int, db: Session = Depends(database.get_db)):
+    db_record = db.query(models.VaccinationRecord).filter(models.VaccinationRecord.id == record_id).first()
+    if not db_record:
+        raise HTTPException(status_code=404, detail="Vaccination record not found")
+    db.delete(db_record)
     db.commit()
+    return {"status": "deleted"}
 
-    return {"status": "success", "message": f"Patient {patient.name} and all associated records deleted."}
+@router.get("/api/vaccinations/schedule", response_model=List[schemas.ScheduleDose])
+def get_vaccination_schedule(db: Session = Depends(database.get_read_db)):
+    import vaccinations
+    return vaccinations.load_schedule(db)
+
+@router.put("/api/vaccinations/schedule", response_model=List[schemas.ScheduleDose])
+def update_vaccination_schedule(payload: schemas.ScheduleUpdate, db: Session = Depends(database.get_db)):
+    """Replaces the whole schedule (admin PIN). Recorded doses are kept as they are."""
+    require_admin_pin(db, payload.pin)
+    keys = [(d.vaccine, d.dose) for d in payload.doses]
+    if len(set(keys)) != len(keys):
+        raise HTTPException(status_code=400, detail="Each vaccine dose can only appear once in the schedule")
+
+    db.execute(delete(models.VaccinationScheduleDose))
+    db.add_all([models.VaccinationScheduleDose(**d.dict()) for d in payload.doses])
+    db.commit()
 
-@app.post("/api/patients/{patient_id}/siblings/{sibling_id}")
+    import vaccinations
+    return vaccinations.load_schedule(db)
+
+@router.post("/api/patients/{patient_id}/siblings/{sibling_id}")
 def link_sibling(patient_id: UUID, sibling_id: UUID, db: Session = Depends(database.get_db)):
     if patient_id == sibling_id:
         raise HTTPException(status_code=400, detail="Cannot be own sibling")
 
-    # 1. Fetch the main patient to find their EXISTING network
-    patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
-    if not patient:
+    # 1. Check the main patient exists (ids only: no need to load the rows)
+    if db.query(models.Patient.id).filter(models.Patient.id == patient_id).scalar() is None:
         raise HTTPException(status_code=404, detail="Patient not found")
 
     # 2. Get list of all IDs in the current 'clique' (Patient + their existing siblings)
     # We include patient_id itself because the new sibling needs to link to the patient too.
-    existing_family_ids = [s.id for s in patient.siblings]
+    existing_family_ids = list(duplicates.sibling_ids_of(db, [patient_id]))
     existing_family_ids.append(patient_id)
 
-    # 3. Link the NEW sibling to EVERYONE in that list
-    for family_member_id in existing_family_ids:
-        # Skip if we are trying to link the sibling to themselves
-        if family_member_id == sibling_id:
-            continue
-            
-        create_sibling_link(db, family_member_id, sibling_id)
+    # 3. Link the NEW sibling to EVERYONE in that list (self-links are skipped)
+    create_sibling_links(db, [(family_member_id, sibling_id) for family_member_id in existing_family_ids])
 
+    bump_patient_version(db, existing_family_ids + [sibling_id])
     db.commit()
     return {"status": "linked_to_network"}
 
-@app.delete("/api/patients/{patient_id}/siblings/{sibling_id}")
+@router.delete("/api/patients/{patient_id}/siblings/{sibling_id}")
 def unlink_sibling(patient_id: UUID, sibling_id: UUID, db: Session = Depends(database.get_db)):
     """
     Removes the sibling from the Patient, AND from all of the Patient's other siblings.
     Essentially removes 'sibling_id' from this specific family cluster.
     """
     
-    # 1. Fetch the patient to identify the group
-    patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
-    if not patient:
+    # 1. Check the patient exists
+    if db.query(models.Patient.id).filter(models.Patient.id == patient_id).scalar() is None:
         raise HTTPException(status_code=404, detail="Patient not found")
 
     # 2. Identify the group: The patient + all their siblings
     # We want to break the link between 'sibling_id' and ANYONE in this group
-    group_ids = [s.id for s in patient.siblings]
+    group_ids = list(duplicates.sibling_ids_of(db, [patient_id]))
     group_ids.append(patient_id)
+    members = [member_id for member_id in group_ids if member_id != sibling_id]
 
     # 3. Execute Deletions
     # Remove links where one side is the sibling_id and the other is in the group
-    for member_id in group_ids:
-        if member_id == sibling_id: 
-            continue
-
-        # Remove Member -> Sibling
-        db.execute(models.patient_siblings.delete().where(
-            (models.patient_siblings.c.patient_id == member_id) & 
-            (models.patient_siblings.c.sibling_id == sibling_id)
-        ))
-        
-        # Remove Sibling -> Member
-        db.execute(models.patient_siblings.delete().where(
-            (models.patient_siblings.c.patient_id == sibling_id) & 
-            (models.patient_siblings.c.sibling_id == member_id)
-        ))
-
+    if members:
+        db.execute(models.patient_siblings.delete().where(or_(
+            # Member -> Sibling
+            (models.patient_siblings.c.patient_id.in_(members)) & (models.patient_siblings.c.sibling_id == sibling_id),
+            # Sibling -> Member
+            (models.patient_siblings.c.patient_id == sibling_id) & (models.patient_siblings.c.sibling_id.in_(members)),
+        )))
+
+    bump_patient_version(db, group_ids + [sibling_id])
     db.commit()
     return {"status": "unlinked_from_network"}
 
-@app.get("/api/patients/next-id/{prefix}")
+@router.get("/api/patients/next-id/{prefix}")
 def get_next_id(prefix: str, db: Session = Depends(database.get_db)):
     # Calculate length to strip the prefix (e.g., "P" is len 1, so start at index 2)
     # Note: SQL substring is 1-indexed usually, but let's be safe with logic
@@ -324,8 +738,42 @@ def get_next_id(prefix: str, db: Session = Depends(database.get_db)):
         "next_suggestion": f"{prefix.upper()}{next_num}"
     }
 
-@app.post("/api/visits/", response_model=schemas.Visit)
-def create_visit(visit: schemas.VisitCreate, db: Session = Depends(database.get_db)):
+#####################################################
+# --- Dispensation Checks ---
+#####################################################
+
+@router.post("/api/dispensations/check", response_model=schemas.DispensationCheck)
+def check_dispensations(request: schemas.DispensationCheckRequest, db: Session = Depends(database.get_db)):
+    # Called as the doctor types each medicine line: one PK lookup, one partition-pruned range scan
+    window_days = request.window_days if request.window_days is not None else medication_checks.DEFAULT_WINDOW_DAYS
+    result = medication_checks.check_visit(
+        db, request.patient_id, request.medicines, request.date, window_days, exclude_visit_id=request.visit_id
+    )
+    if result is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return result
+
+def ensure_no_allergy_conflicts(db: Session, patient_id, on: date, medicines: List[str]):
+    # Repeats and related-class warnings were shown while typing; only allergies stop a save
+    if not medicines:
+        return
+    result = medication_checks.check_visit(db, patient_id, medicines, on, window_days=0)
+    alerts = medication_checks.blocking_alerts(result)
+    if alerts:
+        raise HTTPException(status_code=409, detail=jsonable_encoder({
+            "message": "Possible allergy conflict",
+            "alerts": alerts,
+        }))
+
+@router.post("/api/visits/", response_model=schemas.Visit)
+def create_visit(
+    visit: schemas.VisitCreate,
+    allow_allergy_conflict: bool = False, # set after the doctor has reviewed the 409 alerts
+    db: Session = Depends(database.get_db)
+):
+    if not allow_allergy_conflict:
+        ensure_no_allergy_conflicts(db, visit.patient_id, visit.date, [d.medicine_name for d in visit.dispensations])
+
     # 1. Separate dispensations from the main visit data
     visit_data = visit.dict()
     dispensations_data = visit_data.pop("dispensations", [])
@@ -333,13 +781,13 @@ def create_visit(visit: schemas.VisitCreate, db: Session = Depends(database.get_
     # 2. Create the Visit Record
     db_visit = models.Visit(**visit_data)
     db.add(db_visit)
-    db.commit()
-    db.refresh(db_visit)
+    db.flush() # assigns visit_id; committed together with the rest below
 
     # 3. Create Dispensation Records linked to this Visit
     for item in dispensations_data:
         db_dispensation = models.DispensationItem(
             visit_id=db_visit.visit_id,
+            visit_date=db_visit.date, # partition key, copied from the visit
             medicine_name=item['medicine_name'],
             instructions=item.get('instructions'),
             quantity=item['quantity'],
@@ -347,13 +795,47 @@ def create_visit(visit: schemas.VisitCreate, db: Session = Depends(database.get_
             is_dispensed=item.get('is_dispensed', True)
         )
         db.add(db_dispensation)
-    
+
+    bump_patient_version(db, [db_visit.patient_id])
+    reports.refresh_daily_takings(db, [db_visit.date])
     db.commit()
     db.refresh(db_visit)
-    return db_visit
+    return serialization.model_response(schemas.Visit, db_visit)
+
+@router.get("/api/visits/{visit_id}", response_model=schemas.Visit)
+def get_visit(
+    visit_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_read_db)
+):
+    # Visits share their patient's version: any visit change bumps it
+    version = (
+        db.query(models.Patient.version)
+        .join(models.Visit, models.Visit.patient_id == models.Patient.id)
+        .filter(models.Visit.visit_id == visit_id)
+        .scalar()
+    )
+    if version is None:
+        raise HTTPException(status_code=404, detail="Visit not found")
+
+    etag = make_etag("visit", visit_id, version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    db_visit = db.query(models.Visit).filter(models.Visit.visit_id == visit_id).first()
+    if not db_visit:
+        raise HTTPException(status_code=404, detail="Visit not found")
 
-@app.put("/api/visits/{visit_id}")
-def update_visit(visit_id: int, visit_update: schemas.VisitUpdate, db: Session = Depends(database.get_db)):
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    return serialization.model_response(schemas.Visit, db_visit, headers=headers)
+
+@router.put("/api/visits/{visit_id}", response_model=schemas.Visit)
+def update_visit(
+    visit_id: int,
+    visit_update: schemas.VisitUpdate,
+    allow_allergy_conflict: bool = False, # set after the doctor has reviewed the 409 alerts
+    db: Session = Depends(database.get_db)
+):
     # 1. Find the visit in the database
     db_visit = db.query(models.Visit).filter(models.Visit.visit_id == visit_id).first()
     
@@ -361,7 +843,17 @@ def update_visit(visit_id: int, visit_update: schemas.VisitUpdate, db: Session =
     if not db_visit:
         raise HTTPException(status_code=404, detail="Visit not found")
 
+    # Loaded before the date changes: the relationship joins on the visit date too
+    existing_items = list(db_visit.dispensations)
+
+    # Only lines added in this edit: ones already saved were checked (or overridden) then
+    if not allow_allergy_conflict:
+        saved_names = {item.medicine_name for item in existing_items}
+        added = [d.medicine_name for d in visit_update.dispensations if d.medicine_name not in saved_names]
+        ensure_no_allergy_conflicts(db, db_visit.patient_id, visit_update.date, added)
+
     # 3. Update basic fields
+    previous_date = db_visit.date
     db_visit.date = visit_update.date
     db_visit.time = visit_update.time
     db_visit.weight = visit_update.weight
@@ -380,14 +872,16 @@ def update_visit(visit_id: int, visit_update: schemas.VisitUpdate, db: Session =
     db_visit.mc_end_date = visit_update.mc_end_date     
 
     # 4. Handle Dispensations (Full Replace Strategy)
-    # A. Delete existing items for this visit
-    db.query(models.DispensationItem).filter(models.DispensationItem.visit_id == visit_id).delete()
+    # A. Delete existing items for this visit (through the session, so the audit log sees them)
+    for existing_item in existing_items:
+        db.delete(existing_item)
     
     # B. Add the new list
     if visit_update.dispensations:
         for item in visit_update.dispensations:
             new_item = models.DispensationItem(
                 visit_id=visit_id,
+                visit_date=db_visit.date,
                 medicine_name=item.medicine_name,
                 instructions=item.instructions,
                 quantity=item.quantity,
@@ -396,60 +890,105 @@ def update_visit(visit_id: int, visit_update: schemas.VisitUpdate, db: Session =
             )
             db.add(new_item)
 
+    bump_patient_version(db, [db_visit.patient_id])
+    reports.refresh_daily_takings(db, [previous_date, db_visit.date])
     db.commit()
     db.refresh(db_visit)
     
-    return db_visit
+    return serialization.model_response(schemas.Visit, db_visit)
 
-@app.delete("/api/visits/{visit_id}")
-async def delete_visit(visit_id: int, db: Session = Depends(database.get_db)):
+@router.delete("/api/visits/{visit_id}")
+def delete_visit(visit_id: int, db: Session = Depends(database.get_db)):
     # 1. Find the visit
     db_visit = db.query(models.Visit).filter(models.Visit.visit_id == visit_id).first()
     
     if not db_visit:
         raise HTTPException(status_code=404, detail="Visit not found")
-    
-    # 2. Delete physical files (Local or GCP)
-    if db_visit.attachments:
-        for attachment in db_visit.attachments:
-            try:
-                await storage.delete_file(attachment.file_path)
-            except Exception as e:
-                print(f"Error deleting file {attachment.file_path}: {e}")
-
-    # 4. Delete and commit
+
+    # 2. Delete and commit. Dispensations and attachments cascade in the database;
+    # attachment files are queued in storage_cleanup and deleted by the reaper.
+    bump_patient_version(db, [db_visit.patient_id])
     db.delete(db_visit)
+    reports.refresh_daily_takings(db, [db_visit.date])
     db.commit()
     
     return {"detail": "Visit and attachments deleted successfully"}
 
-# Mount uploads folder for local dev
-os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+@router.get("/api/visits/{visit_id}/history", response_model=List[schemas.AuditEntry])
+def get_visit_history(
+    visit_id: int,
+    limit: int = Query(100, ge=1, le=500),
+    before_id: Optional[int] = None,
+    db: Session = Depends(database.get_read_db)
+):
+    """Audit entries for the visit and its dispensations, newest first."""
+    query = db.query(models.AuditLog).filter(models.AuditLog.visit_id == visit_id)
+    if before_id is not None:
+        query = query.filter(models.AuditLog.id < before_id)
+    return query.order_by(models.AuditLog.id.desc()).limit(limit).all()
+
+# --- Printed documents (ReportLab is loaded on the first PDF request) ---
+
+def pdf_response(output, filename: str) -> StreamingResponse:
+    # Inline, so the browser opens its viewer ready to print
+    return StreamingResponse(
+        output,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"inline; filename={filename}"}
+    )
+
+@router.get("/api/visits/{visit_id}/receipt.pdf")
+def print_visit_receipt(visit_id: int, db: Session = Depends(database.get_read_db)):
+    db_visit = reports.printable_visit(db, visit_id)
+    if not db_visit:
+        raise HTTPException(status_code=404, detail="Visit not found")
+
+    import pdf_reports
+    output = pdf_reports.receipt_pdf(db_visit)
+    return pdf_response(output, f"receipt_{db_visit.receipt_number or visit_id}.pdf")
+
+@router.get("/api/visits/{visit_id}/mc.pdf")
+def print_visit_mc(visit_id: int, db: Session = Depends(database.get_read_db)):
+    db_visit = reports.printable_visit(db, visit_id)
+    if not db_visit:
+        raise HTTPException(status_code=404, detail="Visit not found")
+
+    import pdf_reports
+    if not pdf_reports.has_mc(db_visit):
+        raise HTTPException(status_code=404, detail="No MC was given at this visit")
+    output = pdf_reports.mc_pdf(db_visit)
+    return pdf_response(output, f"mc_{visit_id}.pdf")
 
-@app.post("/api/visits/{visit_id}/upload")
+@router.post("/api/visits/{visit_id}/upload")
 async def upload_attachment(
     visit_id: int, 
     file: UploadFile = File(...), 
     db: Session = Depends(database.get_db)
 ):
+    # The visit date is part of the key attachments reference
+    visit_date = db.query(models.Visit.date).filter(models.Visit.visit_id == visit_id).scalar()
+    if visit_date is None:
+        raise HTTPException(status_code=404, detail="Visit not found")
+
     # 1. Save file physically (Local or Cloud)
     stored_path = await storage.save_file(file, visit_id)
 
     # 2. Save metadata to DB
     attachment = models.VisitAttachment(
         visit_id=visit_id,
+        visit_date=visit_date,
         file_path=stored_path,
         file_type=file.content_type,
         original_filename=file.filename
     )
     db.add(attachment)
+    bump_patient_version_for_visit(db, visit_id)
     db.commit()
 
     return {"status": "success", "path": stored_path}
 
-@app.delete("/api/attachments/{attachment_id}")
-async def delete_visit_attachment(
+@router.delete("/api/attachments/{attachment_id}")
+def delete_visit_attachment(
     attachment_id: int, 
     db: Session = Depends(database.get_db)
 ):
@@ -459,65 +998,26 @@ async def delete_visit_attachment(
     if not attachment:
         raise HTTPException(status_code=404, detail="Attachment not found")
 
-    # 2. Delete the physical file (using our storage helper)
-    await storage.delete_file(attachment.file_path)
-
-    # 3. Delete the DB record
+    # 2. Delete the DB record (a trigger queues the file for the reaper, so it
+    # is only removed once this commits)
+    bump_patient_version_for_visit(db, attachment.visit_id)
     db.delete(attachment)
     db.commit()
     
     return {"status": "deleted"}
 
-@app.get("/api/reports/dispensations/export-csv")
+@router.get("/api/reports/dispensations/export-csv")
 def export_dispensations_csv(
     start_date: date,
     end_date: date,
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
-    # 1. Query: Join Visits -> Patients -> Dispensations
-    # We filter by visit date and ensure there are dispensations
-    query = (
-        db.query(models.Visit)
-        .join(models.Patient)
-        .join(models.DispensationItem)
-        .filter(models.Visit.date >= start_date)
-        .filter(models.Visit.date <= end_date)
-        .order_by(models.Visit.date, models.Visit.time)
-    )
-    
-    visits = query.all()
+    visits = reports.dispensation_log(db, start_date, end_date)
 
-    # 2. Prepare CSV in memory
     output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header Row
-    writer.writerow([
-        "Date", 
-        "Time", 
-        "Patient Name", 
-        "Patient Address", 
-        "Medicine", 
-        "Instructions", 
-        "Quantity"
-    ])
+    reports.write_dispensation_csv(visits, output)
 
-    # 3. Write Data Rows
-    count = 0
-    for visit in visits:
-        for disp in visit.dispensations:
-            writer.writerow([
-                visit.date,
-                visit.time,
-                visit.patient.name,
-                visit.patient.address,
-                disp.medicine_name,
-                disp.instructions or "",
-                disp.quantity
-            ])
-            count += 1
-            
-    # 4. Return as a file download
+    # Return as a file download
     output.seek(0)
     filename = f"medication_log_{start_date}_to_{end_date}.csv"
     
@@ -527,132 +1027,274 @@ def export_dispensations_csv(
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
-@app.get("/api/reports/dispensations/export-pdf")
+@router.get("/api/reports/dispensations/export-pdf")
 def export_dispensations_pdf(
     start_date: date,
     end_date: date,
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_read_db)
 ):
-    # 1. Query Data
-    visits = (
-        db.query(models.Visit)
-        .join(models.Patient)
-        .join(models.DispensationItem)
-        .filter(models.Visit.date >= start_date)
-        .filter(models.Visit.date <= end_date)
-        .order_by(models.Visit.date, models.Visit.time)
-        .all()
-    )
+    visits = reports.dispensation_log(db, start_date, end_date)
 
-    # 2. Setup PDF Buffer
-    output = io.BytesIO()
-    doc = SimpleDocTemplate(
-        output, 
-        pagesize=landscape(A4), # Landscape gives more width for tables
-        rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30
-    )
-    
-    # 3. Prepare Content
-    elements = []
-    styles = getSampleStyleSheet()
+    # Render (ReportLab is loaded on the first PDF request)
+    import pdf_reports
+    output = pdf_reports.dispensation_log_pdf(visits, start_date, end_date)
     
-    # Title
-    title = Paragraph(f"Medication Dispensation Log: {start_date} to {end_date}", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 20)) # Space between title and table
+    filename = f"medication_log_{start_date}_to_{end_date}.pdf"
+    return StreamingResponse(
+        output,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.get("/api/reports/receipts/export-pdf")
+def export_receipts_pdf(day: date, db: Session = Depends(database.get_read_db)):
+    """Every receipt issued on `day`, one per page, for printing in one go."""
+    visits = reports.receipts_for_day(db, day)
+
+    import pdf_reports
+    output = pdf_reports.receipts_pdf(visits, day)
+    return pdf_response(output, f"receipts_{day}.pdf")
+
+@router.get("/api/reports/finance")
+def get_finance_report(
+    start_date: date,
+    end_date: date,
+    group_by: str = Query("day", pattern="^(day|month)$"),
+    receipts: bool = False, # also check receipt numbers (reads the range's visits)
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Takings per day/month by payment method (from the daily_takings aggregate),
+    plus missing, duplicate and skipped receipt numbers in the range if asked for.
+    """
+    return reports.finance_report(db, start_date, end_date, group_by, receipts)
+
+@router.get("/api/reports/finance/export-csv")
+def export_finance_csv(
+    start_date: date,
+    end_date: date,
+    group_by: str = Query("day", pattern="^(day|month)$"),
+    receipts: bool = False,
+    db: Session = Depends(database.get_read_db)
+):
+    report = reports.finance_report(db, start_date, end_date, group_by, receipts)
+
+    output = io.StringIO()
+    reports.write_finance_csv(report, output)
 
-    # Table Header
-    data = [['Date', 'Patient Name', 'Address', 'Medications']]
-    
-    # Table Body
-    for visit in visits:
-        # Format Medications: Combine all meds for this visit into one cell, separated by newlines
-        med_list = []
-        for d in visit.dispensations:
-            # e.g., "• Paracetamol (tds) - 20"
-            med_text = f"• {d.medicine_name} {d.instructions or '-'} ({d.quantity})"
-            med_list.append(med_text)
-        
-        # Join with <br/> because we are using the Paragraph object which understands HTML-like tags
-        meds_string = "<br/>".join(med_list)
-
-        # We use Paragraph() for Address and Meds to enable text wrapping
-        row = [
-            str(visit.date),
-            Paragraph(visit.patient.name, styles['BodyText']),
-            Paragraph(visit.patient.address, styles['BodyText']),
-            Paragraph(meds_string, styles['BodyText'])
-        ]
-        data.append(row)
-
-    # 4. Configure Table Layout
-    # Column widths: Date(10%), Name(15%), Address(35%), Meds(40%)
-    # Landscape A4 width is approx 11.7 inches. Let's use ~10.5 inches total.
-    col_widths = [1.0*inch, 1.8*inch, 3.7*inch, 4.0*inch]
-    
-    table = Table(data, colWidths=col_widths)
-    
-    # 5. Styling the Table (Grid, Colors, Fonts)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),       # Header background
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),  # Header text color
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),                # Alignment
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),    # Header font
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),                # Align text to top of cell
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),      # Grid lines
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-
-    elements.append(table)
-
-    # 6. Build PDF
-    doc.build(elements)
     output.seek(0)
-    
-    filename = f"medication_log_{start_date}_to_{end_date}.pdf"
+    filename = f"takings_{start_date}_to_{end_date}.csv"
+    return StreamingResponse(
+        iter([output.getvalue()]),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.get("/api/reports/finance/export-pdf")
+def export_finance_pdf(
+    start_date: date,
+    end_date: date,
+    group_by: str = Query("day", pattern="^(day|month)$"),
+    receipts: bool = False,
+    db: Session = Depends(database.get_read_db)
+):
+    report = reports.finance_report(db, start_date, end_date, group_by, receipts)
+
+    import pdf_reports
+    output = pdf_reports.finance_report_pdf(report, start_date, end_date)
+
+    filename = f"takings_{start_date}_to_{end_date}.pdf"
     return StreamingResponse(
         output,
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
-# --- Startup Event: Set Default PIN ---
-@app.on_event("startup")
-def initialize_settings():
-    db = database.SessionLocal()
+@router.get("/api/sync/changes", response_model=schemas.ChangeFeed)
+def get_sync_changes(
+    since: Optional[str] = None,
+    limit: int = Query(sync.DEFAULT_PAGE_SIZE, ge=1, le=sync.MAX_PAGE_SIZE),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Incremental feed for terminals that keep a local patient index.
+    First call without `since`; then pass back the returned `cursor`
+    (repeat immediately while `has_more` is true).
+    """
     try:
-        # Check if PIN exists
-        pin_config = db.query(models.SystemConfig).filter(models.SystemConfig.key == "admin_pin").first()
-        
-        if not pin_config:
-            # Get default from Docker Env or use "000000"
-            default_pin = os.getenv("INITIAL_ADMIN_PIN", "000000")
-            hashed_pin = get_password_hash(default_pin)
-            
-            new_config = models.SystemConfig(key="admin_pin", value=hashed_pin)
-            db.add(new_config)
-            db.commit()
-            print(f"--- SYSTEM: Admin PIN initialized to default ({default_pin}) ---")
-    finally:
-        db.close()
+        feed = sync.get_changes(db, since, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+    return serialization.model_response(schemas.ChangeFeed, feed)
+
+@router.get("/api/sync/events")
+async def stream_sync_events(
+    patient_id: Optional[List[UUID]] = Query(None, max_length=events.MAX_PATIENT_FILTER)
+):
+    """
+    Live changes as server-sent events, one JSON `data:` line per change, e.g.
+    {"entity": "visit", "action": "update", "patient_id": "...", "visit_id": 123}
+    (entities: patient, visit (incl. its dispensations), attachment). Pass
+    patient_id (repeatable) to only hear about those patients. `event: resync`
+    means changes were missed: refetch whatever is on screen.
+    """
+    try:
+        subscriber = events.hub.subscribe({str(p) for p in patient_id} if patient_id else None)
+    except events.TooManyClients:
+        raise HTTPException(
+            status_code=503, detail="Too many live update streams on this worker",
+            headers={"Retry-After": str(events.RETRY_MS // 1000)}
+        )
+    return StreamingResponse(
+        events.hub.stream(subscriber),
+        media_type="text/event-stream",
+        # No caching, and no buffering by a reverse proxy (nginx)
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-@app.post("/api/admin/verify-pin")
+@router.get("/api/reports/growth-alerts")
+def get_growth_alerts(min_lines: int = Query(2, ge=1), db: Session = Depends(database.get_read_db)):
+    """
+    Patients whose latest weight crossed `min_lines` or more centile lines since
+    the previous visit, computed across the whole registry in one pass.
+    """
+    import growth  # NumPy is loaded on first use
+    alerts = growth.centile_crossing_alerts(db, min_lines)
+    return {"count": len(alerts), "alerts": alerts}
+
+@router.get("/api/reports/vaccinations/due", response_model=schemas.DueList)
+def get_vaccinations_due(
+    as_of: Optional[date] = None,
+    due_from: Optional[date] = None,
+    due_to: Optional[date] = None,
+    status: Optional[str] = Query(None, description="Comma-separated: upcoming, due, overdue (default: all three)"),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(database.get_read_db)
+):
+    """
+    Scheduled doses not yet given whose due date falls in [due_from, due_to],
+    soonest first. Without due_from, anything still outstanding is included;
+    due_to defaults to 30 days after as_of (today).
+    """
+    import vaccinations  # NumPy is loaded on first use
+    as_of = as_of or date.today()
+    due_to = due_to or as_of + timedelta(days=vaccinations.DEFAULT_WINDOW_DAYS)
+    if due_from is not None and due_from > due_to:
+        raise HTTPException(status_code=400, detail="due_from must not be after due_to")
+
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else list(vaccinations.LISTABLE)
+    unknown = sorted(set(statuses) - set(vaccinations.LISTABLE))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown status: {', '.join(unknown)}. Available: {', '.join(vaccinations.LISTABLE)}"
+        )
+    return vaccinations.due_list(db, as_of, due_from, due_to, statuses, limit)
+
+# --- BACKGROUND JOBS (run by worker.py) ---
+
+@router.post("/api/jobs", response_model=schemas.JobStatus, status_code=202)
+def create_job(payload: schemas.JobCreate, db: Session = Depends(database.get_db)):
+    """Queues a report/backup/cleanup job; poll GET /api/jobs/{id}, then download its result."""
+    spec = jobs.TASKS.get(payload.kind)
+    if spec is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind. Available: {', '.join(sorted(jobs.TASKS))}")
+    if spec.admin:
+        require_admin_pin(db, payload.pin)
+
+    params = jsonable_encoder(payload.params)
+    try:
+        jobs.check_params(payload.kind, params)
+    except jobs.BadParams as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = jobs.enqueue(db, payload.kind, params, max(0, min(payload.priority, 1000)))
+    db.commit()
+    db.refresh(job)
+    return job
+
+def get_job_or_404(db: Session, job_id: int, pin: Optional[str]) -> models.Job:
+    """The job, after checking the admin PIN for admin kinds (backups, snapshots)."""
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    spec = jobs.TASKS.get(job.kind)
+    if spec is not None and spec.admin:
+        require_admin_pin(db, pin)
+    return job
+
+# Left out of listings made without the admin PIN
+ADMIN_JOB_REDACTED = {"has_result": False, "result_filename": None, "error": None, "progress_message": None}
+
+@router.get("/api/jobs", response_model=List[schemas.JobStatus])
+def list_jobs(
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    pin: str = None,
+    db: Session = Depends(database.get_db)
+):
+    """Newest first. Admin jobs show their results only when `pin` is given."""
+    if pin:
+        require_admin_pin(db, pin)
+    query = db.query(models.Job)
+    if status:
+        query = query.filter(models.Job.status == status)
+    if kind:
+        query = query.filter(models.Job.kind == kind)
+    job_list = query.order_by(models.Job.id.desc()).limit(limit).all()
+    if pin:
+        return job_list
+    admin_kinds = {kind for kind, spec in jobs.TASKS.items() if spec.admin}
+    return [
+        schemas.JobStatus.model_validate(job).model_copy(update=ADMIN_JOB_REDACTED) if job.kind in admin_kinds else job
+        for job in job_list
+    ]
+
+@router.get("/api/jobs/{job_id}", response_model=schemas.JobStatus)
+def get_job(job_id: int, pin: str = None, db: Session = Depends(database.get_db)):
+    # Primary, not replica: progress must not appear to go backwards
+    return get_job_or_404(db, job_id, pin)
+
+@router.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: int, pin: str = None, db: Session = Depends(database.get_db)):
+    get_job_or_404(db, job_id, pin)
+    if not jobs.cancel(db, job_id):
+        raise HTTPException(status_code=409, detail="Only queued jobs can be cancelled")
+    db.commit()
+    return {"status": "cancelled"}
+
+@router.get("/api/jobs/{job_id}/result")
+def download_job_result(job_id: int, pin: str = None, db: Session = Depends(database.get_db)):
+    job = get_job_or_404(db, job_id, pin)
+    if job.status != "succeeded" or not job.has_result:
+        raise HTTPException(status_code=409, detail=f"No result available (job is {job.status})")
+
+    result = storage.open_job_result(job.result_location)
+
+    def chunks():
+        with result:
+            while chunk := result.read(64 * 1024):
+                yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type=job.result_media_type,
+        headers={"Content-Disposition": f"attachment; filename={job.result_filename}"}
+    )
+
+@router.post("/api/admin/verify-pin")
 def verify_admin_pin(payload: schemas.PinVerify, db: Session = Depends(database.get_db)):
-    pin_config = db.query(models.SystemConfig).filter(models.SystemConfig.key == "admin_pin").first()
-    if not pin_config:
-        raise HTTPException(status_code=500, detail="PIN not configured")
+    pin_config = get_admin_pin_config(db)
     
     if not verify_password(payload.pin, pin_config.value):
         raise HTTPException(status_code=401, detail="Incorrect PIN")
     
     return {"status": "valid"}
 
-@app.put("/api/admin/change-pin")
+@router.put("/api/admin/change-pin")
 def change_admin_pin(payload: schemas.PinUpdate, db: Session = Depends(database.get_db)):
-    pin_config = db.query(models.SystemConfig).filter(models.SystemConfig.key == "admin_pin").first()
+    pin_config = get_admin_pin_config(db)
     
     # 1. Verify Old PIN
     if not pin_config or not verify_password(payload.current_pin, pin_config.value):
@@ -665,7 +1307,7 @@ def change_admin_pin(payload: schemas.PinUpdate, db: Session = Depends(database.
 
 # --- GENERIC CONFIG ENDPOINTS ---
 
-@app.get("/api/config/{key}")
+@router.get("/api/config/{key}")
 def get_system_config(key: str, db: Session = Depends(database.get_db)):
     """
     Retrieves a config value. Returns a default if not found.
@@ -680,7 +1322,7 @@ def get_system_config(key: str, db: Session = Depends(database.get_db)):
     
     return {"key": key, "value": conf.value}
 
-@app.put("/api/config/{key}")
+@router.put("/api/config/{key}")
 def update_system_config(key: str, payload: schemas.ConfigUpdate, db: Session = Depends(database.get_db)):
     """
     Updates or Creates a config value.
@@ -699,86 +1341,186 @@ def update_system_config(key: str, payload: schemas.ConfigUpdate, db: Session =
     db.refresh(conf)
     return {"status": "updated", "key": key, "value": conf.value}
 
-@app.get("/api/system/backup")
+@router.get("/api/system/bulkheads")
+def get_bulkhead_stats():
+    """Per traffic class: limits, in-flight, queue depth, waits, rejections, and DB pool use."""
+    return {"classes": bulkheads.stats(), "pools": database.pool_stats()}
+
+@router.get("/api/system/slow-queries")
+def get_slow_queries(
+    pin: str = None,
+    limit: int = Query(50, ge=1, le=slow_queries.BUFFER_SIZE),
+    with_plan: bool = False,
+    db: Session = Depends(database.get_db)
+):
+    """
+    This worker's most recent slow statements (newest first), with sampled
+    EXPLAIN (ANALYZE, BUFFERS) plans. Empty unless SLOW_QUERY_MS is set.
+    """
+    require_admin_pin(db, pin)
+    return {"stats": slow_queries.stats(), "queries": slow_queries.recent(limit, with_plan)}
+
+@router.delete("/api/system/slow-queries")
+def clear_slow_queries(pin: str = None, db: Session = Depends(database.get_db)):
+    require_admin_pin(db, pin)
+    slow_queries.clear()
+    return {"detail": "Slow-query log cleared"}
+
+@router.get("/api/system/audit")
+def audit_writer_stats():
+    return audit.writer.stats()
+
+@router.get("/api/system/storage-cleanup")
+def get_storage_cleanup_stats(db: Session = Depends(database.get_db)):
+    """Files waiting to be deleted after their attachments were removed."""
+    return file_cleanup.stats(db)
+
+@router.get("/api/system/typeahead")
+def get_typeahead_stats():
+    """Size and freshness of this worker's typeahead index."""
+    return typeahead.index.stats()
+
+@router.get("/api/system/events")
+def get_event_stream_stats():
+    """Open live update streams on this worker and what has been sent to them."""
+    return events.hub.stats()
+
+@router.get("/api/system/backup")
 def download_database_backup(
-    background_tasks: BackgroundTasks, 
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     pin: str = None 
 ):
     """
     Generates a full database dump using the active database connection details.
     """    
-    if not pin:
-        raise HTTPException(status_code=401, detail="Admin PIN is required.")
-    
-    stored_config = db.query(models.SystemConfig).filter(models.SystemConfig.key == "admin_pin").first()
-    if not stored_config or not verify_password(pin, stored_config.value):
-        raise HTTPException(status_code=401, detail="Incorrect Admin PIN.")
+    require_admin_pin(db, pin)
     
-    # 1. Get credentials directly from the active SQLAlchemy Engine
-    # This guarantees we use the exact same credentials the app is running on.
-    engine = db.get_bind()
-    url = engine.url
-
-    db_user = url.username
-    db_password = url.password
-    db_host = url.host
-    db_port = str(url.port) if url.port else "5432"
-    db_name = url.database
-
-    # 2. Prepare Backup File Path
+    # Same credentials the app is running on (the replica's, when reads go there)
+    url = db.get_bind().url
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M")
     filename = f"clinic_backup_{timestamp}.sql"
     filepath = f"/tmp/{filename}"
 
-    # 3. Prepare Environment for pg_dump
-    env = os.environ.copy()
-    if db_password:
-        env["PGPASSWORD"] = db_password
-
-    # 4. Execute pg_dump
     try:
-        command = [
-            "pg_dump",
-            "-h", db_host,
-            "-p", db_port, # Added port just in case
-            "-U", db_user,
-            "-d", db_name,
-            "-f", filepath
-        ]
-        
-        subprocess.run(command, env=env, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Backup Error: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate backup. Check server logs.")
-    except FileNotFoundError:
-        # This is the specific error for "pg_dump not installed"
-        raise HTTPException(status_code=500, detail="pg_dump tool not found on server.")
+        backup.dump_database(url, filepath)
+    except backup.BackupError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+    # Removed once sent. Large databases: prefer a "backup" job (POST /api/jobs).
     return FileResponse(
         path=filepath, 
         filename=filename, 
         media_type='application/octet-stream',
-        background=background_tasks.add_task(os.remove, filepath)
+        background=BackgroundTask(os.remove, filepath)
     )
 
 
-# --- SERVE REACT FRONTEND (Production Mode) ---
-# This checks if the 'dist' folder exists (created by 'npm run build')
+#####################################################
+# --- Application Factory ---
+#####################################################
+
+# --- Read-your-writes with a read replica ---
+# After a successful write, hand the client the primary's WAL position so that
+# get_read_db only serves its next reads from a replica that has replayed it.
+async def track_write_position(request: Request, call_next):
+    response = await call_next(request)
+    if (
+        database.has_read_replica()
+        and request.method in ("POST", "PUT", "PATCH", "DELETE")
+        and response.status_code < 400
+    ):
+        try:
+            lsn = await run_in_threadpool(database.current_write_lsn)
+            response.set_cookie(database.WRITE_LSN_COOKIE, lsn, max_age=60, httponly=True, samesite="lax")
+        except Exception as e:
+            print(f"Warning: could not read primary WAL position: {e}")
+    return response
+
+# --- Audit actor ---
+# No user accounts: the audit log records the X-Clinic-User header if a terminal
+# sends one, else the client address.
+async def set_audit_actor(request: Request, call_next):
+    actor = request.headers.get(audit.ACTOR_HEADER) or (request.client.host if request.client else None)
+    token = audit.current_actor.set(actor)
+    try:
+        return await call_next(request)
+    finally:
+        audit.current_actor.reset(token)
 
-# Default to local dev path, but allow override via ENV
-frontend_dist = os.getenv("FRONTEND_DIST_PATH", "../frontend/dist")
+# --- Slow-query log ---
+# Tags statements with the request that ran them (only when SLOW_QUERY_MS is set)
+async def set_query_route(request: Request, call_next):
+    token = slow_queries.current_route.set(f"{request.method} {request.url.path}")
+    try:
+        return await call_next(request)
+    finally:
+        slow_queries.current_route.reset(token)
+
+def create_app() -> FastAPI:
+    # orjson-backed default; hot routes return pre-serialized bytes via serialization.model_response
+    app = FastAPI(default_response_class=serialization.FastJSONResponse)
+
+    # Per-traffic-class admission limits (interactive / reporting / admin). Added
+    # before CORS so rejections still carry CORS headers in dev.
+    app.add_middleware(bulkheads.BulkheadMiddleware)
+    app.add_event_handler("startup", bulkheads.size_threadpool)
+
+    # --- CORS (For Dev Mode) ---
+    # Allows Vite dev server (port 5173) to talk to Python (port 8000)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"], 
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=pagination.EXPOSED_HEADERS,
+    )
+    app.middleware("http")(track_write_position)
+    app.middleware("http")(set_audit_actor)
+    if slow_queries.enabled():
+        app.middleware("http")(set_query_route)
+
+    # Compress large JSON responses (full patient trees). Responses that already
+    # carry a Content-Encoding (precompressed frontend files) are left alone.
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+    app.include_router(router)
+
+    # Typeahead index: built and kept current by a background LISTEN thread per worker,
+    # so it never delays boot (lookups fall back to SQL until it's ready)
+    if os.getenv("TYPEAHEAD_ENABLED", "1") == "1":
+        app.add_event_handler("startup", typeahead.start_listener)
+
+    # Live update streams: ended on shutdown so open ones don't hold the worker up
+    app.add_event_handler("shutdown", events.hub.close)
+
+    # Mount uploads folder for local dev (storage.save_file creates it on first upload).
+    # Old per-visit URLs redirect to where migrate_uploads.py moved the file.
+    app.mount(storage.UPLOAD_URL_PREFIX, storage.UploadFiles(directory=storage.UPLOAD_ROOT, check_dir=False), name="uploads")
+
+    # --- SERVE REACT FRONTEND (Production Mode) ---
+    # This checks if the 'dist' folder exists (created by 'npm run build')
+
+    # Default to local dev path, but allow override via ENV
+    frontend_dist = os.getenv("FRONTEND_DIST_PATH", "../frontend/dist")
+
+    if os.path.exists(frontend_dist):
+        # Only lists dist here; each file is read/compressed on first request (or
+        # picked up from .gz/.br files precompressed at image build time)
+        frontend_index = frontend_assets.FrontendIndex(frontend_dist)
+
+        # Catch-all route for React Router (SPA), also serves hashed /assets bundles
+        @app.get("/{full_path:path}")
+        async def serve_react_app(
+            full_path: str,
+            accept_encoding: Optional[str] = Header(None),
+            if_none_match: Optional[str] = Header(None)
+        ):
+            return frontend_index.response(full_path, accept_encoding, if_none_match)
+    else:
+        print("Warning: Frontend 'dist' folder not found. Running API only mode.")
 
-if os.path.exists(frontend_dist):
-    app.mount("/assets", StaticFiles(directory=f"{frontend_dist}/assets"), name="assets")
+    return app
 
-    # Catch-all route for React Router (SPA)
-    @app.get("/{full_path:path}")
-    async def serve_react_app(full_path: str):
-        # If the file exists in dist, serve it (e.g., favicon.ico)
-        if os.path.exists(f"{frontend_dist}/{full_path}") and full_path != "":
-             return FileResponse(f"{frontend_dist}/{full_path}")
-        # Otherwise, serve index.html so React can handle the routing
-        return FileResponse(f"{frontend_dist}/index.html")
-else:
-    print("Warning: Frontend 'dist' folder not found. Running API only mode.")
\ No newline at end of file
+app = create_app()
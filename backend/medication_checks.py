@@ -0,0 +1,323 @@
+import os
+import csv
+import re
+import unicodedata
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+# Allergy and repeat dispensing check, run on every medicine line the doctor
+# types and again when the visit is saved. Names are resolved through a local
+# term table (data/medicine_terms.csv) held in memory, so a check is a few
+# dict lookups plus at most two indexed queries.
+
+TERMS_TABLE_PATH = os.getenv(
+    "MEDICINE_TERMS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "medicine_terms.csv"),
+)
+
+# Same ingredient dispensed to the patient within this many days is flagged
+DEFAULT_WINDOW_DAYS = int(os.getenv("REPEAT_DISPENSING_WINDOW_DAYS", "7"))
+
+# Words in a dispensing line or allergy note that say nothing about the medicine
+NOISE_WORDS = {
+    "mg", "ml", "mcg", "g", "iu", "tab", "tabs", "tablet", "tablets", "cap", "caps", "capsule", "capsules",
+    "syr", "syrup", "susp", "suspension", "drop", "drops", "cream", "oint", "ointment", "gel", "lotion",
+    "inhaler", "neb", "supp", "suppository", "sachet", "sachets", "spray", "solution", "mixture",
+    "allergy", "allergic", "allergies", "to", "and", "or", "with", "the", "of", "a", "an", "no", "known",
+    "drug", "drugs", "medicine", "medication", "nkda", "nil", "none", "rash", "hives", "mild", "severe",
+    "reaction", "possible", "suspected", "query", "history", "hx",
+}
+# Allergy words matched literally against medicine lines when the term table
+# doesn't know them (an unlisted brand written in both places). Only a warning:
+# a shared word is a hint, not a resolved ingredient
+MIN_LITERAL_WORD = 4
+
+# Alert kinds. Only "allergy" stops a save; the rest are shown while typing.
+ALLERGY = "allergy"                # medicine contains the allergen, or is in an allergen class
+RELATED_ALLERGY = "related_allergy"  # same drug class as a recorded allergen (cross-sensitivity)
+ALLERGY_MENTION = "allergy_mention"  # shares a word the term table doesn't know with the allergy note
+RECENT_DISPENSING = "recent_dispensing"  # same ingredient dispensed within the window
+REPEATED_LINE = "repeated_line"    # same ingredient on another line of this visit
+BLOCKING = {ALLERGY}
+
+
+class Concepts(NamedTuple):
+    ingredients: FrozenSet[str]
+    classes: FrozenSet[str]
+    terms: Tuple[str, ...]  # table terms that matched, in text order
+
+
+NO_CONCEPTS = Concepts(frozenset(), frozenset(), ())
+
+
+class TermIndex(NamedTuple):
+    terms: Dict[str, Tuple[FrozenSet[str], FrozenSet[str]]]  # normalised term -> (ingredients, classes)
+    ingredient_classes: Dict[str, FrozenSet[str]]
+    # Classes that share an ingredient with the class ("penicillins" -> "beta-lactams")
+    class_neighbours: Dict[str, FrozenSet[str]]
+    max_words: int
+
+#####################################################
+# --- Term Table ---
+#####################################################
+
+def normalize_words(text: Optional[str]) -> List[str]:
+    """Lowercase ASCII words; strengths ("250mg", "5ml", "1%") and noise words dropped."""
+    if not text:
+        return []
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return [
+        w for w in re.split(r"[^a-z0-9]+", ascii_text)
+        if w and w not in NOISE_WORDS and not any(c.isdigit() for c in w)
+    ]
+
+def _split_list(value: Optional[str]) -> FrozenSet[str]:
+    return frozenset(part.strip().lower() for part in (value or "").split(";") if part.strip())
+
+@lru_cache(maxsize=None)
+def load_index() -> TermIndex:
+    """Built once per worker from the term table."""
+    terms = {}
+    ingredient_classes: Dict[str, set] = {}
+    with open(TERMS_TABLE_PATH, newline="") as f:
+        reader = csv.DictReader(line for line in f if not line.startswith("#"))
+        for row in reader:
+            key = " ".join(normalize_words(row["term"]))
+            if not key:
+                continue
+            ingredients, classes = _split_list(row["ingredients"]), _split_list(row["classes"])
+            previous = terms.get(key)
+            if previous:
+                ingredients, classes = previous[0] | ingredients, previous[1] | classes
+            terms[key] = (ingredients, classes)
+            for ingredient in ingredients:
+                ingredient_classes.setdefault(ingredient, set()).update(classes)
+
+    class_neighbours: Dict[str, set] = {}
+    for classes in ingredient_classes.values():
+        for cls in classes:
+            class_neighbours.setdefault(cls, set()).update(classes)
+
+    return TermIndex(
+        terms=terms,
+        ingredient_classes={k: frozenset(v) for k, v in ingredient_classes.items()},
+        class_neighbours={k: frozenset(v) for k, v in class_neighbours.items()},
+        max_words=max((len(k.split()) for k in terms), default=1),
+    )
+
+@lru_cache(maxsize=4096)
+def concepts_for(text: str) -> Concepts:
+    """
+    Ingredients and classes named in a medicine line or allergy note, by
+    longest whole-word match against the term table ("mefenamic acid" before
+    "acid"). Cached: the same lines come back on every keystroke.
+    """
+    index = load_index()
+    words = normalize_words(text)
+    ingredients, classes, matched = set(), set(), []
+    i = 0
+    while i < len(words):
+        for size in range(min(index.max_words, len(words) - i), 0, -1):
+            phrase = " ".join(words[i:i + size])
+            found = index.terms.get(phrase)
+            if found:
+                ingredients |= found[0]
+                classes |= found[1]
+                matched.append(phrase)
+                i += size
+                break
+        else:
+            i += 1
+    if not matched:
+        return NO_CONCEPTS
+    return Concepts(frozenset(ingredients), frozenset(classes), tuple(matched))
+
+#####################################################
+# --- Checks ---
+#####################################################
+
+class _Allergen(NamedTuple):
+    ingredients: FrozenSet[str]
+    classes: FrozenSet[str]  # only classes named as such ("penicillin allergy")
+    related_classes: FrozenSet[str]
+    literal_words: FrozenSet[str]
+
+def _allergen(allergies: Optional[str]) -> Optional[_Allergen]:
+    """
+    An allergy to an ingredient is not an allergy to its whole class: amoxicillin
+    blocks Augmentin, while other beta-lactams only get a related-class warning.
+    """
+    if not allergies or not allergies.strip():
+        return None
+    index = load_index()
+    concepts = concepts_for(allergies)
+    classes = set()
+    for term in concepts.terms:
+        term_ingredients, term_classes = index.terms[term]
+        if not term_ingredients:
+            classes |= term_classes
+    related = set()
+    for ingredient in concepts.ingredients:
+        related |= index.ingredient_classes.get(ingredient, frozenset())
+    for cls in classes:
+        related |= index.class_neighbours.get(cls, frozenset())
+    known = {w for term in concepts.terms for w in term.split()}
+    literal = frozenset(w for w in normalize_words(allergies) if len(w) >= MIN_LITERAL_WORD and w not in known)
+    return _Allergen(concepts.ingredients, frozenset(classes), frozenset(related), literal)
+
+def _names(values) -> str:
+    return ", ".join(sorted(values))
+
+def _allergy_alerts(medicine: str, concepts: Concepts, allergen: _Allergen) -> List[dict]:
+    alerts = []
+    direct = (concepts.ingredients & allergen.ingredients) | (concepts.classes & allergen.classes)
+    if direct:
+        alerts.append({
+            "kind": ALLERGY,
+            "message": f"Recorded allergy: {_names(direct)}",
+            "matches": sorted(direct),
+        })
+        return alerts
+
+    literal = allergen.literal_words & set(normalize_words(medicine))
+    if literal:
+        alerts.append({
+            "kind": ALLERGY_MENTION,
+            "message": f"Recorded allergy mentions: {_names(literal)}",
+            "matches": sorted(literal),
+        })
+        return alerts
+
+    related = concepts.classes & allergen.related_classes
+    if related:
+        alerts.append({
+            "kind": RELATED_ALLERGY,
+            "message": f"Same class as a recorded allergy ({_names(related)})",
+            "matches": sorted(related),
+        })
+    return alerts
+
+def recent_dispensings(
+    db: Session,
+    patient_id: UUID,
+    on: date,
+    window_days: int,
+    exclude_visit_id: Optional[int] = None,
+):
+    """
+    The patient's dispensed items from visits in [on - window_days, on]. Both
+    date bounds go on both tables so only the partitions in range are read.
+    """
+    since = on - timedelta(days=window_days)
+    query = (
+        select(models.DispensationItem.medicine_name, models.DispensationItem.visit_id, models.Visit.date)
+        .join(models.Visit, (models.Visit.visit_id == models.DispensationItem.visit_id)
+              & (models.Visit.date == models.DispensationItem.visit_date))
+        .where(
+            models.Visit.patient_id == patient_id,
+            models.Visit.date.between(since, on),
+            models.DispensationItem.visit_date.between(since, on),
+            models.DispensationItem.is_dispensed.is_(True),
+        )
+        .order_by(models.Visit.date.desc(), models.DispensationItem.visit_id.desc())
+    )
+    if exclude_visit_id is not None:
+        query = query.where(models.Visit.visit_id != exclude_visit_id)
+    return db.execute(query).all()
+
+def check_lines(
+    allergies: Optional[str],
+    medicines: Sequence[str],
+    recent: Sequence = (),
+) -> List[dict]:
+    """
+    One result per medicine line: what it resolved to and its alerts. Pure
+    (no database access), so it can be run on whatever the caller has loaded.
+    """
+    allergen = _allergen(allergies)
+    resolved = [concepts_for(m or "") for m in medicines]
+    recent_resolved = [(row, concepts_for(row.medicine_name or "")) for row in recent]
+
+    results = []
+    for i, (medicine, concepts) in enumerate(zip(medicines, resolved)):
+        alerts = _allergy_alerts(medicine, concepts, allergen) if allergen else []
+
+        for j, other in enumerate(resolved):
+            shared = concepts.ingredients & other.ingredients
+            if j != i and shared:
+                alerts.append({
+                    "kind": REPEATED_LINE,
+                    "message": f"Also on line {j + 1} ({medicines[j]}): {_names(shared)}",
+                    "matches": sorted(shared),
+                })
+                break
+
+        for row, other in recent_resolved:
+            shared = concepts.ingredients & other.ingredients
+            if shared:
+                alerts.append({
+                    "kind": RECENT_DISPENSING,
+                    "message": f"Dispensed on {row.date.isoformat()} ({row.medicine_name}): {_names(shared)}",
+                    "matches": sorted(shared),
+                    "visit_id": row.visit_id,
+                    "date": row.date,
+                })
+                break  # the most recent one is enough
+
+        for alert in alerts:
+            alert["blocking"] = alert["kind"] in BLOCKING
+        results.append({
+            "medicine_name": medicine,
+            "ingredients": sorted(concepts.ingredients),
+            "classes": sorted(concepts.classes),
+            "alerts": alerts,
+        })
+    return results
+
+def check_visit(
+    db: Session,
+    patient_id: UUID,
+    medicines: Sequence[str],
+    on: Optional[date] = None,
+    window_days: int = DEFAULT_WINDOW_DAYS,
+    exclude_visit_id: Optional[int] = None,
+) -> Optional[dict]:
+    """
+    Checks `medicines` for a visit of `patient_id` on `on` (default today).
+    None if there is no such patient.
+    """
+    patient = db.execute(
+        select(models.Patient.allergies).where(models.Patient.id == patient_id)
+    ).first()
+    if patient is None:
+        return None
+
+    on = on or date.today()
+    recent = []
+    if window_days > 0 and medicines:
+        recent = recent_dispensings(db, patient_id, on, window_days, exclude_visit_id)
+    return {
+        "patient_id": patient_id,
+        "allergies": patient.allergies,
+        "date": on,
+        "window_days": window_days,
+        "lines": check_lines(patient.allergies, medicines, recent),
+    }
+
+def blocking_alerts(result: Optional[dict]) -> List[dict]:
+    """Alerts that stop a save, with the line they belong to."""
+    if not result:
+        return []
+    return [
+        {"medicine_name": line["medicine_name"], **alert}
+        for line in result["lines"]
+        for alert in line["alerts"]
+        if alert["blocking"]
+    ]
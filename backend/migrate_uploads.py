@@ -0,0 +1,172 @@
+import argparse
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from sqlalchemy import Integer, String, column, func, select, update, values
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+import database, models, storage
+
+# Moves local uploads from the old layout (uploads/<visit_id>/<original filename>)
+# to the sharded one (uploads/ab/cd/<name>.<ext>) and rewrites file_path:
+#   python migrate_uploads.py --workers 8
+# Safe to stop and run again: every attachment's new name is derived from its
+# id, so a file already moved is recognised and only its row is updated.
+# Old URLs keep working (storage.UploadFiles redirects them), so the app can
+# stay up while this runs; a file moved for an attachment deleted meanwhile is
+# removed again.
+
+# Rows matching this still point at the old layout
+LEGACY_PATTERN = f"^{storage.UPLOAD_URL_PREFIX}/[0-9]+/[^/]+$"
+NAMESPACE = uuid.UUID("7d0f3c52-5b7e-4a43-9f0c-2e6f1b8a9d14")
+
+BATCH_SIZE = 200
+DEFAULT_WORKERS = 8
+
+
+def migrated_key(attachment_id: int, filename: str) -> str:
+    """The sharded key an attachment is moved to, the same on every run."""
+    return storage.sharded_key(uuid.uuid5(NAMESPACE, f"visit_attachment:{attachment_id}").hex, filename)
+
+def _copy(source: str, target: str):
+    # Through a temporary name, so an interrupted copy never looks finished
+    partial = target + ".partial"
+    shutil.copyfile(source, partial)
+    os.replace(partial, target)
+
+def migrate_file(legacy_path: str, ids: List[int], dry_run: bool = False) -> Tuple[List[Tuple[int, str]], bool]:
+    """
+    Moves one old-layout file to each of its attachments' new locations.
+    Same-named uploads overwrote each other, so several rows can share one
+    file: all but the last get a copy, the last gets the file itself.
+    Returns ([(attachment id, new file_path)], file missing).
+    """
+    source = storage.local_path(legacy_path)
+    done, missing = [], False
+    for k, attachment_id in enumerate(ids):
+        new_path = storage.upload_url(migrated_key(attachment_id, legacy_path.rsplit("/", 1)[-1]))
+        target = storage.local_path(new_path)
+        if os.path.exists(target):
+            done.append((attachment_id, new_path))  # moved by an earlier run
+            continue
+        if not os.path.exists(source):
+            missing = True
+            continue
+        if not dry_run:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if k == len(ids) - 1:
+                try:
+                    os.replace(source, target)  # a rename on the same volume
+                except OSError:
+                    _copy(source, target)
+            else:
+                _copy(source, target)
+        done.append((attachment_id, new_path))
+
+    if not dry_run and len(done) == len(ids):
+        try:
+            os.remove(source)  # only left over if a copy was the last step
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(os.path.dirname(source))  # the visit's folder, once empty
+        except OSError:
+            pass
+    return done, missing
+
+def legacy_batch(db, after_id: int, limit: int):
+    """Old-layout paths with their attachment ids, oldest first, keyset-paginated."""
+    first_id = func.min(models.VisitAttachment.id)
+    return db.execute(
+        select(
+            models.VisitAttachment.file_path,
+            func.array_agg(aggregate_order_by(models.VisitAttachment.id, models.VisitAttachment.id)).label("ids"),
+            first_id.label("first_id"),
+        )
+        .where(models.VisitAttachment.file_path.op("~")(LEGACY_PATTERN))
+        .group_by(models.VisitAttachment.file_path)
+        .having(first_id > after_id)
+        .order_by(first_id)
+        .limit(limit)
+    ).all()
+
+def rewrite_paths(db, moved: List[Tuple[int, str, str]]) -> set:
+    """
+    Points each (id, old path, new path) row at its new path, in one
+    UPDATE ... FROM (VALUES ...). Returns the ids updated: a row deleted, or
+    given another file, since the batch was read is left out.
+    """
+    table = models.VisitAttachment.__table__
+    rows = values(column("id", Integer), column("old", String), column("new", String), name="moved").data(moved)
+    return set(db.execute(
+        update(table)
+        .where(table.c.id == rows.c.id, table.c.file_path == rows.c.old)
+        .values(file_path=rows.c.new)
+        .returning(table.c.id)
+    ).scalars())
+
+def reap(paths: List[str]):
+    """Removes moved files no row points at any more."""
+    for path in paths:
+        try:
+            os.remove(storage.local_path(path))
+        except FileNotFoundError:
+            pass
+
+def migrate(workers: int = DEFAULT_WORKERS, batch_size: int = BATCH_SIZE, dry_run: bool = False) -> dict:
+    if storage.ENVIRONMENT != "local":
+        raise SystemExit("Only local uploads use the directory layout; nothing to migrate in a bucket.")
+
+    totals = {"files": 0, "attachments": 0, "missing": 0, "orphaned": 0}
+    started = time.monotonic()
+    after_id = 0
+
+    db = database.SessionLocal()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                batch = legacy_batch(db, after_id, batch_size)
+                if not batch:
+                    break
+                after_id = batch[-1].first_id
+
+                # File moves in parallel (I/O bound); one UPDATE statement per batch
+                results = list(pool.map(lambda row: migrate_file(row.file_path, row.ids, dry_run), batch))
+                moved = [
+                    (attachment_id, row.file_path, new_path)
+                    for row, (done, _) in zip(batch, results)
+                    for attachment_id, new_path in done
+                ]
+                orphaned = []
+                if moved and not dry_run:
+                    updated = rewrite_paths(db, moved)
+                    orphaned = [new_path for attachment_id, _, new_path in moved if attachment_id not in updated]
+                db.commit()  # each batch is kept, so a stopped run resumes after it
+                reap(orphaned)
+
+                totals["files"] += len(batch)
+                totals["attachments"] += len(moved) - len(orphaned)
+                totals["missing"] += sum(missing for _, missing in results)
+                totals["orphaned"] += len(orphaned)
+                print(f"{totals['files']} files, {totals['attachments']} attachments moved, "
+                      f"{totals['missing']} missing, {totals['orphaned']} deleted meanwhile "
+                      f"({time.monotonic() - started:.1f}s)")
+    finally:
+        db.close()
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Moves local uploads into the sharded ab/cd/<name>.<ext> layout.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="files moved at the same time")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="files per database batch")
+    parser.add_argument("--dry-run", action="store_true", help="report what would move, change nothing")
+    args = parser.parse_args()
+
+    totals = migrate(args.workers, args.batch_size, args.dry_run)
+    if totals["missing"]:
+        print(f"{totals['missing']} files were not on disk; their attachments still point at the old path.")
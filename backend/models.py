@@ -1,18 +1,25 @@
 import uuid
-from sqlalchemy import Column, Float, Integer, String, Boolean, Date, Time, ForeignKey, func, Table
+from sqlalchemy import Column, BigInteger, Float, Integer, String, Boolean, Date, DateTime, Time, ForeignKey, ForeignKeyConstraint, Index, UniqueConstraint, func, Table, text, literal_column
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from database import Base
 
+# ID of the writing transaction (64-bit, never wraps). Stamped on every patient change
+# so the sync feed can page by commit visibility instead of a gappy sequence.
+CURRENT_XACT_ID_SQL = "pg_current_xact_id()::text::bigint"
+current_xact_id = literal_column(CURRENT_XACT_ID_SQL)
+
 # Association Table for Siblings
 patient_siblings = Table(
     'patient_siblings', Base.metadata,
-    Column('patient_id', UUID(as_uuid=True), ForeignKey('patients.id'), primary_key=True),
-    Column('sibling_id', UUID(as_uuid=True), ForeignKey('patients.id'), primary_key=True)
+    Column('patient_id', UUID(as_uuid=True), ForeignKey('patients.id', ondelete='CASCADE'), primary_key=True),
+    Column('sibling_id', UUID(as_uuid=True), ForeignKey('patients.id', ondelete='CASCADE'), primary_key=True)
 )
 
 class Patient(Base):
     __tablename__ = "patients"
+    # Search pages are ordered by (name, id): one index walk serves the sort and the cursor
+    __table_args__ = (Index("ix_patients_name_id", "name", "id"),)
     
     # id is surrogate key. Database handles it, users never handle it.
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -21,8 +28,9 @@ class Patient(Base):
     display_id = Column(String, unique=True, nullable=False, index=True)
 
     date_registered = Column(Date, nullable=False, server_default=func.current_date())
-    name = Column(String, nullable=False, index=True)
+    name = Column(String, nullable=False)
     date_of_birth = Column(Date, nullable=False, index=True)
+    sex = Column(String(1), nullable=True) # "M" / "F", needed for growth percentiles
     address = Column(String, nullable=False)
     phone_number_primary = Column(String, nullable=False)
     phone_number_secondary = Column(String, nullable=True)
@@ -44,21 +52,36 @@ class Patient(Base):
     allergies = Column(String, nullable=True)
     vaccination_summary = Column(String, nullable=True)
     other_notes = Column(String, nullable=True)
+
+    # Row version for conditional GETs (ETag). Bumped on any change to the
+    # patient's tree: the patient itself, visits, dispensations, attachments, siblings.
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Change-feed cursor position (see sync.py)
+    change_xid = Column(BigInteger, nullable=False, index=True, server_default=text(f"({CURRENT_XACT_ID_SQL})"))
     
-    visits = relationship("Visit", back_populates="patient", cascade="all, delete-orphan")
+    # passive_deletes: the database cascades deletes (ON DELETE CASCADE), the ORM doesn't load children to do it
+    visits = relationship("Visit", back_populates="patient", cascade="all, delete-orphan", passive_deletes=True)
     siblings = relationship(
         'Patient',
         secondary=patient_siblings,
         primaryjoin=id==patient_siblings.c.patient_id,
         secondaryjoin=id==patient_siblings.c.sibling_id,
-        lazy="select" # loads only when accessing .siblings
+        lazy="select", # loads only when accessing .siblings
+        passive_deletes=True
     )
 
 class Visit(Base):
     __tablename__ = "visits"
+    # Yearly range partitions on date (see partitions.py). In the database the
+    # primary key is (visit_id, date), as Postgres requires the partition key in
+    # it; the ORM keys on visit_id alone (still unique, from the sequence), so a
+    # date change is a plain UPDATE that moves the row to another partition and
+    # the children follow through ON UPDATE CASCADE.
+    __table_args__ = {"postgresql_partition_by": "RANGE (date)"}
     
     visit_id = Column(Integer, primary_key=True, autoincrement=True)
-    patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False, index=True)
+    patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
     date = Column(Date, nullable=False, index=True)
     time = Column(Time, nullable=False)
 
@@ -79,13 +102,21 @@ class Visit(Base):
     mc_end_date = Column(Date, nullable=True)
     
     patient = relationship("Patient", back_populates="visits")
-    attachments = relationship("VisitAttachment", back_populates="visit", cascade="all, delete-orphan")
-    dispensations = relationship("DispensationItem", back_populates="visit", cascade="all, delete-orphan")
+    attachments = relationship("VisitAttachment", back_populates="visit", cascade="all, delete-orphan", passive_deletes=True)
+    dispensations = relationship("DispensationItem", back_populates="visit", cascade="all, delete-orphan", passive_deletes=True)
 
 class VisitAttachment(Base):
     __tablename__ = "visit_attachments"
+    # Foreign keys to a partitioned table must include its partition key
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["visit_id", "visit_date"], ["visits.visit_id", "visits.date"],
+            ondelete="CASCADE", onupdate="CASCADE",
+        ),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
-    visit_id = Column(Integer, ForeignKey("visits.visit_id"), nullable=False, index=True)
+    visit_id = Column(Integer, nullable=False, index=True)
+    visit_date = Column(Date, nullable=False)
     file_path = Column(String, nullable=False)       
     file_type = Column(String, nullable=False)       
     original_filename = Column(String, nullable=False) 
@@ -93,9 +124,20 @@ class VisitAttachment(Base):
 
 class DispensationItem(Base):
     __tablename__ = "dispensation_items"
+    # Partitioned like visits, on a copy of the visit's date, so a year's
+    # dispensations live (and get vacuumed/archived) with that year's visits.
+    # Database primary key is (id, visit_date), as for visits.
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["visit_id", "visit_date"], ["visits.visit_id", "visits.date"],
+            ondelete="CASCADE", onupdate="CASCADE",
+        ),
+        {"postgresql_partition_by": "RANGE (visit_date)"},
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    visit_id = Column(Integer, ForeignKey("visits.visit_id"), nullable=False, index=True)    
+    visit_id = Column(Integer, nullable=False, index=True)
+    visit_date = Column(Date, nullable=False)
     # Example: "Paracetamol 5ml"
     medicine_name = Column(String, nullable=False)    
     # Example: "tds PRM" (To be taken three times a day, as needed)
@@ -109,8 +151,139 @@ class DispensationItem(Base):
 
     visit = relationship("Visit", back_populates="dispensations")
 
+class VaccinationScheduleDose(Base):
+    """
+    One dose of the immunisation schedule (seeded with the national programme,
+    editable by the clinic). Due `due_age_days` after birth, overdue
+    `overdue_after_days` after that, and no longer offered past `max_age_days`.
+    """
+    __tablename__ = "vaccination_schedule"
+    __table_args__ = (UniqueConstraint("vaccine", "dose", name="uq_vaccination_schedule_dose"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    vaccine = Column(String, nullable=False)
+    dose = Column(Integer, nullable=False)
+    due_age_days = Column(Integer, nullable=False)
+    overdue_after_days = Column(Integer, nullable=False, server_default="30")
+    max_age_days = Column(Integer, nullable=True) # None: no age limit
+
+class VaccinationRecord(Base):
+    """A dose given to a patient (here or elsewhere). One row per vaccine and dose."""
+    __tablename__ = "vaccination_records"
+    # Also the lookup index for a patient's records (patient_id leads)
+    __table_args__ = (UniqueConstraint("patient_id", "vaccine", "dose", name="uq_vaccination_records_patient_dose"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id", ondelete="CASCADE"), nullable=False)
+    vaccine = Column(String, nullable=False)
+    dose = Column(Integer, nullable=False)
+    date_given = Column(Date, nullable=False)
+    batch_number = Column(String, nullable=True)
+    notes = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
 class SystemConfig(Base):
     __tablename__ = "system_configs"
     
     key = Column(String, primary_key=True, index=True)
-    value = Column(String, nullable=False)
\ No newline at end of file
+    value = Column(String, nullable=False)
+
+class DailyTakings(Base):
+    """
+    Precomputed per-day totals by payment method for the finance report.
+    Maintained by reports.refresh_daily_takings on every visit write.
+    """
+    __tablename__ = "daily_takings"
+
+    date = Column(Date, primary_key=True)
+    payment_method = Column(String, primary_key=True) # "" when not recorded
+    visit_count = Column(Integer, nullable=False, default=0)
+    total_charge = Column(Float, nullable=False, default=0)
+
+class PatientTombstone(Base):
+    """Records deleted patients so the sync feed can tell clients to drop them."""
+    __tablename__ = "patient_tombstones"
+
+    patient_id = Column(UUID(as_uuid=True), primary_key=True)
+    change_xid = Column(BigInteger, nullable=False, index=True, server_default=text(f"({CURRENT_XACT_ID_SQL})"))
+    deleted_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class PatientMatchKey(Base):
+    """
+    Blocking keys for duplicate detection (see duplicates.py): a new patient
+    is only scored against patients sharing at least one key.
+    """
+    __tablename__ = "patient_match_keys"
+
+    key = Column(String, primary_key=True)
+    patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+class AuditLog(Base):
+    """
+    Before/after diffs of patient, visit, dispensation and vaccination writes (see audit.py).
+    No foreign keys: entries must outlive the rows they describe.
+    """
+    __tablename__ = "audit_log"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    occurred_at = Column(DateTime(timezone=True), nullable=False)
+    table_name = Column(String, nullable=False)
+    record_id = Column(String, nullable=False)
+    patient_id = Column(UUID(as_uuid=True), nullable=True, index=True)
+    visit_id = Column(Integer, nullable=True, index=True)
+    action = Column(String, nullable=False) # insert / update / delete / merge
+    changes = Column(JSONB, nullable=False) # {field: [before, after]}
+    actor = Column(String, nullable=True)
+
+class Job(Base):
+    """
+    Background job queue (see jobs.py). Workers claim the next due job with
+    SELECT ... FOR UPDATE SKIP LOCKED, so any number can poll the same table.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_claim_order", "priority", "run_after", "id", postgresql_where=text("status = 'queued'")),
+        Index("ix_jobs_running_heartbeat", "heartbeat_at", postgresql_where=text("status = 'running'")),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    params = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    status = Column(String, nullable=False, server_default="queued") # queued / running / succeeded / failed / cancelled
+    priority = Column(Integer, nullable=False, server_default="100") # lower runs first
+    attempts = Column(Integer, nullable=False, server_default="0")
+    max_attempts = Column(Integer, nullable=False, server_default="3")
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    progress = Column(Float, nullable=False, server_default="0")
+    progress_message = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    worker = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    result_location = Column(String, nullable=True)
+    result_filename = Column(String, nullable=True)
+    result_media_type = Column(String, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    @property
+    def has_result(self) -> bool:
+        return self.result_location is not None
+
+class StorageCleanup(Base):
+    """
+    Uploaded files whose attachment rows are gone. Filled by a trigger on
+    visit_attachments (so no delete path can orphan a file) and drained by
+    the reaper in the job worker (see file_cleanup.py).
+    """
+    __tablename__ = "storage_cleanup"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    file_path = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -0,0 +1,77 @@
+import base64
+import json
+import os
+from typing import Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+
+import models
+
+# Patient search pages (GET /api/patients/search/). The body stays a plain list;
+# paging and counts travel in headers, so existing callers keep working.
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "200"))
+# count=exact stops counting here and reports "at least COUNT_CAP"
+COUNT_CAP = int(os.getenv("SEARCH_COUNT_CAP", "1000"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"  # absent on the last page
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_KIND_HEADER = "X-Total-Count-Kind"  # "exact", "capped" (at least) or "estimate"
+# Readable by the frontend when it is served from another origin (Vite dev server)
+EXPOSED_HEADERS = [NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER, TOTAL_KIND_HEADER]
+
+#####################################################
+# --- Cursor ---
+#####################################################
+# Opaque to clients: base64 of the last row's (name, id). Pages are ordered by
+# (name, id), so the next page is a range scan on ix_patients_name_id starting
+# after that row. Unlike OFFSET, nothing before the page is read, and patients
+# added or renamed meanwhile don't shift rows between pages.
+
+def encode_cursor(name: str, patient_id: UUID) -> str:
+    raw = json.dumps([name, str(patient_id)], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, UUID]:
+    """Raises ValueError for anything this module didn't produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        name, patient_id = json.loads(raw)
+        return str(name), UUID(patient_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def after_cursor(cursor: Optional[str]):
+    """Filter for rows after the cursor (None for the first page)."""
+    if not cursor:
+        return None
+    name, patient_id = decode_cursor(cursor)
+    return tuple_(models.Patient.name, models.Patient.id) > tuple_(name, patient_id)
+
+PAGE_ORDER = (models.Patient.name, models.Patient.id)
+
+#####################################################
+# --- Counts ---
+#####################################################
+
+def capped_count(db: Session, statement, cap: int = COUNT_CAP) -> Tuple[int, bool]:
+    """
+    Exact number of rows, but reading no more than cap + 1 of them.
+    Returns (count, capped): (cap, True) means "cap or more".
+    """
+    counted = db.execute(select(func.count()).select_from(statement.limit(cap + 1).subquery())).scalar()
+    return min(counted, cap), counted > cap
+
+def estimated_count(db: Session, statement) -> int:
+    """
+    The planner's row estimate for the statement (EXPLAIN, nothing is read).
+    Instant at any size; close for range filters, rough for substring matches.
+    """
+    conn = db.connection()
+    compiled = statement.compile(dialect=conn.dialect)
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
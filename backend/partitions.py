@@ -0,0 +1,68 @@
+from datetime import date
+from itertools import chain
+from typing import Iterable, Set
+
+from sqlalchemy import event, text
+
+import models, database
+
+# visits is range-partitioned by year on date, and dispensation_items on the
+# same visit date (visit_date), so a date filter prunes both. Partitions are
+# named visits_<year> / dispensation_items_<year> and created by the
+# create_visit_partitions(year) SQL function (see the partition migration).
+CREATE_SQL = text("SELECT create_visit_partitions(:year)")
+
+# The job worker keeps this many years ahead of the current one created
+YEARS_AHEAD = 1
+
+PENDING_KEY = "partition_years"
+
+# Years this process has seen committed, so the common case costs nothing
+_known_years: Set[int] = set()
+
+
+def ensure_years(connection, years: Iterable[int]):
+    """Creates the partitions for any of `years` not known to exist yet."""
+    created = set()
+    for year in sorted(set(years) - _known_years):
+        connection.execute(CREATE_SQL, {"year": year})
+        created.add(year)
+    return created
+
+def ensure_upcoming():
+    """Worker maintenance: this year's and next year's partitions exist before any visit needs them."""
+    this_year = date.today().year
+    with database.engine.begin() as conn:
+        created = ensure_years(conn, range(this_year, this_year + YEARS_AHEAD + 1))
+    _known_years.update(created)
+
+#####################################################
+# --- On-demand creation (session events) ---
+#####################################################
+
+def _before_flush(session, flush_context, instances):
+    # A visit dated in a year with no partition (back-entry of old records, a
+    # mistyped year) gets one created in the same transaction rather than failing
+    years = {
+        obj.date.year
+        for obj in chain(session.new, session.dirty)
+        if isinstance(obj, models.Visit) and obj.date is not None
+    }
+    created = ensure_years(session.connection(), years)
+    if created:
+        session.info.setdefault(PENDING_KEY, set()).update(created)
+
+def _after_commit(session):
+    # Only remembered once committed: a rolled-back CREATE TABLE didn't happen
+    _known_years.update(session.info.pop(PENDING_KEY, ()))
+
+def _after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+def install(session_factory=database.SessionLocal):
+    event.listen(session_factory, "before_flush", _before_flush)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
+
+
+install()
@@ -0,0 +1,292 @@
+import io
+import os
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, A5, landscape
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+
+# ReportLab is slow to import, so main.py only imports this module inside the
+# PDF routes: workers that never render a PDF never pay for it.
+
+def report_table_style() -> TableStyle:
+    """Shared look for all tabular PDF reports."""
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),       # Header background
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),  # Header text color
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),                # Alignment
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),    # Header font
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),                # Align text to top of cell
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),      # Grid lines
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ])
+
+def dispensation_log_pdf(visits, start_date: date, end_date: date) -> io.BytesIO:
+    # 1. Setup PDF Buffer
+    output = io.BytesIO()
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=landscape(A4), # Landscape gives more width for tables
+        rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30
+    )
+
+    # 2. Prepare Content
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Title
+    title = Paragraph(f"Medication Dispensation Log: {start_date} to {end_date}", styles['Title'])
+    elements.append(title)
+    elements.append(Spacer(1, 20)) # Space between title and table
+
+    # Table Header
+    data = [['Date', 'Patient Name', 'Address', 'Medications']]
+
+    # Table Body
+    for visit in visits:
+        # Format Medications: Combine all meds for this visit into one cell, separated by newlines
+        med_list = []
+        for d in visit.dispensations:
+            # e.g., "• Paracetamol (tds) - 20"
+            med_text = f"• {d.medicine_name} {d.instructions or '-'} ({d.quantity})"
+            med_list.append(med_text)
+
+        # Join with <br/> because we are using the Paragraph object which understands HTML-like tags
+        meds_string = "<br/>".join(med_list)
+
+        # We use Paragraph() for Address and Meds to enable text wrapping
+        row = [
+            str(visit.date),
+            Paragraph(visit.patient.name, styles['BodyText']),
+            Paragraph(visit.patient.address, styles['BodyText']),
+            Paragraph(meds_string, styles['BodyText'])
+        ]
+        data.append(row)
+
+    # 3. Configure Table Layout
+    # Column widths: Date(10%), Name(15%), Address(35%), Meds(40%)
+    # Landscape A4 width is approx 11.7 inches. Let's use ~10.5 inches total.
+    col_widths = [1.0*inch, 1.8*inch, 3.7*inch, 4.0*inch]
+
+    table = Table(data, colWidths=col_widths)
+
+    # 4. Styling the Table (Grid, Colors, Fonts)
+    table.setStyle(report_table_style())
+
+    elements.append(table)
+
+    # 5. Build PDF
+    doc.build(elements)
+    output.seek(0)
+    return output
+
+def finance_report_pdf(report: dict, start_date: date, end_date: date) -> io.BytesIO:
+    output = io.BytesIO()
+    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
+    styles = getSampleStyleSheet()
+
+    elements = [
+        Paragraph(f"Takings Report: {start_date} to {end_date}", styles['Title']),
+        Spacer(1, 20),
+    ]
+
+    # Takings table: one row per period and payment method, then totals
+    data = [['Period', 'Payment Method', 'Visits', 'Total Charge']]
+    for period in report["periods"]:
+        for method, bucket in period["by_payment_method"].items():
+            data.append([str(period["period"]), method, bucket["visit_count"], f"{bucket['total_charge']:.2f}"])
+    for method, bucket in report["totals"]["by_payment_method"].items():
+        data.append(['TOTAL', method, bucket["visit_count"], f"{bucket['total_charge']:.2f}"])
+    data.append(['TOTAL', 'All', report["totals"]["visit_count"], f"{report['totals']['total_charge']:.2f}"])
+
+    table = Table(data, colWidths=[1.6*inch, 2.0*inch, 1.0*inch, 1.6*inch], repeatRows=1)
+    table.setStyle(report_table_style())
+    elements.append(table)
+
+    # Receipt reconciliation summary (only when it was asked for)
+    receipts = report["receipts"]
+    if receipts is not None:
+        elements.append(Spacer(1, 20))
+        elements.append(Paragraph("Receipt Reconciliation", styles['Heading2']))
+        missing = ", ".join(f"visit {m['visit_id']} ({m['date']})" for m in receipts["missing"]) or "None"
+        duplicates = ", ".join(
+            f"{d['receipt_number']} (visits {', '.join(map(str, d['visit_ids']))})" for d in receipts["duplicates"]
+        ) or "None"
+        gaps = ", ".join(receipts["gaps"]) or "None"
+        if receipts["gaps_truncated"]:
+            gaps += " ..."
+        elements.append(Paragraph(f"<b>Charged visits without receipt:</b> {missing}", styles['BodyText']))
+        elements.append(Paragraph(f"<b>Duplicate receipt numbers:</b> {duplicates}", styles['BodyText']))
+        elements.append(Paragraph(f"<b>Skipped receipt numbers:</b> {gaps}", styles['BodyText']))
+
+    doc.build(elements)
+    output.seek(0)
+    return output
+
+#####################################################
+# --- Visit Documents (receipts, MCs) ---
+#####################################################
+
+CLINIC_NAME = os.getenv("CLINIC_NAME", "Leong Baby & Child Clinic")
+CLINIC_ADDRESS = os.getenv("CLINIC_ADDRESS", "")
+CLINIC_PHONE = os.getenv("CLINIC_PHONE", "")
+CLINIC_LINES = [line for line in (CLINIC_ADDRESS, f"Tel: {CLINIC_PHONE}" if CLINIC_PHONE else "") if line]
+
+VISIT_PAGE = A5
+VISIT_MARGIN = 36
+LETTERHEAD_HEIGHT = 64
+CURRENCY = "RM"
+
+# Everything a receipt or MC reuses is built here, once per worker, instead of
+# per document: the sample stylesheet, the styles derived from it, the table
+# styles, and the font metrics (loaded from disk on first use otherwise).
+for _font in ("Helvetica", "Helvetica-Bold"):
+    pdfmetrics.getFont(_font)
+
+_SAMPLE = getSampleStyleSheet()
+STYLES = {
+    "title": ParagraphStyle("VisitTitle", parent=_SAMPLE["Title"], fontSize=14, leading=18, spaceAfter=10),
+    "body": ParagraphStyle("VisitBody", parent=_SAMPLE["BodyText"], fontSize=10, leading=15),
+    "cell": ParagraphStyle("VisitCell", parent=_SAMPLE["BodyText"], fontSize=9, leading=11),
+    "note": ParagraphStyle("VisitNote", parent=_SAMPLE["BodyText"], fontSize=7, leading=9, textColor=colors.grey),
+}
+DETAILS_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+])
+ITEMS_STYLE = report_table_style()
+TOTALS_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('LINEABOVE', (0, 0), (-1, 0), 1, colors.black),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+])
+
+CONTENT_WIDTH = VISIT_PAGE[0] - 2 * VISIT_MARGIN
+
+
+def _letterhead(canvas, doc):
+    """Drawn straight onto every page (no flowables to lay out)."""
+    width, height = VISIT_PAGE
+    top = height - VISIT_MARGIN
+    canvas.saveState()
+    canvas.setFont("Helvetica-Bold", 13)
+    canvas.drawCentredString(width / 2, top - 12, CLINIC_NAME)
+    canvas.setFont("Helvetica", 8)
+    for i, line in enumerate(CLINIC_LINES):
+        canvas.drawCentredString(width / 2, top - 26 - 10 * i, line)
+    rule = top - LETTERHEAD_HEIGHT + 14
+    canvas.line(VISIT_MARGIN, rule, width - VISIT_MARGIN, rule)
+    canvas.restoreState()
+
+def _render(story: list, title: str) -> io.BytesIO:
+    output = io.BytesIO()
+    doc = SimpleDocTemplate(
+        output, pagesize=VISIT_PAGE, title=title,
+        leftMargin=VISIT_MARGIN, rightMargin=VISIT_MARGIN,
+        topMargin=VISIT_MARGIN + LETTERHEAD_HEIGHT, bottomMargin=VISIT_MARGIN,
+    )
+    doc.build(story, onFirstPage=_letterhead, onLaterPages=_letterhead)
+    output.seek(0)
+    return output
+
+def _day(value: date) -> str:
+    return value.strftime("%d %b %Y")
+
+def _details(rows) -> Table:
+    table = Table(rows, colWidths=[1.1 * inch, CONTENT_WIDTH - 1.1 * inch], hAlign='LEFT')
+    table.setStyle(DETAILS_STYLE)
+    return table
+
+# --- Receipt ---
+
+def _receipt_story(visit) -> list:
+    patient = visit.patient
+    story = [
+        Paragraph("Official Receipt", STYLES["title"]),
+        _details([
+            ["Receipt No.", visit.receipt_number or "-"],
+            ["Date", f"{_day(visit.date)}, {visit.time.strftime('%H:%M')}"],
+            ["Patient", Paragraph(escape(patient.name), STYLES["cell"])],
+            ["Patient ID", patient.display_id],
+        ]),
+        Spacer(1, 12),
+    ]
+
+    # The clinic charges per visit, so items are listed without prices
+    items = [['Item', 'Quantity'], [Paragraph('Consultation', STYLES["cell"]), '']]
+    for d in visit.dispensations:
+        items.append([Paragraph(escape(d.medicine_name), STYLES["cell"]), Paragraph(escape(d.quantity or ''), STYLES["cell"])])
+    table = Table(items, colWidths=[CONTENT_WIDTH * 0.7, CONTENT_WIDTH * 0.3], repeatRows=1)
+    table.setStyle(ITEMS_STYLE)
+    story.append(table)
+    story.append(Spacer(1, 12))
+
+    totals = Table(
+        [
+            [f"Total ({CURRENCY})", f"{visit.total_charge or 0:.2f}"],
+            ["Paid by", visit.payment_method or "-"],
+        ],
+        colWidths=[CONTENT_WIDTH * 0.5, CONTENT_WIDTH * 0.5],
+    )
+    totals.setStyle(TOTALS_STYLE)
+    story.append(totals)
+    story.append(Spacer(1, 18))
+    story.append(Paragraph("This receipt is computer generated and needs no signature.", STYLES["note"]))
+    return story
+
+def receipt_pdf(visit) -> io.BytesIO:
+    return _render(_receipt_story(visit), title=f"Receipt {visit.receipt_number or visit.visit_id}")
+
+def receipts_pdf(visits, day: date) -> io.BytesIO:
+    """A day's receipts, one per page, in a single document."""
+    story = []
+    for visit in visits:
+        if story:
+            story.append(PageBreak())
+        story.extend(_receipt_story(visit))
+    if not story:
+        story.append(Paragraph(f"No receipts issued on {_day(day)}.", STYLES["body"]))
+    return _render(story, title=f"Receipts {day}")
+
+# --- Medical certificate ---
+
+def has_mc(visit) -> bool:
+    return bool(visit.mc_days and visit.mc_days > 0)
+
+def mc_pdf(visit) -> io.BytesIO:
+    patient = visit.patient
+    start = visit.mc_start_date or visit.date
+    end = visit.mc_end_date or start + timedelta(days=visit.mc_days - 1)
+    days = f"{visit.mc_days} day" + ("s" if visit.mc_days != 1 else "")
+
+    story = [
+        Paragraph("Medical Certificate", STYLES["title"]),
+        _details([
+            ["Serial No.", f"MC-{visit.visit_id}"],
+            ["Date of Issue", _day(visit.date)],
+        ]),
+        Spacer(1, 14),
+        Paragraph(
+            f"This is to certify that <b>{escape(patient.name)}</b> (Patient ID {escape(patient.display_id)}, "
+            f"born {_day(patient.date_of_birth)}) was examined at this clinic on {_day(visit.date)} and is "
+            f"unfit to attend school or nursery for <b>{days}</b>, from <b>{_day(start)}</b> to "
+            f"<b>{_day(end)}</b> inclusive.",
+            STYLES["body"]
+        ),
+        Spacer(1, 48),
+        Paragraph("______________________________<br/>Doctor's signature and clinic stamp", STYLES["body"]),
+    ]
+    return _render(story, title=f"MC-{visit.visit_id}")
@@ -0,0 +1,290 @@
+import csv
+import re
+from collections import defaultdict
+from datetime import date
+from typing import Iterable, TextIO
+
+from sqlalchemy import Date, cast, delete, func, insert, select, text
+from sqlalchemy.orm import Session, contains_eager, selectinload
+
+import models
+
+# Label used in reports for visits without a recorded payment method
+UNSPECIFIED_LABEL = "Unspecified"
+
+# Cap on listed receipt gaps so a typo (e.g. R9999999) can't blow up the payload
+MAX_RECEIPT_GAPS = 200
+
+# First key of the two-key pg_advisory_xact_lock taken per refreshed date (the
+# second is the date's hash): refreshes of the same day serialize, other days don't
+TAKINGS_LOCK_KEY = 742001
+
+RECEIPT_PATTERN = re.compile(r"^(.*?)(\d+)$")
+
+
+#####################################################
+# --- Aggregate Maintenance ---
+#####################################################
+
+def refresh_daily_takings(db: Session, dates: Iterable[date]):
+    """
+    Recomputes the daily_takings rows for the given visit dates.
+    Call this in the same transaction as any visit insert/update/delete,
+    passing both the old and the new date when a visit moves.
+    """
+    dates = {d for d in dates if d is not None}
+    if not dates:
+        return
+
+    # Pending ORM changes (autoflush is off) must be visible to the recount
+    db.flush()
+    # Two terminals saving visits for the same day must not race on the delete/insert.
+    # Locks are taken in date order (the ordered subquery), so two refreshes of
+    # overlapping dates can't deadlock.
+    db.execute(
+        text(
+            "SELECT pg_advisory_xact_lock(:key, hashtext(d::text)) "
+            "FROM (SELECT d FROM unnest(CAST(:days AS date[])) AS d ORDER BY d) AS days"
+        ),
+        {"key": TAKINGS_LOCK_KEY, "days": sorted(dates)},
+    )
+
+    db.execute(delete(models.DailyTakings).where(models.DailyTakings.date.in_(dates)))
+
+    method = func.coalesce(models.Visit.payment_method, "")
+    db.execute(
+        insert(models.DailyTakings).from_select(
+            ["date", "payment_method", "visit_count", "total_charge"],
+            select(
+                models.Visit.date,
+                method,
+                func.count(),
+                func.coalesce(func.sum(models.Visit.total_charge), 0),
+            )
+            .where(models.Visit.date.in_(dates))
+            .group_by(models.Visit.date, method)
+        )
+    )
+
+
+#####################################################
+# --- Finance Report ---
+#####################################################
+
+def _empty_bucket():
+    return {"visit_count": 0, "total_charge": 0.0}
+
+
+def _add(bucket: dict, visit_count: int, total_charge: float):
+    bucket["visit_count"] += visit_count
+    bucket["total_charge"] = round(bucket["total_charge"] + total_charge, 2)
+
+
+def summarize_takings(db: Session, start_date: date, end_date: date, group_by: str = "day") -> dict:
+    """Per-period totals by payment method, read from the daily aggregate (never from visits)."""
+    if group_by == "month":
+        period = cast(func.date_trunc("month", models.DailyTakings.date), Date)
+    else:
+        period = models.DailyTakings.date
+
+    rows = db.execute(
+        select(
+            period.label("period"),
+            models.DailyTakings.payment_method,
+            func.sum(models.DailyTakings.visit_count),
+            func.sum(models.DailyTakings.total_charge),
+        )
+        .where(models.DailyTakings.date >= start_date)
+        .where(models.DailyTakings.date <= end_date)
+        .group_by(period, models.DailyTakings.payment_method)
+        .order_by(period, models.DailyTakings.payment_method)
+    ).all()
+
+    periods = {}
+    totals = {**_empty_bucket(), "by_payment_method": defaultdict(_empty_bucket)}
+
+    for period_start, payment_method, visit_count, total_charge in rows:
+        label = payment_method or UNSPECIFIED_LABEL
+        visit_count, total_charge = int(visit_count or 0), float(total_charge or 0)
+
+        entry = periods.setdefault(period_start, {
+            "period": period_start, **_empty_bucket(), "by_payment_method": {}
+        })
+        _add(entry, visit_count, total_charge)
+        _add(entry["by_payment_method"].setdefault(label, _empty_bucket()), visit_count, total_charge)
+
+        _add(totals, visit_count, total_charge)
+        _add(totals["by_payment_method"][label], visit_count, total_charge)
+
+    totals["by_payment_method"] = dict(totals["by_payment_method"])
+    return {"periods": list(periods.values()), "totals": totals}
+
+
+def check_receipts(db: Session, start_date: date, end_date: date) -> dict:
+    """
+    Receipt reconciliation for the range: charged visits without a receipt number,
+    receipt numbers used more than once, and gaps in numbered receipt sequences.
+    """
+    in_range = (models.Visit.date >= start_date) & (models.Visit.date <= end_date)
+
+    missing = db.execute(
+        select(models.Visit.visit_id, models.Visit.date, models.Visit.patient_id, models.Visit.total_charge)
+        .where(in_range)
+        .where(models.Visit.total_charge > 0)
+        .where(func.coalesce(func.trim(models.Visit.receipt_number), "") == "")
+        .order_by(models.Visit.date, models.Visit.time)
+    ).all()
+
+    duplicates = db.execute(
+        select(models.Visit.receipt_number, func.array_agg(models.Visit.visit_id))
+        .where(in_range)
+        .where(func.coalesce(func.trim(models.Visit.receipt_number), "") != "")
+        .group_by(models.Visit.receipt_number)
+        .having(func.count() > 1)
+        .order_by(models.Visit.receipt_number)
+    ).all()
+
+    # Gaps: receipts like "R1001", "R1002", "R1004" -> "R1003" is missing
+    numbers = db.execute(
+        select(models.Visit.receipt_number).where(in_range).where(models.Visit.receipt_number.isnot(None))
+    ).scalars()
+
+    sequences = defaultdict(set)
+    widths = {}
+    for receipt in numbers:
+        match = RECEIPT_PATTERN.match(receipt.strip())
+        if match:
+            prefix, digits = match.groups()
+            sequences[prefix].add(int(digits))
+            widths[prefix] = max(widths.get(prefix, 0), len(digits))
+
+    gaps = []
+    gaps_truncated = False
+    for prefix, used in sorted(sequences.items()):
+        ordered = sorted(used)
+        for low, high in zip(ordered, ordered[1:]):
+            skipped, room = range(low + 1, high), MAX_RECEIPT_GAPS - len(gaps)
+            if len(skipped) > room:
+                gaps_truncated = True  # only when a gap is actually left out
+            gaps.extend(f"{prefix}{str(n).zfill(widths[prefix])}" for n in skipped[:room])
+
+    return {
+        "missing": [
+            {"visit_id": v.visit_id, "date": v.date, "patient_id": v.patient_id, "total_charge": v.total_charge}
+            for v in missing
+        ],
+        "duplicates": [
+            {"receipt_number": receipt, "visit_ids": sorted(visit_ids)}
+            for receipt, visit_ids in duplicates
+        ],
+        "gaps": gaps,
+        "gaps_truncated": gaps_truncated,
+    }
+
+
+def finance_report(
+    db: Session, start_date: date, end_date: date, group_by: str = "day", receipts: bool = False
+) -> dict:
+    """
+    Takings from the daily aggregate. The receipt check reads the visits in the
+    range, so it is only run when asked for (receipts=True); otherwise
+    "receipts" is None.
+    """
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "group_by": group_by,
+        **summarize_takings(db, start_date, end_date, group_by),
+        "receipts": check_receipts(db, start_date, end_date) if receipts else None,
+    }
+
+
+#####################################################
+# --- Exports (shared by the download routes and background jobs) ---
+#####################################################
+
+def dispensation_log(db: Session, start_date: date, end_date: date):
+    """Visits with dispensations in the range, oldest first."""
+    # Join Visits -> Patients -> Dispensations
+    return (
+        db.query(models.Visit)
+        .join(models.Patient)
+        .join(models.DispensationItem)
+        # Patient from the join, dispensations in one extra SELECT: no per-visit queries
+        .options(contains_eager(models.Visit.patient), selectinload(models.Visit.dispensations))
+        .filter(models.Visit.date >= start_date)
+        .filter(models.Visit.date <= end_date)
+        # Same range on the dispensations' own partition key, so both tables are pruned
+        .filter(models.DispensationItem.visit_date >= start_date)
+        .filter(models.DispensationItem.visit_date <= end_date)
+        .order_by(models.Visit.date, models.Visit.time)
+        .all()
+    )
+
+def _printable_visits(db: Session):
+    # Patient from the join, dispensations in one extra SELECT
+    return (
+        db.query(models.Visit)
+        .join(models.Patient)
+        .options(contains_eager(models.Visit.patient), selectinload(models.Visit.dispensations))
+    )
+
+def printable_visit(db: Session, visit_id: int):
+    """One visit with what its receipt and MC print, or None."""
+    return _printable_visits(db).filter(models.Visit.visit_id == visit_id).first()
+
+def receipts_for_day(db: Session, day: date):
+    """The day's visits that were given a receipt, in the order they were seen."""
+    return (
+        _printable_visits(db)
+        .filter(models.Visit.date == day)
+        .filter(models.Visit.receipt_number.isnot(None), models.Visit.receipt_number != "")
+        .order_by(models.Visit.time, models.Visit.visit_id)
+        .all()
+    )
+
+def write_dispensation_csv(visits, output: TextIO):
+    writer = csv.writer(output)
+    writer.writerow([
+        "Date",
+        "Time",
+        "Patient Name",
+        "Patient Address",
+        "Medicine",
+        "Instructions",
+        "Quantity"
+    ])
+    for visit in visits:
+        for disp in visit.dispensations:
+            writer.writerow([
+                visit.date,
+                visit.time,
+                visit.patient.name,
+                visit.patient.address,
+                disp.medicine_name,
+                disp.instructions or "",
+                disp.quantity
+            ])
+
+def write_finance_csv(report: dict, output: TextIO):
+    writer = csv.writer(output)
+    writer.writerow(["Period", "Payment Method", "Visits", "Total Charge"])
+
+    for period in report["periods"]:
+        for method, bucket in period["by_payment_method"].items():
+            writer.writerow([period["period"], method, bucket["visit_count"], f"{bucket['total_charge']:.2f}"])
+    for method, bucket in report["totals"]["by_payment_method"].items():
+        writer.writerow(["TOTAL", method, bucket["visit_count"], f"{bucket['total_charge']:.2f}"])
+    writer.writerow(["TOTAL", "All", report["totals"]["visit_count"], f"{report['totals']['total_charge']:.2f}"])
+
+    # Receipt issues, one per line
+    if report["receipts"] is None:
+        return
+    writer.writerow([])
+    writer.writerow(["Receipt Issue", "Receipt Number", "Visit IDs", "Date"])
+    for item in report["receipts"]["missing"]:
+        writer.writerow(["Missing", "", item["visit_id"], item["date"]])
+    for item in report["receipts"]["duplicates"]:
+        writer.writerow(["Duplicate", item["receipt_number"], " ".join(map(str, item["visit_ids"])), ""])
+    for receipt_number in report["receipts"]["gaps"]:
+        writer.writerow(["Gap", receipt_number, "", ""])
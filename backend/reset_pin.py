@@ -11,7 +11,7 @@ def reset_admin_pin():
         
         if num_deleted > 0:
             print("✅ SUCCESS: 'admin_pin' configuration deleted.")
-            print("👉 Now RESTART your Uvicorn server to generate the default 000000 PIN.")
+            print("👉 The default 000000 PIN will be set again the next time a PIN is entered.")
         else:
             print("ℹ️ INFO: No PIN was found in the database. It might already be cleared.")
             
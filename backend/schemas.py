@@ -1,7 +1,7 @@
 from uuid import UUID
-from pydantic import BaseModel, UUID4
-from typing import List, Optional
-from datetime import date as date_type, time as time_type
+from pydantic import BaseModel, Field, UUID4
+from typing import Any, Dict, List, Literal, Optional
+from datetime import date as date_type, datetime, time as time_type
 
 # --- Dispensation Schemas ---
 class DispensationItemBase(BaseModel):
@@ -70,6 +70,7 @@ class PatientBase(BaseModel):
     date_registered: Optional[date_type] = None
     name: str
     date_of_birth: date_type
+    sex: Optional[Literal["M", "F"]] = None
     address: str
     phone_number_primary: str
     phone_number_secondary: Optional[str] = None
@@ -108,6 +109,197 @@ class Patient(PatientBase):
     class Config:
         from_attributes = True
 
+# Most IDs one batch request may ask for
+MAX_BATCH_IDS = 200
+
+class PatientBatchRequest(BaseModel):
+    ids: List[UUID] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+# --- Sync Schemas ---
+class PatientChange(BaseModel):
+    id: UUID
+    display_id: str
+    name: str
+    date_of_birth: date_type
+    phone_number_primary: str
+    phone_number_secondary: Optional[str] = None
+    father_name: Optional[str] = None
+    mother_name: Optional[str] = None
+    version: int
+
+    class Config:
+        from_attributes = True
+
+class ChangeFeed(BaseModel):
+    changes: List[PatientChange] = []
+    deleted: List[UUID] = []
+    cursor: str
+    has_more: bool
+
+# --- Duplicate Detection Schemas ---
+class DuplicateCandidate(BaseModel):
+    id: UUID
+    display_id: str
+    name: str
+    date_of_birth: date_type
+    score: float
+    likely: bool
+    reasons: List[str] = []
+
+class DuplicatePair(BaseModel):
+    patient: DuplicateCandidate
+    duplicate: DuplicateCandidate
+    score: float
+    reasons: List[str] = []
+
+class MergeResult(BaseModel):
+    patient_id: UUID
+    merged_patient_id: UUID
+    visits_moved: int
+    siblings_linked: int
+    fields_filled: List[str] = []
+    vaccinations_moved: int = 0
+
+# --- Audit Schemas ---
+class AuditEntry(BaseModel):
+    id: int
+    occurred_at: datetime
+    table_name: str
+    record_id: str
+    patient_id: Optional[UUID] = None
+    visit_id: Optional[int] = None
+    action: str
+    changes: Dict[str, List[Any]]
+    actor: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+# --- Vaccination Schemas ---
+class VaccinationRecordBase(BaseModel):
+    vaccine: str
+    dose: int = Field(..., ge=1)
+    date_given: date_type
+    batch_number: Optional[str] = None
+    notes: Optional[str] = None
+
+class VaccinationRecordCreate(VaccinationRecordBase):
+    pass
+
+class VaccinationRecord(VaccinationRecordBase):
+    id: int
+    patient_id: UUID
+
+    class Config:
+        from_attributes = True
+
+class ScheduleDose(BaseModel):
+    vaccine: str
+    dose: int = Field(..., ge=1)
+    due_age_days: int = Field(..., ge=0)
+    overdue_after_days: int = Field(30, ge=0)
+    max_age_days: Optional[int] = Field(None, ge=0) # None: no age limit
+
+    class Config:
+        from_attributes = True
+
+class ScheduleUpdate(BaseModel):
+    pin: str
+    doses: List[ScheduleDose] = Field(..., min_length=1)
+
+class PatientDoseStatus(BaseModel):
+    vaccine: str
+    dose: int
+    due_date: date_type
+    overdue_date: date_type
+    status: Literal["given", "upcoming", "due", "overdue", "missed"]
+    date_given: Optional[date_type] = None
+
+class VaccinationCard(BaseModel):
+    patient_id: UUID
+    as_of: date_type
+    records: List[VaccinationRecord]
+    schedule: List[PatientDoseStatus]
+
+class DueDose(BaseModel):
+    patient_id: UUID
+    display_id: str
+    name: str
+    date_of_birth: date_type
+    phone_number_primary: str
+    vaccine: str
+    dose: int
+    due_date: date_type
+    overdue_date: date_type
+    status: Literal["upcoming", "due", "overdue"]
+    days_overdue: int
+
+class DueList(BaseModel):
+    as_of: date_type
+    due_from: Optional[date_type] = None
+    due_to: date_type
+    total: int
+    truncated: bool
+    doses: List[DueDose]
+
+# --- Dispensation Check Schemas ---
+# Most medicine lines one check may carry
+MAX_CHECK_LINES = 50
+
+class DispensationCheckRequest(BaseModel):
+    patient_id: UUID
+    medicines: List[str] = Field(..., max_length=MAX_CHECK_LINES)
+    date: Optional[date_type] = None # visit date; default today
+    visit_id: Optional[int] = None # visit being edited: its own items aren't "recent"
+    window_days: Optional[int] = Field(None, ge=0, le=365) # default REPEAT_DISPENSING_WINDOW_DAYS
+
+class DispensationAlert(BaseModel):
+    kind: Literal["allergy", "related_allergy", "allergy_mention", "recent_dispensing", "repeated_line"]
+    blocking: bool
+    message: str
+    matches: List[str]
+    visit_id: Optional[int] = None
+    date: Optional[date_type] = None
+
+class DispensationLineCheck(BaseModel):
+    medicine_name: str
+    ingredients: List[str]
+    classes: List[str]
+    alerts: List[DispensationAlert]
+
+class DispensationCheck(BaseModel):
+    patient_id: UUID
+    allergies: Optional[str] = None
+    date: date_type
+    window_days: int
+    lines: List[DispensationLineCheck]
+
+# --- Job Schemas ---
+class JobCreate(BaseModel):
+    kind: str
+    params: Dict[str, Any] = {}
+    priority: int = 100 # lower runs first
+    pin: Optional[str] = None # required for admin jobs (backup)
+
+class JobStatus(BaseModel):
+    id: int
+    kind: str
+    status: str
+    priority: int
+    progress: float
+    progress_message: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    has_result: bool
+    result_filename: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
 class PinVerify(BaseModel):
     pin: str
 
@@ -0,0 +1,55 @@
+import json
+from functools import lru_cache
+from typing import Any, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # Fallback keeps the app working without the C extension
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class for the API.
+    Uses orjson (handles UUID/date/time natively) when available. A JSONResponse
+    subclass so the OpenAPI schema still documents each route's response_model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=str
+        ).encode("utf-8")
+
+
+class PreSerializedResponse(Response):
+    """Wraps JSON bytes that were already produced by model_response()."""
+    media_type = "application/json"
+
+    def render(self, content: bytes) -> bytes:
+        return content
+
+
+@lru_cache(maxsize=None)
+def get_adapter(schema) -> TypeAdapter:
+    # Building a TypeAdapter compiles a validator/serializer; do it once per schema
+    return TypeAdapter(schema)
+
+
+def dump_json(schema, obj: Any) -> bytes:
+    """
+    ORM object(s) -> JSON bytes in a single pydantic-core pass each way,
+    instead of FastAPI's validate -> dump_python(mode="json") -> render chain.
+    """
+    adapter = get_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(obj, from_attributes=True))
+
+
+def model_response(schema, obj: Any, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """Serializes obj as `schema` (e.g. schemas.Patient or List[schemas.Patient])."""
+    return PreSerializedResponse(content=dump_json(schema, obj), status_code=status_code, headers=headers)
@@ -0,0 +1,169 @@
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import Select, event
+from sqlalchemy.engine import Engine
+
+# Opt-in diagnostics: statements slower than SLOW_QUERY_MS are printed and kept
+# in a per-worker ring buffer (see /api/system/slow-queries). 0 turns it off.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Fraction of slow select() statements re-run under EXPLAIN (ANALYZE, BUFFERS) for their plan.
+# ANALYZE executes the query again, so keep this small in production.
+EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.1"))
+BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER", "200"))
+
+MAX_STATEMENT_CHARS = 4000
+MAX_LOGGED_STATEMENT_CHARS = 200
+MAX_REDACTED_ITEMS = 20
+
+# "GET /api/patients/search/": set per request by the middleware in main.py
+current_route: ContextVar[Optional[str]] = ContextVar("slow_query_route", default=None)
+
+START_KEY = "_slow_query_start"
+
+entries = deque(maxlen=BUFFER_SIZE)
+counters = {"slow": 0, "explained": 0, "explain_failed": 0}
+
+
+def enabled() -> bool:
+    return SLOW_QUERY_MS > 0
+
+#####################################################
+# --- Redaction ---
+#####################################################
+
+def _redact(value):
+    # Numbers and flags are kept (limits, ids, versions); anything that could be
+    # patient data (names, phones, dates, UUIDs) is reduced to its type
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_redact(v) for v in value[:MAX_REDACTED_ITEMS]]
+    return f"<{type(value).__name__}>"
+
+def redact_parameters(parameters, executemany: bool):
+    if executemany:
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, dict):
+        return {key: _redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_redact(v) for v in parameters]
+    return None
+
+#####################################################
+# --- EXPLAIN capture ---
+#####################################################
+
+def _explain(cursor, statement: str, parameters) -> Optional[str]:
+    """
+    Plan of a SELECT that just ran, from a second cursor on the same connection
+    (the first one's rows haven't been fetched yet). Runs inside a savepoint so a
+    failure can't abort the request's transaction.
+    """
+    dbapi_connection = cursor.connection
+    explain_cursor = dbapi_connection.cursor()
+    in_transaction = not dbapi_connection.autocommit
+    try:
+        if in_transaction:
+            explain_cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            explain_cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+            plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+        except Exception as e:
+            if in_transaction:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            counters["explain_failed"] += 1
+            return f"(EXPLAIN failed: {e})"
+        if in_transaction:
+            explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        counters["explained"] += 1
+        return plan
+    finally:
+        explain_cursor.close()
+
+def _should_explain(context, executemany: bool) -> bool:
+    # Only reads built as ORM/Core select(): EXPLAIN ANALYZE runs the statement
+    # again, and a text() "SELECT" may well write (pg_advisory_xact_lock,
+    # nextval, a function with side effects). FOR UPDATE would lock twice.
+    compiled = getattr(context, "compiled", None)
+    statement = getattr(compiled, "statement", None)
+    return (
+        not executemany
+        and isinstance(statement, Select)
+        and statement._for_update_arg is None
+        and random.random() < EXPLAIN_SAMPLE_RATE
+    )
+
+#####################################################
+# --- Engine events ---
+#####################################################
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        setattr(context, START_KEY, time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, START_KEY, None) if context is not None else None
+    if started is None:
+        return
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms < SLOW_QUERY_MS:
+        return
+
+    route = current_route.get()
+    counters["slow"] += 1
+    print(f"Slow query ({duration_ms:.0f} ms, {route or 'no route'}): "
+          f"{' '.join(statement.split())[:MAX_LOGGED_STATEMENT_CHARS]}")
+
+    plan = None
+    if _should_explain(context, executemany):
+        try:
+            plan = _explain(cursor, statement, parameters)
+        except Exception as e:
+            counters["explain_failed"] += 1
+            print(f"Warning: could not capture query plan: {e}")
+
+    entries.append({
+        "at": datetime.now(timezone.utc).isoformat(),
+        "route": route,
+        "duration_ms": round(duration_ms, 1),
+        "statement": statement[:MAX_STATEMENT_CHARS],
+        "parameters": redact_parameters(parameters, executemany),
+        "plan": plan,
+    })
+
+def install():
+    # On the Engine class, so the lazily created per-traffic-class engines are covered too
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+#####################################################
+# --- Reading the log ---
+#####################################################
+
+def recent(limit: int, with_plan_only: bool = False) -> list:
+    """Newest first."""
+    selected = [e for e in reversed(entries) if e["plan"] or not with_plan_only]
+    return selected[:limit]
+
+def stats() -> dict:
+    return {
+        "enabled": enabled(),
+        "threshold_ms": SLOW_QUERY_MS,
+        "explain_sample_rate": EXPLAIN_SAMPLE_RATE,
+        "buffered": len(entries),
+        "pid": os.getpid(),
+        **counters,
+    }
+
+def clear():
+    entries.clear()
+
+
+if enabled():
+    install()
@@ -0,0 +1,152 @@
+import os
+import secrets
+import zipfile
+from typing import Callable, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import String, cast, func, literal, select
+from sqlalchemy import types as sqltypes
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
+from sqlalchemy.engine import Connection
+
+import models
+
+# Columnar snapshot of the clinical tables for offline analysis (pandas, DuckDB,
+# R, ...). Only the "snapshot" job imports this module: pyarrow is large.
+
+# Rows fetched from the server-side cursor, and written, per record batch
+BATCH_ROWS = int(os.getenv("SNAPSHOT_BATCH_ROWS", "10000"))
+
+TABLES = (models.Patient.__table__, models.Visit.__table__, models.DispensationItem.__table__)
+
+# De-identified snapshots leave out direct identifiers, and the parents'
+# occupations, birth hospital and free-text patient notes, which together
+# narrow a child down quickly. Dates of birth and visit notes are kept.
+IDENTIFYING_COLUMNS = {
+    "patients": {
+        "name", "display_id", "address", "phone_number_primary", "phone_number_secondary",
+        "father_name", "mother_name", "father_occupation", "mother_occupation", "hospital", "other_notes",
+    },
+}
+
+# ...and replace patient UUIDs (which the live database, backups and logs all
+# share) with a salted hash. The salt is new for every export and never kept:
+# patients join to their visits within one snapshot but not across snapshots
+# or back to the registry.
+PSEUDONYMISED_COLUMNS = {
+    "patients": {"id"},
+    "visits": {"patient_id"},
+}
+SALT_BYTES = 32
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+COMPRESSION = "zstd"
+
+
+def arrow_type(sql_type) -> pa.DataType:
+    """Arrow column type for a model column's SQL type."""
+    if isinstance(sql_type, ARRAY):
+        return pa.list_(arrow_type(sql_type.item_type))
+    if isinstance(sql_type, sqltypes.Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, sqltypes.BigInteger):
+        return pa.int64()
+    if isinstance(sql_type, sqltypes.Integer):
+        return pa.int32()
+    if isinstance(sql_type, (sqltypes.Float, sqltypes.Numeric)):
+        return pa.float64()
+    if isinstance(sql_type, sqltypes.DateTime):
+        return pa.timestamp("us", tz="UTC" if sql_type.timezone else None)
+    if isinstance(sql_type, sqltypes.Date):
+        return pa.date32()
+    if isinstance(sql_type, sqltypes.Time):
+        return pa.time64("us")
+    # Text, and anything read back as text (UUIDs, JSON)
+    return pa.string()
+
+def _needs_text_cast(sql_type) -> bool:
+    # Cast in SQL, so Postgres sends ready-made strings instead of objects to convert
+    return isinstance(sql_type, (UUID, JSONB, sqltypes.JSON))
+
+def table_columns(table, deidentify: bool):
+    dropped = IDENTIFYING_COLUMNS.get(table.name, set()) if deidentify else set()
+    return [column for column in table.columns if column.name not in dropped]
+
+def table_schema(table, columns, deidentify: bool) -> pa.Schema:
+    return pa.schema(
+        [pa.field(c.name, arrow_type(c.type), nullable=c.nullable) for c in columns],
+        metadata={"table": table.name, "deidentified": str(deidentify).lower()},
+    )
+
+#####################################################
+# --- Streaming ---
+#####################################################
+
+def _pseudonym(column, salt: str):
+    # Hex SHA-256 of salt + UUID text, worked out by Postgres (sha256() is built in)
+    digest = func.sha256(func.convert_to(literal(salt, String) + cast(column, String), "UTF8"))
+    return func.encode(digest, "hex").label(column.name)
+
+def _select_expression(column, salt: Optional[str]):
+    if salt is not None and column.name in PSEUDONYMISED_COLUMNS.get(column.table.name, ()):
+        return _pseudonym(column, salt)
+    if _needs_text_cast(column.type):
+        return cast(column, String).label(column.name)
+    return column
+
+def record_batches(conn: Connection, columns, schema: pa.Schema, salt: Optional[str] = None) -> Iterator[pa.RecordBatch]:
+    """
+    Rows from a server-side cursor (stream_results), BATCH_ROWS at a time, as
+    typed Arrow batches: memory use is one batch, whatever the table size.
+    With a salt, patient IDs come out pseudonymised.
+    """
+    query = select(*[_select_expression(c, salt) for c in columns])
+    result = conn.execution_options(stream_results=True, max_row_buffer=BATCH_ROWS).execute(query)
+    for rows in result.partitions(BATCH_ROWS):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def _open_writer(path: str, schema: pa.Schema, file_format: str):
+    if file_format == "parquet":
+        return pq.ParquetWriter(path, schema, compression=COMPRESSION)
+    return pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression=COMPRESSION))
+
+def write_snapshot(
+    conn: Connection,
+    directory: str,
+    file_format: str = "parquet",
+    deidentify: bool = False,
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> List[str]:
+    """
+    One file per table in `directory`. Run it on a REPEATABLE READ connection
+    so all tables come from the same moment (no visits without their patient).
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown snapshot format: {file_format}. Available: {', '.join(FORMATS)}")
+
+    salt = secrets.token_hex(SALT_BYTES) if deidentify else None
+    paths = []
+    for i, table in enumerate(TABLES):
+        columns = table_columns(table, deidentify)
+        schema = table_schema(table, columns, deidentify)
+        path = os.path.join(directory, table.name + FORMATS[file_format])
+        rows = 0
+        writer = _open_writer(path, schema, file_format)
+        try:
+            for batch in record_batches(conn, columns, schema, salt):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        finally:
+            writer.close()
+        paths.append(path)
+        if progress:
+            progress((i + 1) / (len(TABLES) + 1), f"{table.name}: {rows} rows")
+    return paths
+
+def bundle(paths: List[str], zip_path: str):
+    # Stored, not deflated: the files are compressed already
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for path in paths:
+            archive.write(path, arcname=os.path.basename(path))
@@ -1,37 +1,80 @@
 import os
+import re
 import shutil
+import uuid
+from functools import lru_cache
+from typing import Optional
 from fastapi import UploadFile
-from google.cloud import storage
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import select
+from starlette.exceptions import HTTPException
+
+import database, models
 
 # Config
 ENVIRONMENT = os.getenv("ENVIRONMENT", "local") # "local" or "production"
 BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "")
+UPLOAD_ROOT = "uploads"
+UPLOAD_URL_PREFIX = "/uploads"
+
+# Local uploads are stored as UPLOAD_ROOT/ab/cd/<uuid>.<ext>: random names never
+# collide, and two levels of 256 directories keep every directory small.
+# Files from the old layout (UPLOAD_ROOT/<visit_id>/<original filename>) are
+# moved over by migrate_uploads.py; their URLs redirect to the new location.
+LEGACY_UPLOAD_PATH = re.compile(r"(\d+)/([^/]+)")
+UPLOAD_EXTENSION = re.compile(r"\.[a-z0-9]{1,10}")
+# Finished job output (exports, backups) awaiting download; shared with the job worker
+JOB_RESULTS_ROOT = os.getenv("JOB_RESULTS_ROOT", "job_results")
+
+@lru_cache(maxsize=1)
+def get_bucket():
+    # google-cloud-storage is heavy and only needed in production: import on first use,
+    # and reuse one client instead of building one per file.
+    from google.cloud import storage
+    return storage.Client().bucket(BUCKET_NAME)
+
+def upload_extension(filename: Optional[str]) -> str:
+    """".jpg" from "Scan 1.JPG"; nothing for a missing or odd extension."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if UPLOAD_EXTENSION.fullmatch(ext) else ""
+
+def sharded_key(name: str, filename: Optional[str]) -> str:
+    """"ab/cd/abcd....jpg" for a hex name."""
+    return f"{name[:2]}/{name[2:4]}/{name}{upload_extension(filename)}"
+
+def upload_url(key: str) -> str:
+    return f"{UPLOAD_URL_PREFIX}/{key}"
+
+def local_path(file_path: str) -> str:
+    """Where a stored "/uploads/..." path is on disk."""
+    relative = file_path[len(UPLOAD_URL_PREFIX):] if file_path.startswith(UPLOAD_URL_PREFIX + "/") else file_path
+    return os.path.join(UPLOAD_ROOT, *relative.strip("/").split("/"))
 
 async def save_file(file: UploadFile, visit_id: int) -> str:
     """
     Saves file to either local disk or GCS bucket based on environment.
     Returns the path/URL to be stored in the DB.
     """
-    file_ext = file.filename.split('.')[-1]
-    filename = f"visit_{visit_id}_{file.filename}"
+    name = uuid.uuid4().hex
 
     if ENVIRONMENT == "local":
         # Local Logic
-        upload_dir = f"uploads/{visit_id}"
-        os.makedirs(upload_dir, exist_ok=True)
-
-        file_path = f"{upload_dir}/{file.filename}"
+        key = sharded_key(name, file.filename)
+        file_path = local_path(upload_url(key))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
         # Return relative path for frontend to access via StaticFiles
-        return f"/uploads/{visit_id}/{file.filename}"
+        return upload_url(key)
 
     else:
-        # GCP Cloud Storage Logic
-        client = storage.Client()
-        bucket = client.bucket(BUCKET_NAME)
-        blob_path = f"visits/{visit_id}/{filename}"
+        # GCP Cloud Storage Logic (a bucket has no directories to fill up,
+        # but same-named files in one visit must not overwrite each other)
+        bucket = get_bucket()
+        blob_path = f"visits/{visit_id}/{name}{upload_extension(file.filename)}"
         blob = bucket.blob(blob_path)
 
         # Upload
@@ -40,29 +83,105 @@ async def save_file(file: UploadFile, visit_id: int) -> str:
         # Use public URL or signed URL
         return blob.public_url
     
-async def delete_file(file_path: str):
+def delete_file(file_path: str):
     """
-    Deletes file from local disk or GCS bucket.
+    Deletes file from local disk or GCS bucket. A file that's already gone
+    counts as deleted; any other failure raises, so the cleanup reaper retries.
     """
     if ENVIRONMENT == "local":
-        # Local: file_path is likely "/uploads/1/file.jpg"
-        # We need to remove the leading "/" to find it on disk
-        relative_path = file_path.lstrip("/") 
-        if os.path.exists(relative_path):
-            os.remove(relative_path)
+        # Local: file_path is "/uploads/ab/cd/<uuid>.jpg" (or "/uploads/1/file.jpg" from before)
+        try:
+            os.remove(local_path(file_path))
+        except FileNotFoundError:
+            pass
     else:
         # GCP: file_path is a full public URL. 
         # We need to extract the blob name (everything after the bucket name)
         # Example URL: https://storage.googleapis.com/MY_BUCKET/visits/1/file.jpg
+        from google.api_core.exceptions import NotFound
+        blob_name = file_path.split(f"{BUCKET_NAME}/")[-1]
+        try:
+            get_bucket().blob(blob_name).delete()
+        except NotFound:
+            pass
+
+#####################################################
+# --- Serving Local Uploads ---
+#####################################################
+
+def legacy_location(path: str) -> Optional[str]:
+    """
+    Current location of a file asked for by its old-layout path
+    ("<visit_id>/<original filename>"), or None. Same-named uploads used to
+    overwrite each other, so the old URL meant the latest one.
+    """
+    match = LEGACY_UPLOAD_PATH.fullmatch(path)
+    if not match:
+        return None
+    with database.engine.connect() as conn:
+        location = conn.execute(
+            select(models.VisitAttachment.file_path)
+            .where(
+                models.VisitAttachment.visit_id == int(match.group(1)),
+                models.VisitAttachment.original_filename == match.group(2),
+            )
+            .order_by(models.VisitAttachment.id.desc())
+            .limit(1)
+        ).scalar()
+    if location is None or location == upload_url(path):
+        return None
+    return location
+
+class UploadFiles(StaticFiles):
+    """StaticFiles for UPLOAD_ROOT that redirects old-layout URLs to the moved file."""
+
+    async def check_config(self) -> None:
+        # Nothing uploaded yet: answer 404s from an empty folder rather than a 500
+        if self.directory is not None:
+            await run_in_threadpool(os.makedirs, self.directory, exist_ok=True)
+        await super().check_config()
+
+    async def get_response(self, path: str, scope):
+        try:
+            return await super().get_response(path, scope)
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            location = await run_in_threadpool(legacy_location, path.replace(os.sep, "/"))
+            if location is None:
+                raise
+            return RedirectResponse(location, status_code=301)
+
+#####################################################
+# --- Job Results ---
+#####################################################
+
+def save_job_result(job_id: int, filename: str, source_path: str) -> str:
+    """Moves a finished job's output file into storage. Returns its location."""
+    if ENVIRONMENT == "local":
+        result_dir = os.path.join(JOB_RESULTS_ROOT, str(job_id))
+        os.makedirs(result_dir, exist_ok=True)
+        location = os.path.join(result_dir, filename)
+        shutil.move(source_path, location)
+        return location
+    else:
+        blob_path = f"jobs/{job_id}/{filename}"
+        get_bucket().blob(blob_path).upload_from_filename(source_path)
+        os.remove(source_path)
+        return blob_path
+
+def open_job_result(location: str):
+    """Binary file object for a stored job result."""
+    if ENVIRONMENT == "local":
+        return open(location, "rb")
+    else:
+        return get_bucket().blob(location).open("rb")
+
+def delete_job_result(location: str):
+    if ENVIRONMENT == "local":
+        shutil.rmtree(os.path.dirname(location), ignore_errors=True)
+    else:
         try:
-            client = storage.Client()
-            bucket = client.bucket(BUCKET_NAME)
-            
-            # Extract blob name from URL
-            # A simple way for GCS public URLs: split by bucket name
-            blob_name = file_path.split(f"{BUCKET_NAME}/")[-1]
-            
-            blob = bucket.blob(blob_name)
-            blob.delete()
+            get_bucket().blob(location).delete()
         except Exception as e:
-            print(f"Error deleting from GCS: {e}")
\ No newline at end of file
+            print(f"Error deleting from GCS: {e}")
@@ -0,0 +1,106 @@
+from typing import NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.orm import Session
+
+import models
+
+# Columns a terminal needs for its local patient index / quick search
+SUMMARY_COLUMNS = (
+    models.Patient.id,
+    models.Patient.display_id,
+    models.Patient.name,
+    models.Patient.date_of_birth,
+    models.Patient.phone_number_primary,
+    models.Patient.phone_number_secondary,
+    models.Patient.father_name,
+    models.Patient.mother_name,
+    models.Patient.version,
+)
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+
+#####################################################
+# --- Cursor ---
+#####################################################
+# The cursor is opaque to clients. Internally it is either:
+#   "<since>"                     -> everything written by transactions with id >= since
+#   "<since>.<horizon>.<xid>.<id>" -> mid catch-up: continue after patient (xid, id)
+# A catch-up ends on the snapshot xmin of its *first* page (the horizon): every
+# transaction below it had finished before the first page was read. Transactions
+# still in flight then may commit while the client pages, with rows behind the
+# page position, so the next catch-up starts from the horizon and picks them up.
+# Rows re-sent that way are harmless (clients upsert by id).
+
+class Cursor(NamedTuple):
+    since: int
+    horizon: Optional[int] = None  # first page's snapshot xmin (mid catch-up only)
+    after: Optional[Tuple[int, UUID]] = None  # last row sent (mid catch-up only)
+
+def decode_cursor(cursor: Optional[str]) -> Cursor:
+    """Raises ValueError for anything encode_cursor didn't produce."""
+    if not cursor:
+        return Cursor(0)
+    parts = cursor.split(".")
+    if len(parts) == 1:
+        return Cursor(int(parts[0]))
+    if len(parts) == 4:
+        return Cursor(int(parts[0]), int(parts[1]), (int(parts[2]), UUID(parts[3])))
+    raise ValueError("Invalid sync cursor")
+
+def encode_cursor(cursor: Cursor) -> str:
+    if cursor.after is None:
+        return str(cursor.since)
+    return f"{cursor.since}.{cursor.horizon}.{cursor.after[0]}.{cursor.after[1]}"
+
+#####################################################
+# --- Change Feed ---
+#####################################################
+
+def get_changes(db: Session, cursor: Optional[str], limit: int = DEFAULT_PAGE_SIZE) -> dict:
+    """
+    Patient summaries created/updated since `cursor`, and (on the last page of a
+    catch-up) IDs deleted since it.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    position = decode_cursor(cursor)
+
+    if position.after is None:
+        # First page, taken before reading: anything committed later is picked up next time
+        horizon = db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+        changed_since = models.Patient.change_xid >= position.since
+    else:
+        horizon = position.horizon
+        changed_since = tuple_(models.Patient.change_xid, models.Patient.id) > tuple_(*position.after)
+
+    rows = db.execute(
+        select(*SUMMARY_COLUMNS, models.Patient.change_xid)
+        .where(changed_since)
+        .order_by(models.Patient.change_xid, models.Patient.id)
+        .limit(limit + 1)
+    ).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if has_more:
+        next_cursor = Cursor(position.since, horizon, (rows[-1].change_xid, rows[-1].id))
+        deleted = []  # sent once, with the last page
+    else:
+        # Never move backwards, even if an old cursor is replayed
+        next_cursor = Cursor(max(horizon, position.since))
+        # A first sync has nothing to delete
+        deleted = [] if position.since == 0 else db.execute(
+            select(models.PatientTombstone.patient_id)
+            .where(models.PatientTombstone.change_xid >= position.since)
+            .order_by(models.PatientTombstone.change_xid)
+        ).scalars().all()
+
+    return {
+        "changes": rows,
+        "deleted": deleted,
+        "cursor": encode_cursor(next_cursor),
+        "has_more": has_more,
+    }
@@ -0,0 +1,165 @@
+"""
+Representative data for the query-budget tests: enough patients, visits and
+dispensations that an endpoint doing per-row queries blows its budget.
+"""
+import os
+from datetime import date, time, timedelta
+
+from sqlalchemy import insert
+
+import models, database, duplicates, reports, storage
+from main import create_sibling_links, get_password_hash
+
+PATIENTS = 60
+FAMILY_SIZE = 3
+VISITS_PER_PATIENT = 6
+DISPENSATIONS_PER_VISIT = 3
+
+TODAY = date.today()
+# The report tests ask for this week: a slice of the seeded visits, not all of them
+REPORT_START = TODAY - timedelta(days=6)
+REPORT_END = TODAY
+
+FIRST_NAMES = ["Aiden", "Mei Ling", "Nur Aisyah", "Arjun", "Sofia", "Wei Jie", "Hana", "Ravi", "Chloe", "Irfan"]
+FAMILY_NAMES = ["Tan", "Lim", "Wong", "Abdullah", "Kumar", "Lee", "Ng", "Ismail", "Raj", "Chong", "Ong", "Yap"]
+
+
+def _patient(i: int) -> models.Patient:
+    family = FAMILY_NAMES[(i // FAMILY_SIZE) % len(FAMILY_NAMES)]
+    return models.Patient(
+        display_id=f"S{i + 1}",
+        name=f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {family} {i}",
+        date_of_birth=TODAY - timedelta(days=200 + 37 * i),
+        sex="MF"[i % 2],
+        address=f"{i} Jalan Seed",
+        phone_number_primary=f"01{i:08d}",
+        mother_name=f"Mother {family} {i // FAMILY_SIZE}",
+        languages_parents=["English"],
+        languages_children=["English"],
+        allergies="Penicillin (rash)" if i % 3 == 2 else None,
+    )
+
+
+def _visit(patient_id, i: int, j: int, receipt: int) -> models.Visit:
+    # Spread over ~2 years (two partitions), newest within the report week
+    visit_date = TODAY - timedelta(days=(i % 7) + 120 * j)
+    # Everyone's latest visit came with an MC
+    mc_days = 1 + i % 3 if j == 0 else None
+    return models.Visit(
+        patient_id=patient_id,
+        date=visit_date,
+        time=time(9 + j % 8, (i * 7) % 60),
+        weight=3.5 + 0.8 * j + (i % 5) * 0.1,
+        age_at_visit=f"{j + 1}m",
+        doctor_notes="Seeded visit",
+        total_charge=40.0 + 5 * (i % 4),
+        payment_method=("Cash", "TnG", "Online")[(i + j) % 3],
+        receipt_number=f"R{receipt:05d}",
+        mc_days=mc_days,
+        mc_start_date=visit_date if mc_days else None,
+        mc_end_date=visit_date + timedelta(days=mc_days - 1) if mc_days else None,
+    )
+
+
+def seed(pin: str) -> dict:
+    """Inserts the data set and returns the IDs the tests need."""
+    db = database.SessionLocal()
+    try:
+        db.add(models.SystemConfig(key="admin_pin", value=get_password_hash(pin)))
+
+        patients = [_patient(i) for i in range(PATIENTS)]
+        db.add_all(patients)
+        db.flush()
+
+        receipt = 1000
+        visits = []
+        for i, patient in enumerate(patients):
+            for j in range(VISITS_PER_PATIENT):
+                receipt += 1
+                visits.append(_visit(patient.id, i, j, receipt))
+        db.add_all(visits)
+        db.flush()
+
+        db.execute(insert(models.DispensationItem), [
+            {
+                "visit_id": v.visit_id, "visit_date": v.date,
+                "medicine_name": f"Medicine {k}", "instructions": "tds", "quantity": "60ml",
+                "notes": None, "is_dispensed": True,
+            }
+            for v in visits for k in range(DISPENSATIONS_PER_VISIT)
+        ])
+        db.execute(insert(models.VisitAttachment), [
+            {
+                "visit_id": v.visit_id, "visit_date": v.date, "file_path": f"/uploads/{v.visit_id}/scan.jpg",
+                "file_type": "image/jpeg", "original_filename": "scan.jpg",
+            }
+            for v in visits
+        ])
+
+        # Families of FAMILY_SIZE, everyone linked to everyone
+        families = [patients[k:k + FAMILY_SIZE] for k in range(0, PATIENTS, FAMILY_SIZE)]
+        create_sibling_links(db, [(a.id, b.id) for family in families for a in family for b in family if a is not b])
+
+        reports.refresh_daily_takings(db, {v.date for v in visits})
+
+        # Every other patient had their birth doses
+        vaccinations = [
+            models.VaccinationRecord(patient_id=p.id, vaccine=vaccine, dose=1, date_given=p.date_of_birth)
+            for p in patients[::2] for vaccine in ("BCG", "Hepatitis B")
+        ]
+        db.add_all(vaccinations)
+        db.flush()
+        schedule = [
+            {"vaccine": d.vaccine, "dose": d.dose, "due_age_days": d.due_age_days,
+             "overdue_after_days": d.overdue_after_days, "max_age_days": d.max_age_days}
+            for d in db.query(models.VaccinationScheduleDose).all()
+        ]
+
+        # Jobs: one waiting (to cancel), one finished with a downloadable result
+        queued = models.Job(kind="finance_csv", params={"start_date": str(REPORT_START), "end_date": str(REPORT_END)})
+        result_path = os.path.join(storage.JOB_RESULTS_ROOT, "seed_result.csv")
+        os.makedirs(storage.JOB_RESULTS_ROOT, exist_ok=True)
+        with open(result_path, "w") as f:
+            f.write("Date,Total\n")
+        finished = models.Job(
+            kind="finance_csv", params={}, status="succeeded", progress=1.0,
+            result_location=result_path, result_filename="seed_result.csv", result_media_type="text/csv",
+        )
+        db.add_all([queued, finished])
+        db.flush()
+
+        # Each destructive test gets records nobody else uses
+        family_of = {p.id: family for family in families for p in family}
+        visit_of = {}
+        for v in visits:
+            visit_of.setdefault(v.patient_id, []).append(v.visit_id)
+        ids = {
+            "patient_id": patients[0].id,
+            "sibling_id": patients[1].id,
+            "visit_id": visit_of[patients[0].id][0],
+            "update_patient_id": patients[3].id,
+            "update_visit_id": visit_of[patients[4].id][0],
+            "delete_patient_id": patients[6].id,
+            "merge_keep_id": patients[9].id,
+            "merge_duplicate_id": patients[12].id,
+            "link_patient_id": patients[15].id,
+            "link_sibling_id": patients[18].id,  # joins the other family
+            "unlink_patient_id": patients[21].id,
+            "unlink_sibling_id": family_of[patients[21].id][1].id,
+            "delete_visit_id": visit_of[patients[24].id][0],
+            "upload_visit_id": visit_of[patients[27].id][0],
+            "delete_attachment_id": db.query(models.VisitAttachment.id)
+                .filter(models.VisitAttachment.visit_id == visit_of[patients[30].id][0]).scalar(),
+            "allergy_patient_id": patients[2].id,  # penicillin allergy, dispensed this week
+            "vaccination_patient_id": patients[33].id,  # odd: no records yet
+            "delete_vaccination_id": next(r.id for r in vaccinations if r.patient_id == patients[36].id),
+            "vaccination_schedule": schedule,  # the migration's, put back unchanged
+            "queued_job_id": queued.id,
+            "finished_job_id": finished.id,
+        }
+        # Builds the duplicate-detection keys for everyone
+        duplicates.ensure_keys(db)
+        db.commit()
+        return ids
+    finally:
+        db.close()
@@ -0,0 +1,78 @@
+"""
+The audit trail against the seeded database: deleting a patient with one
+cascading statement still leaves an entry for every row it took with it.
+"""
+from datetime import date, time, timedelta
+from time import monotonic, sleep
+
+import pytest
+from sqlalchemy import delete, select
+
+
+@pytest.fixture
+def family(seed):
+    import database, models
+    from main import create_sibling_links
+
+    visit_date = date.today() - timedelta(days=3)
+    with database.SessionLocal() as db:
+        child, sibling = (
+            models.Patient(display_id=display_id, name=f"Audit Test {display_id}", date_of_birth=date(2024, 5, 1),
+                           sex="F", address="1 Jalan Audit", phone_number_primary="0190000000",
+                           languages_parents=["English"], languages_children=["English"])
+            for display_id in ("AUD1", "AUD2")
+        )
+        db.add_all([child, sibling])
+        db.flush()
+        create_sibling_links(db, [(child.id, sibling.id)])
+        visit = models.Visit(patient_id=child.id, date=visit_date, time=time(10, 30), weight=9.1)
+        db.add(visit)
+        db.flush()
+        db.add_all([
+            models.DispensationItem(visit_id=visit.visit_id, visit_date=visit_date, medicine_name="Paracetamol", quantity="60ml"),
+            models.VisitAttachment(visit_id=visit.visit_id, visit_date=visit_date, file_path="/uploads/audit/test.jpg",
+                                   file_type="image", original_filename="test.jpg"),
+            models.VaccinationRecord(patient_id=child.id, vaccine="BCG", dose=1, date_given=visit_date),
+        ])
+        db.commit()
+        ids = child.id, sibling.id
+    try:
+        yield ids
+    finally:
+        with database.engine.begin() as conn:
+            conn.execute(delete(models.Patient).where(models.Patient.id.in_(ids)))
+            conn.execute(delete(models.PatientTombstone).where(models.PatientTombstone.patient_id.in_(ids)))
+            conn.execute(delete(models.AuditLog).where(models.AuditLog.patient_id.in_(ids)))
+            conn.execute(delete(models.StorageCleanup).where(models.StorageCleanup.file_path == "/uploads/audit/test.jpg"))
+
+
+def _audited(patient_id, expected: int, timeout: float = 5.0):
+    import audit, database, models
+
+    # Entries are written by the background writer: wait for them to land
+    deadline = monotonic() + timeout
+    while True:
+        audit.writer.drain()
+        with database.engine.connect() as conn:
+            rows = conn.execute(
+                select(models.AuditLog.table_name, models.AuditLog.action, models.AuditLog.changes)
+                .where(models.AuditLog.patient_id == patient_id, models.AuditLog.action == "delete")
+            ).all()
+        if len(rows) >= expected or monotonic() > deadline:
+            return rows
+        sleep(0.05)
+
+
+def test_patient_delete_audits_every_cascaded_row(client, family):
+    child_id, sibling_id = family
+    assert client.delete(f"/api/patients/{child_id}").status_code == 200
+
+    rows = _audited(child_id, 7)
+    assert sorted(table for table, _, _ in rows) == [
+        "dispensation_items", "patient_siblings", "patient_siblings", "patients",
+        "vaccination_records", "visit_attachments", "visits",
+    ]
+    changes = {table: c for table, _, c in rows}
+    assert changes["dispensation_items"]["medicine_name"] == ["Paracetamol", None]
+    assert changes["visit_attachments"]["file_path"] == ["/uploads/audit/test.jpg", None]
+    assert changes["visits"]["weight"] == [9.1, None]
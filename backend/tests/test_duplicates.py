@@ -0,0 +1,96 @@
+"""
+Duplicate detection (duplicates.py) against the seeded database: siblings,
+however they are linked, are never offered as duplicates of each other, and the
+registry scan doesn't write.
+"""
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+DOB = date.today() - timedelta(days=400)
+
+
+def _register(client, display_id, name, sibling_ids=(), allow_duplicate=False):
+    return client.post("/api/patients/", params={"allow_duplicate": allow_duplicate}, json={
+        "display_id": display_id,
+        "name": name,
+        "date_of_birth": str(DOB),
+        "sex": "F",
+        "address": "7 Jalan Kembar",
+        "phone_number_primary": "0177770000",
+        "mother_name": "Nurul Huda",
+        "languages_parents": ["Malay"],
+        "languages_children": ["Malay"],
+        "sibling_ids": [str(s) for s in sibling_ids],
+    })
+
+
+def _pairs(client):
+    response = client.get("/api/patients/duplicates")
+    assert response.status_code == 200
+    return {frozenset((p["patient"]["id"], p["duplicate"]["id"])) for p in response.json()}
+
+
+@pytest.fixture
+def triplets(client, seed):
+    created = []
+    try:
+        first = _register(client, "TW1", "Qistina Farhan")
+        assert first.status_code == 200
+        created.append(first.json()["id"])
+        # Same birthday, phone and mother: only the sibling link keeps these apart
+        second = _register(client, "TW2", "Qistina Farhana", sibling_ids=[created[0]])
+        assert second.status_code == 200, second.json()
+        created.append(second.json()["id"])
+        # Names only the second triplet: the first is in her network
+        third = _register(client, "TW3", "Qistina Farhanah", sibling_ids=[created[1]])
+        assert third.status_code == 200, third.json()
+        created.append(third.json()["id"])
+        yield created
+    finally:
+        for patient_id in created:
+            client.delete(f"/api/patients/{patient_id}")
+
+
+def test_sibling_network_is_not_a_duplicate(client, triplets):
+    check = client.post("/api/patients/duplicates/check", json={
+        "display_id": "TW4", "name": "Qistina Farhanna", "date_of_birth": str(DOB), "sex": "F",
+        "address": "7 Jalan Kembar", "phone_number_primary": "0177770000", "mother_name": "Nurul Huda",
+        "languages_parents": ["Malay"], "languages_children": ["Malay"], "sibling_ids": [triplets[2]],
+    })
+    assert check.status_code == 200
+    assert check.json() == []
+
+
+def test_scan_leaves_out_linked_siblings(client, triplets):
+    pairs = _pairs(client)
+    assert not any(pair <= set(triplets) for pair in pairs)
+
+    lookalike = _register(client, "TW5", "Qistina Farhan", allow_duplicate=True).json()["id"]
+    try:
+        assert frozenset((triplets[0], lookalike)) in _pairs(client)
+    finally:
+        client.delete(f"/api/patients/{lookalike}")
+
+
+def test_scan_with_stale_keys_writes_nothing(client, triplets):
+    import database, duplicates, models
+
+    config = models.SystemConfig.__table__
+    lookalike = _register(client, "TW6", "Qistina Farhan", allow_duplicate=True).json()["id"]
+    try:
+        with database.engine.begin() as conn:
+            conn.execute(update(config).where(config.c.key == duplicates.KEYS_VERSION_CONFIG).values(value="0"))
+
+        assert frozenset((triplets[0], lookalike)) in _pairs(client)
+        with database.engine.connect() as conn:
+            version = conn.execute(
+                select(config.c.value).where(config.c.key == duplicates.KEYS_VERSION_CONFIG)
+            ).scalar()
+        assert version == "0"
+    finally:
+        with database.engine.begin() as conn:
+            conn.execute(update(config).where(config.c.key == duplicates.KEYS_VERSION_CONFIG)
+                         .values(value=duplicates.KEYS_VERSION))
+        client.delete(f"/api/patients/{lookalike}")
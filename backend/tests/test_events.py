@@ -0,0 +1,75 @@
+"""
+The change events behind the live update stream (the notify_clinic_event
+triggers), read with a LISTEN connection against the seeded database.
+"""
+import json
+from datetime import date
+from time import monotonic, sleep
+
+import pytest
+from sqlalchemy import delete
+
+
+@pytest.fixture
+def listener(seed):
+    import database, events
+
+    conn = database.listen_connection()
+    conn.cursor().execute(f"LISTEN {events.NOTIFY_CHANNEL}")
+
+    def received(timeout: float = 2.0, settle: float = 0.1):
+        """Patient events sent since the last call, as {(action, patient_id)}."""
+        # Sent on commit, before the response: collect until none arrive for `settle`s
+        deadline = monotonic() + timeout
+        payloads = []
+        while monotonic() < deadline:
+            conn.poll()
+            if conn.notifies:
+                payloads.extend(json.loads(n.payload) for n in conn.notifies)
+                conn.notifies.clear()
+                deadline = min(deadline, monotonic() + settle)
+            sleep(0.02)
+        return {(p["action"], p["patient_id"]) for p in payloads if p["entity"] == "patient"}
+
+    try:
+        yield received
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def brothers(seed):
+    import database, models
+
+    with database.SessionLocal() as db:
+        patients = [
+            models.Patient(display_id=display_id, name=f"Event Test {display_id}", date_of_birth=date(2023, 8, 1),
+                           sex="M", address="2 Jalan Event", phone_number_primary="0191111111",
+                           languages_parents=["English"], languages_children=["English"])
+            for display_id in ("EVT1", "EVT2")
+        ]
+        db.add_all(patients)
+        db.commit()
+        ids = [str(p.id) for p in patients]
+    try:
+        yield ids
+    finally:
+        with database.engine.begin() as conn:
+            conn.execute(delete(models.Patient).where(models.Patient.id.in_(ids)))
+            conn.execute(delete(models.PatientTombstone).where(models.PatientTombstone.patient_id.in_(ids)))
+            conn.execute(delete(models.AuditLog).where(models.AuditLog.patient_id.in_(ids)))
+
+
+def test_sibling_links_notify_both_patients(client, brothers, listener):
+    first, second = brothers
+    assert client.post(f"/api/patients/{first}/siblings/{second}").status_code == 200
+    assert listener() == {("update", first), ("update", second)}
+
+    assert client.delete(f"/api/patients/{first}/siblings/{second}").status_code == 200
+    assert listener() == {("update", first), ("update", second)}
+
+    # A deleted patient's links report only the sibling left behind
+    assert client.post(f"/api/patients/{first}/siblings/{second}").status_code == 200
+    listener()
+    assert client.delete(f"/api/patients/{first}").status_code == 200
+    assert listener() == {("delete", first), ("update", second)}
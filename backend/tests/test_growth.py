@@ -0,0 +1,107 @@
+"""
+WHO weight-for-age z-scores (growth.py) against the published WHO Child Growth
+Standards tables. Pure NumPy, no database needed.
+
+Reference lines are the SD columns of WHO's wfa_boys/girls_0-to-5-years_zscores
+tables, which are printed to 0.1 kg: a line is matched to within the z that
+0.05 kg is worth at that age.
+"""
+import numpy as np
+import pytest
+
+import growth
+
+# (sex, month, published SD3neg, SD2neg, SD0, SD2, SD3) in kg
+WHO_SD_LINES = [
+    ("M", 12, 6.9, 7.7, 9.6, 12.0, 13.3),
+    ("M", 36, 10.0, 11.3, 14.3, 18.3, 20.7),
+    ("M", 60, 12.4, 14.1, 18.3, 24.2, 27.9),
+    ("F", 6, 5.1, 5.7, 7.3, 9.3, 10.6),
+    ("F", 36, 9.6, 10.8, 13.9, 18.1, 20.9),
+    ("F", 60, 12.1, 13.7, 18.2, 24.9, 29.5),
+]
+
+
+def _z(sex, age_months, weight):
+    return growth.weight_for_age_z(np.array([sex], dtype=object), np.array([age_months]), np.array([weight]))[0]
+
+
+def _lms(sex, month):
+    months, L, M, S = growth.load_lms_table()[sex]
+    i = int(np.flatnonzero(months == month)[0])
+    return L[i], M[i], S[i]
+
+
+def _rounding_tolerance(sex, month, weight):
+    # z moves by about delta / (weight * S) for a small change in weight (a
+    # little more in the tails, where the curve bends)
+    _, _, S = _lms(sex, month)
+    return 1.25 * 0.05 / (weight * S)
+
+
+def test_table_covers_birth_to_five_years():
+    for sex in ("M", "F"):
+        months, *_ = growth.load_lms_table()[sex]
+        assert months[0] == 0 and months[-1] == 60
+        assert np.array_equal(months, np.arange(61))
+
+
+@pytest.mark.parametrize("sex,month,sd3neg,sd2neg,sd0,sd2,sd3", WHO_SD_LINES)
+def test_published_sd_lines(sex, month, sd3neg, sd2neg, sd0, sd2, sd3):
+    for weight, expected in ((sd3neg, -3), (sd2neg, -2), (sd0, 0), (sd2, 2), (sd3, 3)):
+        assert _z(sex, month, weight) == pytest.approx(expected, abs=_rounding_tolerance(sex, month, weight))
+
+
+@pytest.mark.parametrize("sex,month", [("M", 12), ("F", 36), ("M", 60)])
+def test_median_and_lms_curve(sex, month):
+    L, M, S = _lms(sex, month)
+    assert _z(sex, month, M) == pytest.approx(0, abs=1e-12)
+    for z in (-2.5, -1, 1, 2.5):
+        assert _z(sex, month, growth._lms_value(L, M, S, z)) == pytest.approx(z, abs=1e-9)
+
+
+@pytest.mark.parametrize("sex,month,sd3neg,sd2neg,sd0,sd2,sd3", WHO_SD_LINES)
+def test_tail_adjustment_beyond_three_sd(sex, month, sd3neg, sd2neg, sd0, sd2, sd3):
+    # WHO: past +/-3 SD, z grows linearly by the distance between the 2 and 3 SD lines
+    L, M, S = _lms(sex, month)
+    sd3_pos, sd2_pos = growth._lms_value(L, M, S, 3), growth._lms_value(L, M, S, 2)
+    sd3_neg, sd2_neg = growth._lms_value(L, M, S, -3), growth._lms_value(L, M, S, -2)
+
+    assert _z(sex, month, sd3_pos + (sd3_pos - sd2_pos)) == pytest.approx(4, abs=1e-9)
+    assert _z(sex, month, sd3_neg - 1.5 * (sd2_neg - sd3_neg)) == pytest.approx(-4.5, abs=1e-9)
+
+    # Same with the published (rounded) lines
+    high = sd3 + (sd3 - sd2)
+    assert _z(sex, month, high) == pytest.approx(4, abs=3 * _rounding_tolerance(sex, month, high))
+
+    # The adjustment matters: plain LMS puts that weight elsewhere
+    raw_z = (((sd3_pos + (sd3_pos - sd2_pos)) / M) ** L - 1) / (L * S)
+    assert abs(raw_z - 4) > 0.05
+
+
+def test_interpolates_between_months():
+    _, m12, _ = _lms("M", 12)
+    _, m13, _ = _lms("M", 13)
+    assert _z("M", 12.5, (m12 + m13) / 2) == pytest.approx(0, abs=1e-12)
+
+
+def test_no_z_score_outside_the_table():
+    z = growth.weight_for_age_z(
+        np.array(["M", "F", None, "M"], dtype=object),
+        np.array([60.5, -0.1, 12, 12]),
+        np.array([18.3, 3.2, 9.6, np.nan]),
+    )
+    assert np.isnan(z).all()
+
+
+def test_percentiles():
+    pct = growth.z_to_percentile(np.array([0, 1.959964, -1.880794, 2.67]))
+    assert pct == pytest.approx([50, 97.5, 3, 99.62], abs=1e-3)
+
+
+def test_registry_ages_are_continuous_months():
+    ages = growth.age_in_months(
+        np.array(["2021-01-01"], dtype="datetime64[D]"), np.array(["2026-01-01"], dtype="datetime64[D]")
+    )
+    assert ages[0] == pytest.approx(1826 / growth.DAYS_PER_MONTH)
+    assert not np.isnan(_z("F", ages[0], 18.2))
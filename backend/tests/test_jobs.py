@@ -0,0 +1,88 @@
+"""
+The job routes against the seeded database: admin jobs (backups, snapshots)
+need the admin PIN to be seen, downloaded or cancelled, and params that don't
+fit the task are refused up front.
+"""
+import os
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import delete
+
+from conftest import TEST_PIN
+
+
+@pytest.fixture
+def backup_job(seed):
+    import database, models, storage
+
+    result_path = os.path.join(storage.JOB_RESULTS_ROOT, "test_backup.sql")
+    with open(result_path, "w") as f:
+        f.write("-- dump\n")
+    with database.SessionLocal() as db:
+        job = models.Job(
+            kind="backup", params={}, status="succeeded", progress=1.0, progress_message="Running pg_dump",
+            result_location=result_path, result_filename="test_backup.sql", result_media_type="application/octet-stream",
+        )
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    try:
+        yield job_id
+    finally:
+        with database.engine.begin() as conn:
+            conn.execute(delete(models.Job).where(models.Job.id == job_id))
+
+
+def test_admin_jobs_need_the_pin(client, backup_job):
+    for method, path in (("GET", ""), ("GET", "/result"), ("POST", "/cancel")):
+        assert client.request(method, f"/api/jobs/{backup_job}{path}").status_code == 401
+        assert client.request(method, f"/api/jobs/{backup_job}{path}", params={"pin": "000000"}).status_code == 401
+
+    assert client.get(f"/api/jobs/{backup_job}", params={"pin": TEST_PIN}).json()["has_result"]
+    response = client.get(f"/api/jobs/{backup_job}/result", params={"pin": TEST_PIN})
+    assert response.status_code == 200 and response.text == "-- dump\n"
+
+
+def test_listing_hides_admin_results_without_the_pin(client, backup_job):
+    [listed] = client.get("/api/jobs", params={"kind": "backup"}).json()
+    assert listed["id"] == backup_job and listed["status"] == "succeeded"
+    assert not listed["has_result"] and listed["result_filename"] is None
+
+    [listed] = client.get("/api/jobs", params={"kind": "backup", "pin": TEST_PIN}).json()
+    assert listed["has_result"] and listed["result_filename"] == "test_backup.sql"
+    assert client.get("/api/jobs", params={"pin": "000000"}).status_code == 401
+
+    # Other kinds are listed in full either way
+    assert any(job["has_result"] for job in client.get("/api/jobs", params={"kind": "finance_csv"}).json())
+
+
+@pytest.mark.parametrize("params", [
+    {},
+    {"start_date": "2026-01-01"},
+    {"start_date": "2026-01-01", "end_date": "2026-01-31", "colour": "red"},
+    {"start_date": "2026-01-01", "end_date": "31/01/2026"},
+    {"start_date": "2026-02-01", "end_date": "2026-01-31"},
+    {"start_date": "2026-01-01", "end_date": "2026-01-31", "group_by": "week"},
+    {"start_date": "2026-01-01", "end_date": "2026-01-31", "receipts": "yes"},
+])
+def test_bad_params_are_rejected(client, params):
+    response = client.post("/api/jobs", json={"kind": "finance_csv", "params": params})
+    assert response.status_code == 400 and "Invalid params for finance_csv" in response.json()["detail"]
+
+
+def test_bad_params_fail_without_retrying(seed):
+    import database, jobs, models
+
+    with database.SessionLocal() as db:
+        job = jobs.enqueue(db, "finance_csv", {"start_date": "2026-01-01"})
+        db.commit()
+        job_id = job.id
+    try:
+        jobs.run_job(SimpleNamespace(id=job_id, kind="finance_csv", params={"start_date": "2026-01-01"}, attempts=1, max_attempts=3))
+        with database.SessionLocal() as db:
+            job = db.get(models.Job, job_id)
+            assert job.status == "failed" and "end_date" in job.error
+    finally:
+        with database.engine.begin() as conn:
+            conn.execute(delete(models.Job).where(models.Job.id == job_id))
@@ -0,0 +1,81 @@
+"""
+The allergy and repeat dispensing check (medication_checks.py) against the
+shipped term table (data/medicine_terms.csv). Pure, no database needed.
+"""
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import medication_checks as mc
+
+
+def _alerts(allergies, medicine, recent=()):
+    [line] = mc.check_lines(allergies, [medicine], recent)
+    return [(a["kind"], a["blocking"]) for a in line["alerts"]]
+
+
+def test_longest_match_wins():
+    concepts = mc.concepts_for("Penicillin V 250mg tds")
+    assert concepts.terms == ("penicillin v",)
+    assert concepts.ingredients == {"phenoxymethylpenicillin"}
+
+    concepts = mc.concepts_for("Mefenamic acid 250mg")
+    assert concepts.terms == ("mefenamic acid",)
+    assert concepts.classes == {"nsaids"}
+
+
+def test_brands_spellings_and_strengths():
+    assert mc.concepts_for("Augmentin 228mg/5ml susp").ingredients == {"amoxicillin", "clavulanic acid"}
+    assert mc.concepts_for("AMOXYCILLIN 125mg/5ml").ingredients == {"amoxicillin"}
+    assert mc.concepts_for("Calpol 5ml prn, Brufen 5ml").ingredients == {"paracetamol", "ibuprofen"}
+    assert mc.concepts_for("Vitamin drops 1ml") == mc.NO_CONCEPTS
+
+
+def test_class_word_names_no_ingredient():
+    concepts = mc.concepts_for("Penicillin allergy")
+    assert concepts.ingredients == frozenset()
+    assert concepts.classes == {"penicillins"}
+
+
+@pytest.mark.parametrize("allergies,medicine,expected", [
+    # Allergy to an ingredient: anything containing it blocks...
+    ("Amoxicillin (rash)", "Augmentin 228mg/5ml", [("allergy", True)]),
+    # ...other drugs of its classes only warn
+    ("Amoxicillin (rash)", "Cloxacillin 125mg", [("related_allergy", False)]),
+    ("Amoxicillin (rash)", "Cefalexin 125mg", [("related_allergy", False)]),
+    # Allergy to a class: every member blocks, neighbouring classes warn
+    ("Penicillin allergy", "Cloxacillin 125mg", [("allergy", True)]),
+    ("Penicillin allergy", "Cefalexin 125mg", [("related_allergy", False)]),
+    ("Penicillin allergy", "Paracetamol 120mg/5ml", []),
+    ("NSAIDs", "Ponstan 250mg", [("allergy", True)]),
+])
+def test_class_versus_ingredient(allergies, medicine, expected):
+    assert _alerts(allergies, medicine) == expected
+
+
+@pytest.mark.parametrize("allergies", [
+    "No known drug allergy", "NKDA", "nkda.", "Nil known allergies", "None", "No drug allergies", "", None,
+])
+def test_no_known_drug_allergy_wording(allergies):
+    for medicine in ("Amoxicillin 250mg", "Paracetamol", "Brufen", "Unlisted Brandname syrup"):
+        assert _alerts(allergies, medicine) == []
+
+
+def test_unknown_word_only_warns():
+    # "Zyrtexa" isn't in the term table: a shared word is a hint, not a match
+    assert _alerts("Zyrtexa (hives)", "Zyrtexa syrup 2.5ml") == [("allergy_mention", False)]
+    result = {"lines": mc.check_lines("Zyrtexa (hives)", ["Zyrtexa syrup 2.5ml"])}
+    assert mc.blocking_alerts(result) == []
+
+
+def test_repeats_within_the_visit_and_window():
+    recent = [SimpleNamespace(medicine_name="Panadol 250mg", visit_id=7, date=date(2026, 3, 2))]
+    lines = mc.check_lines(None, ["Calpol 5ml", "Brufen 5ml", "Uphamol 250mg"], recent)
+
+    calpol = {a["kind"]: a for a in lines[0]["alerts"]}
+    assert set(calpol) == {"repeated_line", "recent_dispensing"}
+    assert "line 3" in calpol["repeated_line"]["message"]
+    assert calpol["recent_dispensing"]["visit_id"] == 7
+    assert not any(a["blocking"] for a in calpol.values())
+    assert lines[1]["alerts"] == []
@@ -0,0 +1,68 @@
+"""
+Moving old-layout uploads (migrate_uploads.py) against the seeded database,
+including an attachment deleted while its file is being moved.
+"""
+import os
+
+import pytest
+from sqlalchemy import delete, insert, select
+
+
+@pytest.fixture
+def legacy_attachments(seed):
+    import database, models, storage
+
+    table = models.VisitAttachment.__table__
+    with database.engine.connect() as conn:
+        visit = conn.execute(
+            select(models.Visit.visit_id, models.Visit.date).where(models.Visit.visit_id == seed["visit_id"])
+        ).one()
+    folder = os.path.join(storage.UPLOAD_ROOT, str(visit.visit_id))
+    os.makedirs(folder, exist_ok=True)
+    for name in ("growth_chart.jpg", "xray.png"):
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(name.encode())
+
+    # Two uploads of "growth_chart.jpg" overwrote each other: two rows, one file
+    paths = [f"{storage.UPLOAD_URL_PREFIX}/{visit.visit_id}/{name}" for name in ("growth_chart.jpg", "growth_chart.jpg", "xray.png")]
+    with database.engine.begin() as conn:
+        ids = conn.execute(insert(table).returning(table.c.id), [
+            {"visit_id": visit.visit_id, "visit_date": visit.date, "file_path": path,
+             "file_type": "image", "original_filename": path.rsplit("/", 1)[-1]}
+            for path in paths
+        ]).scalars().all()
+    try:
+        yield ids, folder
+    finally:
+        with database.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+
+
+def test_moves_files_and_reaps_deleted_rows(legacy_attachments, monkeypatch):
+    import database, migrate_uploads, models, storage
+
+    (chart_a, chart_b, xray), folder = legacy_attachments
+    table = models.VisitAttachment.__table__
+    move = migrate_uploads.migrate_file
+
+    def deleted_while_moving(legacy_path, ids, dry_run=False):
+        if xray in ids:
+            with database.engine.begin() as conn:
+                conn.execute(delete(table).where(table.c.id == xray))
+        return move(legacy_path, ids, dry_run)
+
+    monkeypatch.setattr(migrate_uploads, "migrate_file", deleted_while_moving)
+    totals = migrate_uploads.migrate(workers=2)
+
+    with database.engine.connect() as conn:
+        paths = dict(conn.execute(select(table.c.id, table.c.file_path).where(table.c.id.in_([chart_a, chart_b]))).all())
+    for attachment_id in (chart_a, chart_b):
+        new_path = storage.upload_url(migrate_uploads.migrated_key(attachment_id, "growth_chart.jpg"))
+        assert paths[attachment_id] == new_path
+        with open(storage.local_path(new_path), "rb") as f:
+            assert f.read() == b"growth_chart.jpg"
+
+    # The deleted attachment's file was moved, then removed again
+    assert not os.path.exists(storage.local_path(storage.upload_url(migrate_uploads.migrated_key(xray, "xray.png"))))
+    assert not os.path.exists(folder)
+    assert totals["attachments"] == 2 and totals["orphaned"] == 1
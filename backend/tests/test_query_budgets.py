@@ -0,0 +1,237 @@
+"""
+Every route in main.py, called against the seeded database, must stay within a
+fixed number of SQL statements and fetched rows. The seed is large enough that
+a per-row query (lazy loading in a loop, N+1) goes far over budget, and the
+failure prints the statements the request made.
+
+A new route fails test_every_route_has_a_budget until it gets a Case here.
+"""
+import shutil
+import string
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Optional
+
+import pytest
+from fastapi.routing import APIRoute
+
+from conftest import TEST_PIN
+from seed_data import REPORT_END, REPORT_START
+
+REPORT_RANGE = {"start_date": str(REPORT_START), "end_date": str(REPORT_END)}
+
+
+def _new_patient(display_id: str, **overrides) -> dict:
+    return {
+        "display_id": display_id,
+        "name": "Budget Test Child",
+        "date_of_birth": str(date.today() - timedelta(days=400)),
+        "sex": "F",
+        "address": "1 Jalan Budget",
+        "phone_number_primary": "0199999999",
+        "languages_parents": ["English"],
+        "languages_children": ["English"],
+        **overrides,
+    }
+
+def _visit(patient_id, medicines=("Paracetamol", "Cetirizine", "ORS")) -> dict:
+    return {
+        "patient_id": str(patient_id),
+        "date": str(date.today()),
+        "time": "10:30:00",
+        "weight": 9.5,
+        "total_charge": 45.0,
+        "payment_method": "Cash",
+        "receipt_number": "B0001",
+        "dispensations": [{"medicine_name": m, "quantity": "60ml", "notes": None} for m in medicines],
+    }
+
+
+def _search_cursor(name: str, patient_id) -> str:
+    import pagination  # imported late: the app modules read their configuration on import
+    return pagination.encode_cursor(name, patient_id)
+
+
+@dataclass
+class Case:
+    name: str
+    method: str
+    route: str  # exactly as declared in main.py
+    max_statements: int
+    max_rows: int
+    status: int = 200
+    # Route placeholder -> seed key (or a literal), when it isn't the placeholder's own name
+    path_args: dict = field(default_factory=dict)
+    request: Callable[[dict], dict] = lambda seed: {}
+    skip_reason: Optional[Callable[[], Optional[str]]] = None
+
+    def path(self, seed: dict) -> str:
+        names = [name for _, name, _, _ in string.Formatter().parse(self.route) if name]
+        values = {}
+        for name in names:
+            source = self.path_args.get(name, name)
+            values[name] = seed.get(source, source)
+        return self.route.format(**values)
+
+
+CASES = [
+    # --- Patients ---
+    Case("create_patient", "POST", "/api/patients/", 13, 10,
+         request=lambda s: {"params": {"allow_duplicate": True},
+                            "json": _new_patient("B1", sibling_ids=[str(s["patient_id"])])}),
+    Case("search_patients", "GET", "/api/patients/search/", 6, 202,
+         request=lambda s: {"params": {"name": "Tan", "limit": 10, "count": "exact"}}),
+    Case("search_patients_next_page", "GET", "/api/patients/search/", 5, 167,
+         request=lambda s: {"params": {"name": "Tan", "limit": 10,
+                                       "cursor": _search_cursor("Aiden Tan 0", s["patient_id"])}}),
+    Case("search_patients_sparse", "GET", "/api/patients/search/", 2, 7,
+         request=lambda s: {"params": {"query": "Tan", "limit": 10, "fields": "name,display_id", "count": "estimate"}}),
+    Case("search_patients_bad_cursor", "GET", "/api/patients/search/", 0, 0, status=400,
+         request=lambda s: {"params": {"query": "Tan", "cursor": "not-a-cursor"}}),
+    Case("check_duplicate_patient", "POST", "/api/patients/duplicates/check", 2, 3,
+         request=lambda s: {"json": _new_patient("B2", name="Aiden Tan 0")}),
+    # Registry-wide scan: reads every blocking key by design, but in a fixed number of queries
+    Case("find_duplicate_patients", "GET", "/api/patients/duplicates", 2, 264),
+    Case("patient_typeahead", "GET", "/api/patients/typeahead", 1, 0,
+         request=lambda s: {"params": {"q": "Ta"}}),
+    Case("get_patients_batch", "POST", "/api/patients/batch", 1, 2,
+         request=lambda s: {"params": {"fields": "name,display_id"},
+                            "json": {"ids": [str(s["patient_id"]), str(s["sibling_id"])]}}),
+    Case("get_patient", "GET", "/api/patients/{patient_id}", 6, 35),
+    Case("get_patient_sparse", "GET", "/api/patients/{patient_id}", 3, 8,
+         request=lambda s: {"params": {"fields": "name", "expand": "visits"}}),
+    Case("get_patient_growth", "GET", "/api/patients/{patient_id}/growth", 2, 7),
+    Case("update_patient", "PUT", "/api/patients/{patient_id}", 12, 37,
+         path_args={"patient_id": "update_patient_id"},
+         request=lambda s: {"json": _new_patient("S4", name="Arjun Lim 3", address="4 Jalan Baru",
+                                                   date_registered=str(date.today()))}),
+    # Reads every row the cascade removes, once per table, for the audit trail
+    Case("delete_patient", "DELETE", "/api/patients/{patient_id}", 12, 44,
+         path_args={"patient_id": "delete_patient_id"}),
+    Case("merge_patients", "POST", "/api/patients/{patient_id}/merge/{duplicate_id}", 12, 15,
+         path_args={"patient_id": "merge_keep_id", "duplicate_id": "merge_duplicate_id"}),
+    Case("get_patient_history", "GET", "/api/patients/{patient_id}/history", 1, 110),
+    Case("get_patient_vaccinations", "GET", "/api/patients/{patient_id}/vaccinations", 3, 15),
+    Case("record_vaccination", "POST", "/api/patients/{patient_id}/vaccinations", 4, 3,
+         path_args={"patient_id": "vaccination_patient_id"},
+         request=lambda s: {"json": {"vaccine": "BCG", "dose": 1, "date_given": str(date.today())}}),
+    Case("delete_vaccination", "DELETE", "/api/vaccinations/{record_id}", 2, 1,
+         path_args={"record_id": "delete_vaccination_id"}),
+    Case("get_vaccination_schedule", "GET", "/api/vaccinations/schedule", 1, 12),
+    Case("update_vaccination_schedule", "PUT", "/api/vaccinations/schedule", 4, 25,
+         request=lambda s: {"json": {"pin": TEST_PIN, "doses": s["vaccination_schedule"]}}),
+    Case("link_sibling", "POST", "/api/patients/{patient_id}/siblings/{sibling_id}", 4, 3,
+         path_args={"patient_id": "link_patient_id", "sibling_id": "link_sibling_id"}),
+    Case("unlink_sibling", "DELETE", "/api/patients/{patient_id}/siblings/{sibling_id}", 4, 3,
+         path_args={"patient_id": "unlink_patient_id", "sibling_id": "unlink_sibling_id"}),
+    Case("get_next_id", "GET", "/api/patients/next-id/{prefix}", 1, 1, path_args={"prefix": "S"}),
+
+    # --- Visits & attachments ---
+    Case("create_visit", "POST", "/api/visits/", 10, 10,
+         request=lambda s: {"json": _visit(s["patient_id"])}),
+    Case("create_visit_allergy_conflict", "POST", "/api/visits/", 1, 1, status=409,
+         request=lambda s: {"json": _visit(s["allergy_patient_id"], ("Augmentin 228mg/5ml",))}),
+    Case("get_visit", "GET", "/api/visits/{visit_id}", 4, 6),
+    Case("update_visit", "PUT", "/api/visits/{visit_id}", 14, 12,
+         path_args={"visit_id": "update_visit_id"},
+         request=lambda s: {"json": {**_visit(s["update_patient_id"], ("Amoxicillin",)), "patient_id": None}}),
+    Case("delete_visit", "DELETE", "/api/visits/{visit_id}", 6, 2,
+         path_args={"visit_id": "delete_visit_id"}),
+    Case("get_visit_history", "GET", "/api/visits/{visit_id}/history", 1, 110),
+    Case("print_visit_receipt", "GET", "/api/visits/{visit_id}/receipt.pdf", 2, 4),
+    Case("print_visit_mc", "GET", "/api/visits/{visit_id}/mc.pdf", 2, 4),
+    Case("check_dispensations", "POST", "/api/dispensations/check", 2, 4,
+         request=lambda s: {"json": {"patient_id": str(s["allergy_patient_id"]),
+                                     "medicines": ["Augmentin 228mg/5ml", "Medicine 1", "Panadol"]}}),
+    Case("upload_attachment", "POST", "/api/visits/{visit_id}/upload", 3, 2,
+         path_args={"visit_id": "upload_visit_id"},
+         request=lambda s: {"files": {"file": ("scan.jpg", b"\xff\xd8\xff\xe0budget", "image/jpeg")}}),
+    Case("delete_visit_attachment", "DELETE", "/api/attachments/{attachment_id}", 4, 2,
+         path_args={"attachment_id": "delete_attachment_id"}),
+
+    # --- Reports (rows grow with the date range, which is fixed to the seeded week) ---
+    Case("export_dispensations_csv", "GET", "/api/reports/dispensations/export-csv", 2, 350,
+         request=lambda s: {"params": REPORT_RANGE}),
+    Case("export_dispensations_pdf", "GET", "/api/reports/dispensations/export-pdf", 2, 350,
+         request=lambda s: {"params": REPORT_RANGE}),
+    Case("export_receipts_pdf", "GET", "/api/reports/receipts/export-pdf", 2, 42,
+         request=lambda s: {"params": {"day": str(REPORT_END)}}),
+    Case("get_finance_report", "GET", "/api/reports/finance", 1, 21,
+         request=lambda s: {"params": REPORT_RANGE}),
+    # The receipt check reads the range's visits, so it is opt-in
+    Case("get_finance_report_receipts", "GET", "/api/reports/finance", 4, 81,
+         request=lambda s: {"params": {**REPORT_RANGE, "receipts": True}}),
+    Case("export_finance_csv", "GET", "/api/reports/finance/export-csv", 1, 21,
+         request=lambda s: {"params": REPORT_RANGE}),
+    Case("export_finance_pdf", "GET", "/api/reports/finance/export-pdf", 1, 21,
+         request=lambda s: {"params": REPORT_RANGE}),
+    # Registry-wide by design: patients in the due window's birth-date range, in one query
+    Case("get_vaccinations_due", "GET", "/api/reports/vaccinations/due", 3, 129),
+    Case("get_sync_changes", "GET", "/api/sync/changes", 2, 52,
+         request=lambda s: {"params": {"limit": 50}}),
+    # Never ends on its own, so it can't be read to the end here; it makes no SQL
+    # on the request's connections either way (one LISTEN connection per worker)
+    Case("stream_sync_events", "GET", "/api/sync/events", 0, 0,
+         skip_reason=lambda: "long-lived event stream"),
+    # Registry-wide by design: one row per patient's latest visits, in one query
+    Case("get_growth_alerts", "GET", "/api/reports/growth-alerts", 1, 116),
+
+    # --- Jobs ---
+    Case("create_job", "POST", "/api/jobs", 3, 3, status=202,
+         request=lambda s: {"json": {"kind": "finance_csv", "params": REPORT_RANGE}}),
+    Case("list_jobs", "GET", "/api/jobs", 1, 3),
+    Case("get_job", "GET", "/api/jobs/{job_id}", 1, 1, path_args={"job_id": "finished_job_id"}),
+    Case("cancel_job", "POST", "/api/jobs/{job_id}/cancel", 2, 1, path_args={"job_id": "queued_job_id"}),
+    Case("download_job_result", "GET", "/api/jobs/{job_id}/result", 1, 1, path_args={"job_id": "finished_job_id"}),
+
+    # --- Admin & config ---
+    Case("verify_admin_pin", "POST", "/api/admin/verify-pin", 1, 1,
+         request=lambda s: {"json": {"pin": TEST_PIN}}),
+    Case("change_admin_pin", "PUT", "/api/admin/change-pin", 2, 1,
+         request=lambda s: {"json": {"current_pin": TEST_PIN, "new_pin": TEST_PIN}}),
+    Case("get_system_config", "GET", "/api/config/{key}", 1, 0, path_args={"key": "search_limit"}),
+    Case("update_system_config", "PUT", "/api/config/{key}", 3, 1, path_args={"key": "search_limit"},
+         request=lambda s: {"json": {"value": "25"}}),
+
+    # --- System ---
+    Case("get_bulkhead_stats", "GET", "/api/system/bulkheads", 0, 0),
+    Case("get_slow_queries", "GET", "/api/system/slow-queries", 1, 1,
+         request=lambda s: {"params": {"pin": TEST_PIN}}),
+    Case("clear_slow_queries", "DELETE", "/api/system/slow-queries", 1, 1,
+         request=lambda s: {"params": {"pin": TEST_PIN}}),
+    Case("audit_writer_stats", "GET", "/api/system/audit", 0, 0),
+    Case("storage_cleanup_stats", "GET", "/api/system/storage-cleanup", 1, 1),
+    Case("typeahead_stats", "GET", "/api/system/typeahead", 0, 0),
+    Case("get_event_stream_stats", "GET", "/api/system/events", 0, 0),
+    Case("download_database_backup", "GET", "/api/system/backup", 1, 1,
+         request=lambda s: {"params": {"pin": TEST_PIN}},
+         skip_reason=lambda: None if shutil.which("pg_dump") else "pg_dump is not installed"),
+]
+
+
+@pytest.mark.parametrize("case", CASES, ids=lambda c: c.name)
+def test_statement_budget(case, client, recorder, seed):
+    reason = case.skip_reason() if case.skip_reason else None
+    if reason:
+        pytest.skip(reason)
+
+    with recorder.measure() as log:
+        response = client.request(case.method, case.path(seed), **case.request(seed))
+
+    assert response.status_code == case.status, response.text
+    assert log.count <= case.max_statements and log.rows <= case.max_rows, (
+        f"{case.method} {case.route} ({case.name}) made {log.count} statements "
+        f"(budget {case.max_statements}) fetching {log.rows} rows (budget {case.max_rows}):\n{log.trace()}"
+    )
+
+
+def test_every_route_has_a_budget(app_modules):
+    declared = {
+        (method, route.path)
+        for route in app_modules.app.routes
+        if isinstance(route, APIRoute) and route.path.startswith("/api/")
+        for method in route.methods
+    }
+    covered = {(case.method, case.route) for case in CASES}
+    missing = sorted(declared - covered)
+    assert not missing, "Routes without a query budget in CASES: " + ", ".join(f"{m} {p}" for m, p in missing)
@@ -0,0 +1,24 @@
+"""
+The /uploads mount (storage.UploadFiles) on a fresh install, before anything
+has been uploaded. No database needed.
+"""
+import os
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+import storage
+
+
+def test_missing_upload_root_is_an_empty_folder(tmp_path, monkeypatch):
+    root = tmp_path / "uploads"
+    # Any old-layout lookup finds nothing either
+    monkeypatch.setattr(storage, "legacy_location", lambda path: None)
+    app = Starlette(routes=[
+        Mount("/uploads", storage.UploadFiles(directory=str(root), check_dir=False), name="uploads"),
+    ])
+
+    with TestClient(app) as client:
+        assert client.get("/uploads/ab/cd/abcd.jpg").status_code == 404
+    assert os.path.isdir(root)
@@ -0,0 +1,140 @@
+"""
+The in-memory typeahead index (typeahead.py), fed rows directly instead of
+reading them from Postgres. No database needed.
+"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+import typeahead
+
+
+def _row(name, display_id, phone=None, id=None):
+    return SimpleNamespace(
+        id=id or uuid.uuid4(), display_id=display_id, name=name, date_of_birth=None,
+        phone_number_primary=phone, phone_number_secondary=None,
+    )
+
+
+@pytest.fixture
+def build():
+    def _build(rows):
+        index = typeahead.TypeaheadIndex()
+        index.table = {row.id: row for row in rows}
+        index._load_rows = lambda patient_id=None: (
+            list(index.table.values()) if patient_id is None
+            else [index.table[patient_id]] if patient_id in index.table else []
+        )
+        index.rebuild()
+        return index
+    return _build
+
+
+def _names(entries):
+    return [e.name for e in entries]
+
+
+def test_every_token_must_match(build):
+    index = build([_row("Ali Ahmad", "P1"), _row("Ali Bakar", "P2"), _row("Siti Ahmad", "P3")])
+    assert _names(index.search("ali ahm")) == ["Ali Ahmad"]
+    assert sorted(_names(index.search("ahmad"))) == ["Ali Ahmad", "Siti Ahmad"]
+    assert index.search("ali zz") == []
+
+
+def test_exact_display_id_first(build):
+    index = build([_row("Aaron P10", "P100"), _row("Zed", "P10")])
+    assert _names(index.search("p10")) == ["Zed", "Aaron P10"]
+
+
+def test_phone_digits(build):
+    index = build([_row("Ali", "P1", phone="012-345 6789"), _row("Abu", "P2", phone="013-000 0000")])
+    assert _names(index.search("012-345")) == ["Ali"]
+
+
+def test_stops_at_the_limit(build):
+    index = build([_row(f"Amir {i:03}", f"P{i}") for i in range(300)])
+    assert len(index.search("amir", limit=5)) == 5
+    # Walks the rarer token and checks the common one per entry
+    assert _names(index.search("amir 042")) == ["Amir 042"]
+
+
+def test_short_prefix_scans_at_most_the_cap(build, monkeypatch):
+    index = build([_row(f"Amir {i:03}", f"P{i}") for i in range(50)] + [_row("Ali Zz", "Z1")])
+    monkeypatch.setattr(typeahead, "MAX_PREFIX_SCAN", 20)
+    # "a" and "zz" each have keys; "zz" is the rarer one and drives the scan
+    assert _names(index.search("a zz")) == ["Ali Zz"]
+    # A lone "a" stops after 20 keys rather than walking all of them
+    assert len(index.search("a", limit=50)) <= 20
+
+
+def test_changes_go_to_the_side_list_then_merge(build, monkeypatch):
+    monkeypatch.setattr(typeahead, "RECENT_MERGE_KEYS", 4)
+    first = _row("Bala", "P1")
+    index = build([first])
+
+    added = _row("Chong Wei", "P2")
+    index.table[added.id] = added
+    index.apply_change(added.id)
+    assert index.recent_keys == sorted(index.recent_keys) and index.recent_keys
+    assert _names(index.search("chong")) == ["Chong Wei"]
+
+    renamed = _row("Bala Krishnan", "P1", id=first.id)
+    index.table[first.id] = renamed
+    index.apply_change(first.id)
+    assert _names(index.search("bala")) == ["Bala Krishnan"]
+    assert index.search("krish")[0].id == first.id
+
+    # Past RECENT_MERGE_KEYS the side list is folded into the main arrays
+    more = _row("Devi Lakshmi Nair", "P3")
+    index.table[more.id] = more
+    index.apply_change(more.id)
+    assert index.recent_keys == []
+    assert index.keys == sorted(index.keys) and len(index.keys) == len(index.refs)
+    assert _names(index.search("chong")) == ["Chong Wei"]
+    assert _names(index.search("nair")) == ["Devi Lakshmi Nair"]
+
+    del index.table[added.id]
+    index.apply_change(added.id)
+    assert index.search("chong") == []
+
+
+def test_size_cap_rebuilds_and_recovers(build, monkeypatch):
+    monkeypatch.setattr(typeahead, "MAX_ENTRIES", 3)
+    rows = [_row(name, f"P{i}") for i, name in enumerate(("Ali", "Bala", "Chong"))]
+    index = build(rows)
+    late = _row("Devi", "P9")
+    index.table[late.id] = late
+    index.apply_change(late.id)
+    assert index.search("devi") is None and index.overflow
+
+    # Another change soon after doesn't rebuild again...
+    del index.table[rows[0].id]
+    index.apply_change(rows[0].id)
+    assert index.search("devi") is None
+
+    # ...one after OVERFLOW_RECHECK_SECONDS does, and the index is back
+    monkeypatch.setattr(typeahead, "OVERFLOW_RECHECK_SECONDS", 0)
+    index.apply_change(rows[0].id)
+    assert _names(index.search("devi")) == ["Devi"]
+    assert index.search("ali") == [] and not index.overflow
+
+
+def test_reaching_the_cap_rebuilds_from_the_table(build, monkeypatch):
+    monkeypatch.setattr(typeahead, "MAX_ENTRIES", 2)
+    first = _row("Ali", "P1")
+    index = build([first])
+    second = _row("Bala", "P2")
+    index.table[second.id] = second
+    index.apply_change(second.id)
+    assert index.recent_keys
+
+    # The index counts two patients, the table has fewer (a missed NOTIFY):
+    # at the cap it re-reads the table rather than giving up
+    del index.table[first.id]
+    third = _row("Chong", "P3")
+    index.table[third.id] = third
+    index.apply_change(third.id)
+    assert index.ready and not index.overflow and index.recent_keys == []
+    assert _names(index.search("chong")) == ["Chong"]
+    assert index.search("ali") == []
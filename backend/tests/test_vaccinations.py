@@ -0,0 +1,115 @@
+"""
+Vaccination schedule maths (vaccinations.py): dose states and the birth-date
+range the due list scans. Pure NumPy, no database needed.
+"""
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import vaccinations as v
+
+AS_OF = date(2026, 6, 15)
+
+
+def _dose(vaccine, dose, due_age_days, overdue_after_days=28, max_age_days=None):
+    return SimpleNamespace(
+        vaccine=vaccine, dose=dose, due_age_days=due_age_days,
+        overdue_after_days=overdue_after_days, max_age_days=max_age_days,
+    )
+
+
+SCHEDULE = [
+    _dose("BCG", 1, 0, overdue_after_days=30, max_age_days=365),
+    _dose("DTaP", 1, 60, max_age_days=7 * 365),
+    _dose("MMR", 1, 365, overdue_after_days=60, max_age_days=None),
+]
+
+
+def _status(dob, given=False, dose=SCHEDULE[1], as_of=AS_OF):
+    dobs = np.array([dob], dtype="datetime64[D]")
+    due, overdue, status = v.status_matrix(dobs, np.array([[given]]), [dose], as_of)
+    return v.STATUS_NAMES[status[0, 0]], due[0, 0].astype(date), overdue[0, 0].astype(date)
+
+
+# DTaP 1: due at 60 days, overdue 28 days after that, offered to 7 years
+@pytest.mark.parametrize("days_old,expected", [
+    (59, "upcoming"),
+    (60, "due"),           # on the due date
+    (88, "due"),           # on the last day of the grace period
+    (89, "overdue"),
+    (7 * 365, "overdue"),  # on the last day it's offered
+    (7 * 365 + 1, "missed"),
+])
+def test_status_boundaries(days_old, expected):
+    status, due, overdue = _status(AS_OF - timedelta(days=days_old))
+    assert status == expected
+    assert due == AS_OF - timedelta(days=days_old - 60)
+    assert overdue == due + timedelta(days=28)
+
+
+@pytest.mark.parametrize("days_old", [59, 60, 89, 7 * 365 + 1])
+def test_given_overrides_everything(days_old):
+    assert _status(AS_OF - timedelta(days=days_old), given=True)[0] == "given"
+
+
+def test_no_age_limit_is_never_missed():
+    assert _status(AS_OF - timedelta(days=100 * 365), dose=SCHEDULE[2])[0] == "overdue"
+
+
+def test_matrix_is_per_patient_and_dose():
+    dobs = np.array([AS_OF - timedelta(days=10), AS_OF - timedelta(days=400)], dtype="datetime64[D]")
+    given = np.array([[True, False, False], [False, False, False]])
+    _, _, status = v.status_matrix(dobs, given, SCHEDULE, AS_OF)
+    names = [[v.STATUS_NAMES[s] for s in row] for row in status]
+    assert names == [["given", "upcoming", "upcoming"], ["missed", "overdue", "due"]]
+
+
+def test_given_matrix_ignores_unknown_doses_and_patients():
+    patient_index = {"a": 0, "b": 1}
+    records = [
+        SimpleNamespace(patient_id="a", vaccine="MMR", dose=1),
+        SimpleNamespace(patient_id="b", vaccine="BCG", dose=1),
+        SimpleNamespace(patient_id="b", vaccine="MMR", dose=2),  # not in the schedule
+        SimpleNamespace(patient_id="c", vaccine="BCG", dose=1),  # not asked about
+    ]
+    given = v._given_matrix(patient_index, SCHEDULE, records)
+    assert given.tolist() == [[False, False, True], [True, False, False]]
+
+
+def _has_listable_dose(dob, schedule, as_of, due_from, due_to):
+    """Straight from the definition: some dose falls due in the window and is still offered."""
+    for dose in schedule:
+        due = dob + timedelta(days=dose.due_age_days)
+        offered = dose.max_age_days is None or as_of <= dob + timedelta(days=dose.max_age_days)
+        if due <= due_to and (due_from is None or due >= due_from) and offered:
+            return True
+    return False
+
+
+@pytest.mark.parametrize("schedule", [SCHEDULE, SCHEDULE[:2]], ids=["open-ended", "all-capped"])
+@pytest.mark.parametrize("due_from,due_to", [
+    (AS_OF, AS_OF + timedelta(days=30)),
+    (AS_OF - timedelta(days=90), AS_OF),
+    (None, AS_OF + timedelta(days=30)),
+])
+def test_dob_range_holds_every_listable_birth_date(schedule, due_from, due_to):
+    earliest, latest = v.dob_range(schedule, AS_OF, due_from, due_to)
+    dobs = [AS_OF - timedelta(days=d) for d in range(-400, 8 * 365)]
+    listable = [dob for dob in dobs if _has_listable_dose(dob, schedule, AS_OF, due_from, due_to)]
+
+    assert listable
+    assert all(dob <= latest and (earliest is None or dob >= earliest) for dob in listable)
+    # Tight at the young end: the earliest dose falls due on the window's last day
+    assert max(listable) == latest
+
+
+def test_dob_range_bounds():
+    due_from, due_to = AS_OF, AS_OF + timedelta(days=30)
+    # The youngest reaches BCG (0 days) by due_to; the oldest reaches MMR (365 days) from due_from
+    assert v.dob_range(SCHEDULE, AS_OF, due_from, due_to) == (due_from - timedelta(days=365), due_to)
+    # Everything capped: nobody older than the longest max age is still offered a dose
+    assert v.dob_range(SCHEDULE[:2], AS_OF, None, due_to) == (AS_OF - timedelta(days=7 * 365), due_to)
+    # An open-ended dose and no start: no lower bound
+    assert v.dob_range(SCHEDULE, AS_OF, None, due_to) == (None, due_to)
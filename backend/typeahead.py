@@ -0,0 +1,321 @@
+import os
+import re
+import sys
+import time
+import select as select_module
+import threading
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import islice
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+
+import models, database
+
+# Postgres channel fed by the patients trigger (see the typeahead migration)
+NOTIFY_CHANNEL = "patient_changes"
+
+# Hard cap on indexed patients; past this the endpoint falls back to SQL
+MAX_ENTRIES = int(os.getenv("TYPEAHEAD_MAX_ENTRIES", "200000"))
+MAX_NAME_TOKENS = 8
+
+# Compact (rebuild) once this share of entries has been deleted or replaced
+COMPACT_DEAD_RATIO = 0.2
+
+# Keys from NOTIFYs go to a small sorted side list, merged into the main arrays
+# once it grows past this (inserting into the main arrays is O(n) per key)
+RECENT_MERGE_KEYS = 1024
+
+# Most keys one query token may scan; a very short prefix ("a") stops here
+# rather than walking a large slice of the index
+MAX_PREFIX_SCAN = 5000
+
+RECONNECT_DELAY_SECONDS = 5
+
+# While over TYPEAHEAD_MAX_ENTRIES, a NOTIFY retries the build at most this often
+# (deletions may have brought the registry back under the cap)
+OVERFLOW_RECHECK_SECONDS = 300
+
+TOKEN_SPLIT = re.compile(r"[^\w]+")
+NON_DIGITS = re.compile(r"\D+")
+
+
+class PatientEntry:
+    __slots__ = ("id", "display_id", "name", "date_of_birth", "keys")
+
+    def __init__(self, id, display_id, name, date_of_birth, keys=()):
+        self.id = id
+        self.display_id = display_id
+        self.name = name
+        self.date_of_birth = date_of_birth
+        # Same string objects as in the index, so this costs one tuple
+        self.keys = tuple(keys)
+
+    def matches(self, token: str) -> bool:
+        return any(k.startswith(token) for k in self.keys)
+
+
+def entry_keys(row) -> List[str]:
+    """Searchable keys for one patient: name tokens, full name, display ID, phone digits."""
+    name = (row.name or "").lower().strip()
+    keys = [t for t in TOKEN_SPLIT.split(name) if t][:MAX_NAME_TOKENS]
+    if " " in name:
+        keys.append(" ".join(name.split()))
+    if row.display_id:
+        keys.append(row.display_id.lower())
+    for phone in (row.phone_number_primary, row.phone_number_secondary):
+        digits = NON_DIGITS.sub("", phone or "")
+        if len(digits) >= 3:
+            keys.append(digits)
+    return keys
+
+
+class TypeaheadIndex:
+    """
+    Per-worker prefix index over patient names, display IDs and phone numbers.
+    Two parallel arrays sorted by key: keys[i] -> entries[refs[i]]. A prefix
+    lookup is a bisect plus a forward scan that stops at the result limit.
+    Keys added since the last merge sit in recent_keys/recent_refs, also sorted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready = False
+        self.overflow = False
+        self.keys: List[str] = []
+        self.refs = array("I")
+        self.recent_keys: List[str] = []
+        self.recent_refs: List[int] = []
+        self.entries: List[Optional[PatientEntry]] = []
+        self.slot_by_id: Dict[UUID, int] = {}
+        self.dead = 0
+        self.built_at: Optional[float] = None
+        self.overflow_checked_at: Optional[float] = None
+
+    # --- Building ---
+
+    def _load_rows(self, patient_id=None):
+        query = select(
+            models.Patient.id, models.Patient.display_id, models.Patient.name, models.Patient.date_of_birth,
+            models.Patient.phone_number_primary, models.Patient.phone_number_secondary,
+        )
+        if patient_id is not None:
+            query = query.where(models.Patient.id == patient_id)
+        # Primary, not the replica: a NOTIFY may arrive before the replica has the row
+        with database.engine.connect() as conn:
+            return conn.execute(query).all()
+
+    def rebuild(self):
+        rows = self._load_rows()
+        if len(rows) > MAX_ENTRIES:
+            with self.lock:
+                self.overflow, self.ready = True, False
+                self.keys, self.refs, self.entries, self.slot_by_id = [], array("I"), [], {}
+                self.recent_keys, self.recent_refs = [], []
+                self.overflow_checked_at = time.time()
+            print(f"Warning: typeahead index disabled, {len(rows)} patients > TYPEAHEAD_MAX_ENTRIES")
+            return
+
+        entries, pairs, slot_by_id = [], [], {}
+        for row in rows:
+            slot = len(entries)
+            keys = entry_keys(row)
+            entries.append(PatientEntry(row.id, row.display_id, row.name, row.date_of_birth, keys))
+            slot_by_id[row.id] = slot
+            pairs.extend((key, slot) for key in keys)
+        pairs.sort()
+
+        with self.lock:
+            self.keys = [k for k, _ in pairs]
+            self.refs = array("I", (slot for _, slot in pairs))
+            self.recent_keys, self.recent_refs = [], []
+            self.entries = entries
+            self.slot_by_id = slot_by_id
+            self.dead = 0
+            self.overflow = False
+            self.ready = True
+            self.built_at = time.time()
+
+    # --- Incremental updates (from NOTIFY) ---
+
+    def apply_change(self, patient_id: UUID):
+        """
+        Re-reads one patient: insert, update or (if gone) delete. Reaching the
+        size cap rebuilds from the table instead, which merges the side list
+        and either comes back under the cap or disables the index.
+        """
+        with self.lock:
+            ready, overflow, checked_at = self.ready, self.overflow, self.overflow_checked_at
+        if not ready:
+            # Still building: the listener's rebuild picks this change up
+            if overflow and time.time() - (checked_at or 0) >= OVERFLOW_RECHECK_SECONDS:
+                self.rebuild()
+            return
+
+        rows = self._load_rows(patient_id)
+        with self.lock:
+            if not self.ready:
+                return
+            old_slot = self.slot_by_id.pop(patient_id, None)
+            if old_slot is not None:
+                # Leave its keys in place; lookups skip dead slots until compaction
+                self.entries[old_slot] = None
+                self.dead += 1
+            at_cap = bool(rows) and len(self.slot_by_id) >= MAX_ENTRIES
+            if rows and not at_cap:
+                row = rows[0]
+                slot = len(self.entries)
+                keys = entry_keys(row)
+                self.entries.append(PatientEntry(row.id, row.display_id, row.name, row.date_of_birth, keys))
+                self.slot_by_id[row.id] = slot
+                for key in keys:
+                    i = bisect_left(self.recent_keys, key)
+                    self.recent_keys.insert(i, key)
+                    self.recent_refs.insert(i, slot)
+                if len(self.recent_keys) > RECENT_MERGE_KEYS:
+                    self._merge_recent()
+            needs_rebuild = at_cap or self.dead > COMPACT_DEAD_RATIO * max(len(self.entries), 1)
+        if needs_rebuild:
+            self.rebuild()
+
+    def _merge_recent(self):
+        """Folds the side list into the main arrays in one linear pass (lock held)."""
+        pairs = list(merge(zip(self.keys, self.refs), zip(self.recent_keys, self.recent_refs)))
+        self.keys = [k for k, _ in pairs]
+        self.refs = array("I", (slot for _, slot in pairs))
+        self.recent_keys, self.recent_refs = [], []
+
+    # --- Lookup ---
+
+    def _prefix_scan(self, token: str):
+        """(key, slot) pairs whose key starts with token, in key order, across both lists."""
+        main_lo, main_hi = _prefix_range(self.keys, token)
+        recent_lo, recent_hi = _prefix_range(self.recent_keys, token)
+        pairs = merge(
+            ((self.keys[i], self.refs[i]) for i in range(main_lo, main_hi)),
+            zip(self.recent_keys[recent_lo:recent_hi], self.recent_refs[recent_lo:recent_hi]),
+        )
+        return (main_hi - main_lo) + (recent_hi - recent_lo), pairs
+
+    def search(self, query: str, limit: int = 10) -> Optional[List[PatientEntry]]:
+        """
+        Prefix match on every query token (AND). None when the index isn't usable.
+        Walks the token with the fewest keys and checks each entry against the
+        others, stopping at `limit` matches: results are the first matches in
+        key order (exact keys first), then ranked.
+        """
+        tokens = [t for t in TOKEN_SPLIT.split(query.lower().strip()) if t]
+        digits = NON_DIGITS.sub("", query)
+        if not tokens:
+            return []
+
+        with self.lock:
+            if not self.ready:
+                return None
+
+            # Phone-style input ("012-345") searches as one digit string
+            if digits and len(digits) >= 3 and not any(c.isalpha() for c in query):
+                tokens = [digits]
+
+            scans = sorted((self._prefix_scan(token) + (token,) for token in set(tokens)), key=lambda s: s[0])
+            _, pairs, _ = scans[0]
+            others = [token for *_, token in scans[1:]]
+
+            entries, seen = [], set()
+            for _, slot in islice(pairs, MAX_PREFIX_SCAN):
+                entry = self.entries[slot]
+                if entry is None or slot in seen:
+                    continue
+                seen.add(slot)
+                if all(entry.matches(token) for token in others):
+                    entries.append(entry)
+                    if len(entries) >= limit:
+                        break
+
+        q = query.lower().strip()
+        entries.sort(key=lambda e: (
+            e.display_id.lower() != q,           # exact ID first
+            not e.name.lower().startswith(q),    # then names starting with the query
+            e.name.lower(),
+        ))
+        return entries[:limit]
+
+    def stats(self) -> dict:
+        with self.lock:
+            approx_bytes = (
+                sys.getsizeof(self.keys) + sum(sys.getsizeof(k) for k in self.keys)
+                + self.refs.buffer_info()[1] * self.refs.itemsize
+                + sys.getsizeof(self.recent_keys) + sys.getsizeof(self.recent_refs)
+                + sys.getsizeof(self.entries)
+                + sum(sys.getsizeof(e) + sys.getsizeof(e.keys) for e in self.entries if e is not None)
+                + sys.getsizeof(self.slot_by_id)
+            )
+            return {
+                "ready": self.ready,
+                "overflow": self.overflow,
+                "patients": len(self.slot_by_id),
+                "keys": len(self.keys) + len(self.recent_keys),
+                "dead_slots": self.dead,
+                "approx_bytes": approx_bytes,
+                "max_entries": MAX_ENTRIES,
+                "built_at": self.built_at,
+            }
+
+
+def _prefix_range(keys: List[str], prefix: str):
+    """[lo, hi) of the keys starting with prefix."""
+    lo = bisect_left(keys, prefix)
+    return lo, bisect_left(keys, prefix + "\U0010ffff", lo)
+
+
+index = TypeaheadIndex()
+
+
+#####################################################
+# --- LISTEN/NOTIFY Listener ---
+#####################################################
+
+def listen_forever():
+    """
+    Background thread (one per worker): builds the index, then applies
+    NOTIFYs from the patients trigger. On any connection problem it
+    reconnects and rebuilds, since notifications sent meanwhile are lost.
+    """
+    while True:
+        conn = None
+        try:
+            conn = database.listen_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            index.rebuild()
+
+            while True:
+                if select_module.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                changed = set()
+                while conn.notifies:
+                    changed.add(conn.notifies.pop(0).payload)
+                for payload in changed:
+                    try:
+                        index.apply_change(UUID(payload))
+                    except ValueError:
+                        continue
+        except Exception as e:
+            print(f"Warning: typeahead listener error, rebuilding in {RECONNECT_DELAY_SECONDS}s: {e}")
+            time.sleep(RECONNECT_DELAY_SECONDS)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def start_listener():
+    thread = threading.Thread(target=listen_forever, name="typeahead-listener", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,191 @@
+from datetime import date, timedelta
+from typing import List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+# Dose states, as stored in the status matrix
+GIVEN, UPCOMING, DUE, OVERDUE, MISSED = range(5)
+STATUS_NAMES = ("given", "upcoming", "due", "overdue", "missed")
+# What the due list can be asked for (given and missed doses need no action)
+LISTABLE = ("upcoming", "due", "overdue")
+
+DEFAULT_WINDOW_DAYS = 30
+NO_AGE_LIMIT_DAYS = 200 * 365
+
+
+def load_schedule(db: Session) -> List[models.VaccinationScheduleDose]:
+    return (
+        db.query(models.VaccinationScheduleDose)
+        .order_by(models.VaccinationScheduleDose.due_age_days, models.VaccinationScheduleDose.vaccine,
+                  models.VaccinationScheduleDose.dose)
+        .all()
+    )
+
+#####################################################
+# --- Vectorised Schedule Evaluation ---
+#####################################################
+
+def status_matrix(dobs: np.ndarray, given: np.ndarray, schedule: Sequence, as_of: date):
+    """
+    Every patient against every scheduled dose at once.
+    dobs: (n,) datetime64[D]; given: (n, m) bool, True where the dose is recorded.
+    Returns (due_dates, overdue_dates, status), each (n, m).
+    """
+    due_age = np.array([d.due_age_days for d in schedule], dtype="timedelta64[D]")
+    grace = np.array([d.overdue_after_days for d in schedule], dtype="timedelta64[D]")
+    max_age = np.array(
+        [d.max_age_days if d.max_age_days is not None else NO_AGE_LIMIT_DAYS for d in schedule],
+        dtype="timedelta64[D]",
+    )
+    today = np.datetime64(as_of, "D")
+
+    due = dobs[:, None] + due_age[None, :]
+    overdue = due + grace[None, :]
+    past_max_age = today > dobs[:, None] + max_age[None, :]
+
+    status = np.full(due.shape, UPCOMING, dtype=np.int8)
+    status[today >= due] = DUE
+    status[today > overdue] = OVERDUE
+    status[past_max_age] = MISSED
+    status[given] = GIVEN
+    return due, overdue, status
+
+def _given_matrix(patient_index: dict, schedule: Sequence, records) -> np.ndarray:
+    """(n, m) bool from (patient_id, vaccine, dose) rows, set with one fancy-index assignment."""
+    column = {(d.vaccine, d.dose): j for j, d in enumerate(schedule)}
+    given = np.zeros((len(patient_index), len(schedule)), dtype=bool)
+    pairs = [
+        (patient_index[r.patient_id], column[(r.vaccine, r.dose)])
+        for r in records
+        if r.patient_id in patient_index and (r.vaccine, r.dose) in column
+    ]
+    if pairs:
+        rows, cols = np.array(pairs).T
+        given[rows, cols] = True
+    return given
+
+#####################################################
+# --- Registry Due List ---
+#####################################################
+
+def dob_range(schedule: Sequence, as_of: date, due_from: Optional[date], due_to: date):
+    """
+    Birth dates that can have a scheduled dose falling due in [due_from, due_to]
+    that is still offered on as_of. Turns the due window into a range scan on
+    ix_patients_date_of_birth instead of reading the whole registry.
+    """
+    latest = due_to - timedelta(days=min(d.due_age_days for d in schedule))
+    earliest = None
+    if due_from is not None:
+        earliest = due_from - timedelta(days=max(d.due_age_days for d in schedule))
+    if all(d.max_age_days is not None for d in schedule):
+        offered_from = as_of - timedelta(days=max(d.max_age_days for d in schedule))
+        earliest = max(earliest, offered_from) if earliest else offered_from
+    return earliest, latest
+
+def due_list(
+    db: Session,
+    as_of: date,
+    due_from: Optional[date],
+    due_to: date,
+    statuses: Sequence[str] = LISTABLE,
+    limit: int = 500,
+) -> dict:
+    """
+    Doses not yet given whose due date is in [due_from, due_to] (due_from None:
+    anything still outstanding), soonest first. Three queries (schedule,
+    patients in the birth-date range, their records) and one NumPy pass.
+    """
+    schedule = load_schedule(db)
+    result = {"as_of": as_of, "due_from": due_from, "due_to": due_to, "total": 0, "truncated": False, "doses": []}
+    if not schedule:
+        return result
+
+    earliest, latest = dob_range(schedule, as_of, due_from, due_to)
+    in_range = models.Patient.date_of_birth <= latest
+    if earliest is not None:
+        in_range = in_range & (models.Patient.date_of_birth >= earliest)
+
+    patients = db.execute(
+        select(
+            models.Patient.id, models.Patient.display_id, models.Patient.name,
+            models.Patient.date_of_birth, models.Patient.phone_number_primary,
+        ).where(in_range)
+    ).all()
+    if not patients:
+        return result
+    records = db.execute(
+        select(models.VaccinationRecord.patient_id, models.VaccinationRecord.vaccine, models.VaccinationRecord.dose)
+        .join(models.Patient, models.Patient.id == models.VaccinationRecord.patient_id)
+        .where(in_range)
+    ).all()
+
+    patient_index = {p.id: i for i, p in enumerate(patients)}
+    dobs = np.array([p.date_of_birth for p in patients], dtype="datetime64[D]")
+    given = _given_matrix(patient_index, schedule, records)
+    due, overdue, status = status_matrix(dobs, given, schedule, as_of)
+
+    wanted_codes = [STATUS_NAMES.index(s) for s in statuses]
+    selected = np.isin(status, wanted_codes) & (due <= np.datetime64(due_to, "D"))
+    if due_from is not None:
+        selected &= due >= np.datetime64(due_from, "D")
+
+    rows, cols = np.nonzero(selected)
+    order = np.lexsort((cols, rows, due[rows, cols]))  # by due date, then patient, then dose
+    result["total"] = len(order)
+    result["truncated"] = len(order) > limit
+    today = np.datetime64(as_of, "D")
+
+    for k in order[:limit]:
+        i, j = rows[k], cols[k]
+        patient, dose = patients[i], schedule[j]
+        days_overdue = int((today - overdue[i, j]).astype(int)) if status[i, j] == OVERDUE else 0
+        result["doses"].append({
+            "patient_id": patient.id,
+            "display_id": patient.display_id,
+            "name": patient.name,
+            "date_of_birth": patient.date_of_birth,
+            "phone_number_primary": patient.phone_number_primary,
+            "vaccine": dose.vaccine,
+            "dose": dose.dose,
+            "due_date": due[i, j].astype(date),
+            "overdue_date": overdue[i, j].astype(date),
+            "status": STATUS_NAMES[status[i, j]],
+            "days_overdue": days_overdue,
+        })
+    return result
+
+#####################################################
+# --- One Patient ---
+#####################################################
+
+def patient_card(db: Session, patient: models.Patient, as_of: date) -> dict:
+    """A patient's records, and every scheduled dose with its status."""
+    schedule = load_schedule(db)
+    records = (
+        db.query(models.VaccinationRecord)
+        .filter(models.VaccinationRecord.patient_id == patient.id)
+        .order_by(models.VaccinationRecord.date_given, models.VaccinationRecord.id)
+        .all()
+    )
+
+    doses = []
+    if schedule:
+        dobs = np.array([patient.date_of_birth], dtype="datetime64[D]")
+        given = _given_matrix({patient.id: 0}, schedule, records)
+        due, overdue, status = status_matrix(dobs, given, schedule, as_of)
+        given_on = {(r.vaccine, r.dose): r.date_given for r in records}
+        for j, dose in enumerate(schedule):
+            doses.append({
+                "vaccine": dose.vaccine,
+                "dose": dose.dose,
+                "due_date": due[0, j].astype(date),
+                "overdue_date": overdue[0, j].astype(date),
+                "status": STATUS_NAMES[status[0, j]],
+                "date_given": given_on.get((dose.vaccine, dose.dose)),
+            })
+    return {"patient_id": patient.id, "as_of": as_of, "records": records, "schedule": doses}
@@ -0,0 +1,15 @@
+import argparse
+import os
+
+import jobs
+
+# Job worker entry point (runs next to gunicorn, not inside it):
+#   python worker.py --concurrency 2
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs queued background jobs (reports, backups, cleanup).")
+    parser.add_argument(
+        "--concurrency", type=int, default=int(os.getenv("JOB_WORKER_CONCURRENCY", "1")),
+        help="jobs run at the same time by this process"
+    )
+    args = parser.parse_args()
+    jobs.run_worker(args.concurrency)
@@ -16,6 +16,10 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
   const [results, setResults] = useState([]);
   const [hasSearched, setHasSearched] = useState(false);
   const [searchLimit, setSearchLimit] = useState(25); // Default to 25 initially
+  // Paging: the server's cursor for the next page, and the total for the search
+  const [lastSearch, setLastSearch] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [total, setTotal] = useState(null);
   const [basicQuery, setBasicQuery] = useState("");
   const [advParams, setAdvParams] = useState({
     name: "",
@@ -68,9 +72,20 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
     };
   }, [menuRef]);
 
-  // Load Recent Patients on mount
+  // Load Recent Patients on mount, then refresh their details in one request
   useEffect(() => {
-    setRecentPatients(getRecentPatients());
+    const recents = getRecentPatients();
+    setRecentPatients(recents);
+    if (recents.length === 0) return;
+
+    axios
+      .post(
+        `${API_URL}/patients/batch`,
+        { ids: recents.map((p) => p.id) },
+        { params: { fields: "name,display_id,date_of_birth" } }
+      )
+      .then((res) => setRecentPatients(res.data)) // deleted patients drop out
+      .catch((err) => console.error("Error refreshing recent patients", err));
   }, []);
 
   const handleBasicSearch = async (e) => {
@@ -88,19 +103,34 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
     executeSearch(activeParams);
   };
 
-  const executeSearch = async (paramsObj) => {
+  const executeSearch = async (paramsObj, cursor = null) => {
     setLoading(true);
     setHasSearched(true);
     try {
       const queryParams = new URLSearchParams(paramsObj);
 
-      // Append the SEARCH_LIMIT param
-      queryParams.append("limit", searchLimit + 1);
+      // One page of SEARCH_LIMIT results; the total is counted with the first one
+      queryParams.append("limit", searchLimit);
+      if (cursor) {
+        queryParams.append("cursor", cursor);
+      } else {
+        queryParams.append("count", "exact");
+      }
 
       const res = await axios.get(
         `${API_URL}/patients/search/?${queryParams.toString()}`,
       );
-      setResults(res.data);
+      setResults((prev) => (cursor ? [...prev, ...res.data] : res.data));
+      setLastSearch(paramsObj);
+      setNextCursor(res.headers["x-next-cursor"] || null);
+      if (!cursor) {
+        const count = res.headers["x-total-count"];
+        setTotal(
+          count
+            ? { count: parseInt(count), kind: res.headers["x-total-count-kind"] }
+            : null,
+        );
+      }
     } catch (err) {
       console.error(err);
       alert("Search failed");
@@ -109,6 +139,8 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
     }
   };
 
+  const loadMore = () => executeSearch(lastSearch, nextCursor);
+
   const clearAll = () => {
     setBasicQuery("");
     setAdvParams({
@@ -124,6 +156,9 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
     });
     setResults([]);
     setHasSearched(false);
+    setLastSearch(null);
+    setNextCursor(null);
+    setTotal(null);
   };
 
   const getLastVisitDate = (visits) => {
@@ -138,8 +173,10 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
     return sortedVisits[0].date;
   };
 
-  const searchLimitReached = results.length > searchLimit;
-  const visibleSearchResults = results.slice(0, searchLimit);
+  // "(1000+)" when the count stopped at the server's cap
+  const totalLabel = total
+    ? `${total.count}${total.kind === "capped" ? "+" : ""}`
+    : `${results.length}${nextCursor ? "+" : ""}`;
 
   return (
     <div>
@@ -490,22 +527,13 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
         >
           <h3>
             Results{" "}
-            {hasSearched &&
-              (searchLimitReached
-                ? `(${searchLimit}+)`
-                : `(${results.length})`)}
+            {hasSearched && `(${totalLabel})`}
           </h3>
 
-          {/* WARNING MESSAGE if limit is hit */}
-          {searchLimitReached && (
-            <span
-              style={{
-                color: "#d9534f",
-                fontSize: "0.9rem",
-                fontWeight: "bold",
-              }}
-            >
-              ⚠️ More than {searchLimit} results found. Please be more specific.
+          {/* Shown while there are more pages */}
+          {nextCursor && (
+            <span style={{ color: "#666", fontSize: "0.9rem" }}>
+              Showing {results.length}. Narrow the search or load more.
             </span>
           )}
         </div>
@@ -517,7 +545,7 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
         )}
 
         <ul className="list">
-          {visibleSearchResults.map((p) => (
+          {results.map((p) => (
             <li key={p.id} className="list-item">
               <div>
                 <div style={{ fontWeight: "bold", paddingBottom: "5px" }}>
@@ -545,6 +573,18 @@ export default function Dashboard({ onNavigateCreate, onSelectPatient }) {
             </li>
           ))}
         </ul>
+
+        {nextCursor && (
+          <button
+            type="button"
+            onClick={loadMore}
+            className="btn-secondary"
+            disabled={loading}
+            style={{ width: "100%", marginTop: "10px" }}
+          >
+            {loading ? "Loading..." : `Load ${searchLimit} more`}
+          </button>
+        )}
       </div>
 
       {recentPatients.length > 0 && (
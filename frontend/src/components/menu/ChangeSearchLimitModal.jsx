@@ -43,7 +43,7 @@ export default function ChangeSearchLimitModal({
       <div className="modal-box" style={{ maxWidth: "300px" }}>
         <div className="modal-title">Search Results Limit</div>
         <p style={{ paddingBottom: "10px" }}>
-          Set the maximum number of patients to display per search.
+          Set the number of patients to display per page of search results.
         </p>
 
         <form onSubmit={handleSubmit}>
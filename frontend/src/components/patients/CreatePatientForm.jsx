@@ -10,6 +10,7 @@ export default function CreatePatientForm({ onSuccess, onCancel }) {
     date_registered: new Date().toISOString().split("T")[0],
     name: "",
     date_of_birth: "",
+    sex: "",
     address: "",
     phone_number_primary: "",
     phone_number_secondary: "",
@@ -65,6 +66,7 @@ export default function CreatePatientForm({ onSuccess, onCancel }) {
       const payload = {
         ...formData,
         phone_number_secondary: formData.phone_number_secondary || null,
+        sex: formData.sex || null,
         birth_weight_kg: formData.birth_weight_kg
           ? parseFloat(formData.birth_weight_kg)
           : null,
@@ -79,7 +81,18 @@ export default function CreatePatientForm({ onSuccess, onCancel }) {
       };
 
       // Capture the response
-      const res = await axios.post(`${API_URL}/patients/`, payload);
+      let res;
+      try {
+        res = await axios.post(`${API_URL}/patients/`, payload);
+      } catch (err) {
+        // 409: looks like an existing patient. Let the user decide.
+        if (err.response?.status !== 409) throw err;
+        const list = err.response.data.detail.candidates
+          .map((c) => `• ${c.display_id} ${c.name} (${c.date_of_birth}) - ${c.reasons.join(", ")}`)
+          .join("\n");
+        if (!window.confirm(`Possible existing patient:\n${list}\n\nRegister as a new patient anyway?`)) return;
+        res = await axios.post(`${API_URL}/patients/`, payload, { params: { allow_duplicate: true } });
+      }
       // alert("Patient Record Created Successfully");
 
       // Pass the created patient object (res.data) to onSuccess
@@ -204,6 +217,14 @@ export default function CreatePatientForm({ onSuccess, onCancel }) {
               required
             />
           </div>
+          <div style={{ marginTop: "15px" }}>
+            <label>Sex</label>
+            <select name="sex" onChange={handleChange} value={formData.sex}>
+              <option value="">Select...</option>
+              <option value="M">Male</option>
+              <option value="F">Female</option>
+            </select>
+          </div>
           <div className="form-grid" style={{ marginTop: "15px" }}>
             <div>
               <label>Phone Number 1</label>
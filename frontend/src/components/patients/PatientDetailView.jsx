@@ -25,6 +25,28 @@ export default function PatientDetailView({
     fetchPatient();
   }, [patientId]);
 
+  // Live updates: refetch when another terminal changes this patient, their
+  // visits or attachments. Paused while editing so the form isn't overwritten.
+  useEffect(() => {
+    if (isEditing) return;
+    const events = new EventSource(
+      `${API_URL}/sync/events?patient_id=${encodeURIComponent(patientId)}`,
+    );
+    events.onmessage = (e) => {
+      const change = JSON.parse(e.data);
+      if (change.entity === "patient" && change.action === "delete") return;
+      fetchPatient();
+    };
+    events.addEventListener("resync", () => fetchPatient());
+    // After a reconnect, changes made in between were missed
+    let opened = false;
+    events.onopen = () => {
+      if (opened) fetchPatient();
+      opened = true;
+    };
+    return () => events.close();
+  }, [patientId, isEditing]);
+
   const fetchPatient = async () => {
     try {
       const res = await axios.get(`${API_URL}/patients/${patientId}`);
@@ -96,6 +118,7 @@ export default function PatientDetailView({
     try {
       const payload = {
         ...editFormData,
+        sex: editFormData.sex || null,
         birth_weight_kg: editFormData.birth_weight_kg
           ? parseFloat(editFormData.birth_weight_kg)
           : null,
@@ -219,6 +242,7 @@ export default function PatientDetailView({
             <span className="badge">ID: {patient.display_id}</span>
             <span className="badge">Reg: {patient.date_registered}</span>
             <span className="badge">DOB: {patient.date_of_birth}</span>
+            {patient.sex && <span className="badge">Sex: {patient.sex}</span>}
             <span
               className="badge"
               style={{ background: "#e3f2fd", color: "#0d47a1" }}
@@ -449,6 +473,17 @@ export default function PatientDetailView({
                 value={editFormData.date_of_birth}
                 onChange={handleEditChange}
               />
+              <label className="edit-label">Sex</label>
+              <select
+                className="edit-input"
+                name="sex"
+                value={editFormData.sex || ""}
+                onChange={handleEditChange}
+              >
+                <option value="">Select...</option>
+                <option value="M">Male</option>
+                <option value="F">Female</option>
+              </select>
               <label className="edit-label">Address</label>
               <textarea
                 className="edit-input"
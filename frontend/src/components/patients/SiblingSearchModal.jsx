@@ -15,8 +15,10 @@ export default function SiblingSearchModal({ isOpen, onClose, onSelect }) {
     
     setLoading(true);
     try {
-      // Use existing search endpoint
-      const res = await axios.get(`${API_URL}/patients/search/?query=${query}&limit=5`);
+      // In-memory typeahead index (name, ID or phone)
+      const res = await axios.get(`${API_URL}/patients/typeahead`, {
+        params: { q: query, limit: 5 },
+      });
       setResults(res.data);
     } catch (err) {
       console.error(err);
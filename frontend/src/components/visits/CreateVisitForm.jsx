@@ -5,6 +5,12 @@ import { API_URL } from "../../api/config";
 import { calculateVisitAge } from "../../utils/helpers";
 import InputSuggestion from "../common/InputSuggestion";
 import { FOLLOW_UP_OPTIONS } from "../../utils/constants";
+import {
+  useDispensationCheck,
+  DispensationAlerts,
+  alertSummary,
+  confirmAllergyOverride,
+} from "./DispensationAlerts";
 
 export default function CreateVisitForm({ patientId, patientDOB, onSuccess }) {
   const now = new Date();
@@ -101,6 +107,14 @@ export default function CreateVisitForm({ patientId, patientDOB, onSuccess }) {
   // Track which index is being edited (-1 means no edit)
   const [editIndex, setEditIndex] = useState(-1);
 
+  // Lines as they would be saved, with the one being typed in its place
+  const typedIndex = editIndex >= 0 ? editIndex : dispensations.length;
+  const checkedNames = dispensations.map((d) => d.name);
+  if (editIndex >= 0 || medInput.name.trim()) {
+    checkedNames[typedIndex] = medInput.name;
+  }
+  const checkFor = useDispensationCheck(patientId, formData.date, checkedNames);
+
   // Save (Add or Update) Medicine
   const handleSaveMedicine = () => {
     if (!medInput.name || !medInput.quantity) {
@@ -180,7 +194,17 @@ export default function CreateVisitForm({ patientId, patientDOB, onSuccess }) {
       };
 
       // 2. Step 1: Create the Visit Record
-      const response = await axios.post(`${API_URL}/visits/`, payload);
+      let response;
+      try {
+        response = await axios.post(`${API_URL}/visits/`, payload);
+      } catch (err) {
+        // 409: a medicine matches a recorded allergy
+        if (err.response?.status !== 409) throw err;
+        if (!confirmAllergyOverride(err.response.data.detail)) return;
+        response = await axios.post(`${API_URL}/visits/`, payload, {
+          params: { allow_allergy_conflict: true },
+        });
+      }
 
       // CRITICAL: Ensure your Backend POST returns the new ID (e.g. { visit_id: 123, ... })
       const newVisitId = response.data.visit_id;
@@ -326,7 +350,10 @@ export default function CreateVisitForm({ patientId, patientDOB, onSuccess }) {
                     editIndex === idx ? { backgroundColor: "#ebf7ff" } : {}
                   }
                 >
-                  <td>{med.name}</td>
+                  <td title={alertSummary(checkFor(med.name, idx))}>
+                    {checkFor(med.name, idx)?.alerts.length ? "⚠ " : ""}
+                    {med.name}
+                  </td>
                   <td>{med.instructions}</td>
                   <td>{med.quantity}</td>
                   <td>{med.notes}</td>
@@ -418,6 +445,7 @@ export default function CreateVisitForm({ patientId, patientDOB, onSuccess }) {
             </button>
           )}
         </div>
+        <DispensationAlerts line={checkFor(medInput.name, typedIndex)} />
       </div>
 
       {/* Medical Certificate (MC) Section */}
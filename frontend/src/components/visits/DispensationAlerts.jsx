@@ -0,0 +1,75 @@
+import { useState, useEffect } from "react";
+import axios from "axios";
+import { API_URL } from "../../api/config";
+
+// Wait this long after the last keystroke before checking
+const CHECK_DELAY_MS = 250;
+
+// Allergy / repeat dispensing check for a visit's medicine lines, re-run as
+// they are typed. Returns one result per line, in the same order.
+export function useDispensationCheck(patientId, date, medicines, visitId = null) {
+  const [lines, setLines] = useState([]);
+  const key = JSON.stringify(medicines);
+
+  useEffect(() => {
+    const names = JSON.parse(key);
+    if (!patientId || names.length === 0) {
+      setLines([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const res = await axios.post(`${API_URL}/dispensations/check`, {
+          patient_id: patientId,
+          date: date || null,
+          visit_id: visitId,
+          medicines: names,
+        });
+        if (!cancelled) setLines(res.data.lines);
+      } catch (err) {
+        console.error("Dispensation check failed", err);
+      }
+    }, CHECK_DELAY_MS);
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [patientId, date, visitId, key]);
+
+  // Only results for what is on screen now (not a previous keystroke's)
+  return (name, index) =>
+    lines[index]?.medicine_name === name ? lines[index] : null;
+}
+
+export function DispensationAlerts({ line }) {
+  if (!line?.alerts?.length) return null;
+  return (
+    <ul style={{ margin: "4px 0 0", paddingLeft: "18px", fontSize: "0.85rem" }}>
+      {line.alerts.map((alert, i) => (
+        <li
+          key={i}
+          style={{
+            color: alert.blocking ? "#c0392b" : "#b9770e",
+            fontWeight: alert.blocking ? "bold" : "normal",
+          }}
+        >
+          ⚠ {alert.message}
+        </li>
+      ))}
+    </ul>
+  );
+}
+
+// Title for a saved line's warning marker
+export const alertSummary = (line) =>
+  (line?.alerts || []).map((a) => a.message).join("\n");
+
+// Detail of a 409 from saving a visit: let the doctor decide
+export function confirmAllergyOverride(detail) {
+  const list = detail.alerts
+    .map((a) => `• ${a.medicine_name}: ${a.message}`)
+    .join("\n");
+  return window.confirm(`Possible allergy conflict:\n${list}\n\nSave anyway?`);
+}
@@ -6,6 +6,12 @@ import ConfirmButton from "../common/ConfirmButton";
 import { calculateVisitAge } from "../../utils/helpers";
 import InputSuggestion from "../common/InputSuggestion";
 import { FOLLOW_UP_OPTIONS } from "../../utils/constants";
+import {
+  useDispensationCheck,
+  DispensationAlerts,
+  alertSummary,
+  confirmAllergyOverride,
+} from "./DispensationAlerts";
 
 export default function VisitItem({ visit, patientId, patientDOB, onUpdate }) {
   const [isExpanded, setIsExpanded] = useState(false);
@@ -24,6 +30,20 @@ export default function VisitItem({ visit, patientId, patientDOB, onUpdate }) {
 
   const [medEditIndex, setMedEditIndex] = useState(-1);
 
+  // Checked only while editing; the visit's own items don't count as recent
+  const editLines = editData.dispensations || [];
+  const typedIndex = medEditIndex >= 0 ? medEditIndex : editLines.length;
+  const checkedNames = editLines.map((d) => d.medicine_name);
+  if (medEditIndex >= 0 || medInput.medicine_name.trim()) {
+    checkedNames[typedIndex] = medInput.medicine_name;
+  }
+  const checkFor = useDispensationCheck(
+    isEditing ? patientId : null,
+    editData.date,
+    checkedNames,
+    visit.visit_id,
+  );
+
   // Sync state when prop updates
   useEffect(() => {
     setEditData(visit);
@@ -155,7 +175,16 @@ export default function VisitItem({ visit, patientId, patientDOB, onUpdate }) {
         })),
       };
 
-      await axios.put(`${API_URL}/visits/${visit.visit_id}`, payload);
+      try {
+        await axios.put(`${API_URL}/visits/${visit.visit_id}`, payload);
+      } catch (err) {
+        // 409: an added medicine matches a recorded allergy
+        if (err.response?.status !== 409) throw err;
+        if (!confirmAllergyOverride(err.response.data.detail)) return;
+        await axios.put(`${API_URL}/visits/${visit.visit_id}`, payload, {
+          params: { allow_allergy_conflict: true },
+        });
+      }
 
       if (newFile) {
         const formData = new FormData();
@@ -442,6 +471,26 @@ export default function VisitItem({ visit, patientId, patientDOB, onUpdate }) {
                   Delete Record
                 </ConfirmButton>
 
+                <button
+                  className="btn-secondary"
+                  onClick={() =>
+                    window.open(`${API_URL}/visits/${visit.visit_id}/receipt.pdf`)
+                  }
+                >
+                  Print Receipt
+                </button>
+
+                {visit.mc_days > 0 && (
+                  <button
+                    className="btn-secondary"
+                    onClick={() =>
+                      window.open(`${API_URL}/visits/${visit.visit_id}/mc.pdf`)
+                    }
+                  >
+                    Print MC
+                  </button>
+                )}
+
                 <button
                   className="btn-secondary"
                   onClick={() => setIsEditing(true)}
@@ -601,7 +650,8 @@ export default function VisitItem({ visit, patientId, patientDOB, onUpdate }) {
                           : {}
                       }
                     >
-                      <span>
+                      <span title={alertSummary(checkFor(med.medicine_name, idx))}>
+                        {checkFor(med.medicine_name, idx)?.alerts.length ? "⚠ " : ""}
                         {med.medicine_name} {med.instructions} ({med.quantity})
                         {med.notes ? ` - ${med.notes}` : ""}
                       </span>
@@ -691,6 +741,9 @@ export default function VisitItem({ visit, patientId, patientDOB, onUpdate }) {
                     </button>
                   )}
                 </div>
+                <DispensationAlerts
+                  line={checkFor(medInput.medicine_name, typedIndex)}
+                />
               </div>
 
               {/* MC Section */}